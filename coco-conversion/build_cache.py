@@ -0,0 +1,171 @@
+"""
+Incremental build cache for run_all.py.
+
+A converter's inputs are fingerprinted from:
+  - the size and mtime of every file under DATA_ROOT/<dataset> (annotation files plus the
+    listing of the image folders), optionally with the contents of the non-image files hashed;
+    the files come from the dataset's directory index (see dir_index.py), so unchanged
+    directories aren't listed again, and are stat'ed on its threads
+  - the source of the converter module and every local module it imports
+  - conversion_config.CATEGORIES
+
+A converter whose fingerprint matches the one recorded after its last successful run is
+skipped, and its existing OUTPUT_DIR/<dataset>.json is reused.  Fingerprinting only stats
+files (plus reads annotation files when content hashing is on), so it costs a small
+fraction of a conversion.
+
+The cache is stored in CACHE_DIR/build_cache.json.
+"""
+
+import ast
+import hashlib
+import json
+import os
+
+from conversion_config import CATEGORIES, DATA_ROOT, CACHE_DIR
+from dir_index import dataset_index
+from io_order import physical_order
+
+CACHE_FILE = os.path.join(CACHE_DIR, 'build_cache.json')
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff')
+
+# Key used for the merge step's entry in the cache
+MERGE_KEY = '__merge__'
+
+
+def _hash_file(path, h):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+
+
+def _update_with_tree(h, index, hash_contents):
+    """Feed (relative path, size, mtime) of every file in a directory index into h, in sorted order."""
+    files = index.relpaths()
+    signatures = index.signatures(files)
+
+    # Contents are hashed file by file in physical order (see io_order.py), and the
+    # per-file digests fed in in sorted order with the rest
+    digests = {}
+    if hash_contents:
+        to_hash = [i for i, rel in enumerate(files)
+                   if signatures[i] is not None and not rel.lower().endswith(IMAGE_EXTENSIONS)]
+        paths = [os.path.join(index.root, files[i]) for i in to_hash]
+        for j in physical_order(paths):
+            file_hash = hashlib.sha256()
+            _hash_file(paths[j], file_hash)
+            digests[to_hash[j]] = file_hash.digest()
+
+    for i, (rel, signature) in enumerate(zip(files, signatures)):
+        if signature is None:
+            # Removed since the index was built; the converter won't see it either
+            continue
+        h.update(f'{rel}\0{signature[0]}\0{signature[1]}\n'.encode('utf-8'))
+        if i in digests:
+            h.update(digests[i])
+
+
+def local_source_files(module_name):
+    """The source file of a local module plus those of the local modules it imports, recursively."""
+    files = []
+    seen = set()
+    pending = [module_name]
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        path = os.path.join(SCRIPT_DIR, f'{name}.py')
+        if not os.path.isfile(path):
+            # Standard library or third-party
+            continue
+        files.append(path)
+        with open(path, 'r') as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                pending.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                pending.append(node.module)
+    return sorted(files)
+
+
+def _update_with_sources(h, module_name):
+    for path in local_source_files(module_name):
+        h.update(os.path.basename(path).encode('utf-8') + b'\0')
+        _hash_file(path, h)
+    h.update(json.dumps(CATEGORIES, sort_keys=True).encode('utf-8'))
+
+
+def fingerprint_converter(dataset_name, module_name, hash_contents=False):
+    """
+    Fingerprint everything a converter's output depends on.
+
+    Args:
+        dataset_name: shortcode / folder name under DATA_ROOT
+        module_name: name of the module containing the converter
+        hash_contents: also hash the contents of non-image files (annotations, classes.txt, ...)
+            instead of relying on their size and mtime alone
+    """
+    root = os.path.join(DATA_ROOT, dataset_name)
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f'No source directory {root}')
+    h = hashlib.sha256()
+    h.update(f'{dataset_name}\0{int(hash_contents)}\n'.encode('utf-8'))
+    _update_with_sources(h, module_name)
+    _update_with_tree(h, dataset_index(dataset_name), hash_contents)
+    return h.hexdigest()
+
+
+def fingerprint_merge(dataset_files):
+    """Fingerprint the merge step from the per-dataset files it reads and the merge code."""
+    h = hashlib.sha256()
+    _update_with_sources(h, 'merge_datasets')
+    for path in sorted(dataset_files):
+        st = os.stat(path)
+        h.update(f'{os.path.basename(path)}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def output_signature(path):
+    """Cheap signature of an output file, used to notice outputs that were changed or deleted."""
+    if not os.path.isfile(path):
+        return None
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def load_cache():
+    if not os.path.isfile(CACHE_FILE):
+        return {}
+    try:
+        with open(CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f'WARNING: ignoring unreadable build cache {CACHE_FILE}')
+        return {}
+
+
+def save_cache(cache):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_file = CACHE_FILE + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp_file, CACHE_FILE)
+
+
+def is_up_to_date(entry, fingerprint, output_file):
+    """Whether a cache entry matches this fingerprint and its output file is still the one it wrote."""
+    if entry is None or entry['fingerprint'] != fingerprint:
+        return False
+    return output_signature(output_file) == entry['output_signature']
+
+
+def record(cache, key, fingerprint, output_file, **summary):
+    cache[key] = {
+        'fingerprint': fingerprint,
+        'output_signature': output_signature(output_file),
+        **summary,
+    }
@@ -0,0 +1,70 @@
+"""
+Checkpoints for resuming interrupted rebuilds.
+
+run_all.py writes a completion marker for each converter as soon as it finishes, holding
+the SHA-256 of the converter's output file.  With --resume, datasets whose marker matches
+their current output file are skipped, so a rebuild that died partway (e.g. when the
+source drive dropped out) picks up at the first incomplete dataset.
+
+(Image dimensions probed before a crash aren't lost either: they're committed to the
+image metadata store as probing goes, see image_metadata.py.)
+
+Markers live in CACHE_DIR/checkpoints.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+
+from conversion_config import CACHE_DIR
+
+CHECKPOINT_DIR = os.path.join(CACHE_DIR, 'checkpoints')
+
+
+def _marker_path(dataset_name):
+    return os.path.join(CHECKPOINT_DIR, f'{dataset_name}.done.json')
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def mark_complete(dataset_name, output_file, **summary):
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    marker = {
+        'output_file': output_file,
+        'sha256': file_sha256(output_file),
+        'completed': datetime.datetime.now().isoformat(timespec='seconds'),
+        **summary,
+    }
+    tmp_path = _marker_path(dataset_name) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(marker, f, indent=1)
+    os.replace(tmp_path, _marker_path(dataset_name))
+
+
+def load_marker(dataset_name):
+    """The completion marker for a dataset if its output file is still the one it describes, else None."""
+    path = _marker_path(dataset_name)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as f:
+        marker = json.load(f)
+    if not os.path.isfile(marker['output_file']):
+        return None
+    if file_sha256(marker['output_file']) != marker['sha256']:
+        return None
+    return marker
+
+
+def clear(dataset_names):
+    """Remove completion markers, at the start of a fresh (non-resumed) rebuild."""
+    for dataset_name in dataset_names:
+        if os.path.isfile(_marker_path(dataset_name)):
+            os.remove(_marker_path(dataset_name))
+
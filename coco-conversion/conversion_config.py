@@ -7,6 +7,47 @@ import os
 DATA_ROOT = r'I:\data\drone-data'
 OUTPUT_DIR = os.path.join(DATA_ROOT, 'output')
 
+# Bookkeeping for run_all.py (build cache etc.), kept out of the way of the per-dataset JSON files
+CACHE_DIR = os.path.join(OUTPUT_DIR, 'cache')
+
+# Directory of the SQLite caches (image_metadata.py, label_cache.py).  SQLite's locking
+# isn't reliable on network file systems, so distributed runs (--distributed, --worker),
+# whose machines share CACHE_DIR, set this to LOCAL_CACHE_DIR/<host name> on each machine
+# before anything opens a database
+DB_DIR = CACHE_DIR
+LOCAL_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'coco-conversion')
+
+# Number each dataset's images and annotations within a fixed block of IDs (see id_blocks.py),
+# so the merge doesn't need to renumber them and IDs are stable across rebuilds
+GLOBAL_IDS = False
+
+# What converters do with image dimensions taken from the source annotations (see
+# source_dimensions.py): 'trust' them, 'probe' every image instead, or 'verify' a random
+# sample of DIMENSION_SAMPLE_SIZE images, failing if more than MAX_DIMENSION_MISMATCH_RATE
+# of the sample is wrong.  'trust' is what converters did before there was a choice
+DEFAULT_DIMENSION_POLICY = 'trust'
+DIMENSION_POLICY = {
+    # dataset -> policy, overriding the default
+}
+DIMENSION_SAMPLE_SIZE = 50
+MAX_DIMENSION_MISMATCH_RATE = 0.02
+
+# Order to read batches of files in (see io_order.py): 'none' (as listed), or 'inode' or
+# 'extent' (Linux) for physical order, which cuts seeking on spinning disks
+IO_ORDER = 'none'
+
+# Threads probing image dimensions, i.e. header reads in flight at once (see
+# image_metadata.py).  Probes are latency-bound, so on a high-latency network share (the
+# I: drive over VPN) more threads overlap more round trips: try 32-64 there.  On a
+# spinning disk, more threads mean more seeking
+PROBE_THREADS = 8
+
+# Fast local scratch directory (e.g. on an NVMe drive) to keep copies of annotation files,
+# and of images rendered by visualize_samples.py, so repeat runs don't read them from
+# DATA_ROOT again (see staging.py); None to read everything from DATA_ROOT
+STAGING_DIR = None
+STAGING_BUDGET_GB = 50
+
 CATEGORIES = [
     {'id': 1, 'name': 'bird'},
     {'id': 2, 'name': 'mammal'},
@@ -10,11 +10,14 @@ Annotation type: points
 import json
 import os
 import pandas as pd
-from PIL import Image
 from tqdm import tqdm
-from collections import defaultdict
 
-from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
+import id_blocks
+import tracing
+from csv_annotations import AnnotationTable
+from image_metadata import get_image_sizes
+from staging import staged
+from conversion_config import CATEGORIES, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'aerial-elephants'
 dataset_dir = os.path.join(DATA_ROOT, DATASET)
@@ -36,36 +39,32 @@ def convert():
     total_disk_images = 0
     for split, folder in IMAGE_FOLDERS.items():
         folder_path = os.path.join(dataset_dir, folder)
-        for fn in os.listdir(folder_path):
-            if fn.lower().endswith(('.jpg', '.jpeg', '.png')):
-                stem = os.path.splitext(fn)[0]
-                image_stem_to_info[stem] = {
-                    'split': split,
-                    'rel_path': f'{DATASET}/{folder}/{fn}',
-                    'full_path': os.path.join(folder_path, fn),
-                }
-                total_disk_images += 1
+        with tracing.span('scan', folder_path):
+            for fn in os.listdir(folder_path):
+                if fn.lower().endswith(('.jpg', '.jpeg', '.png')):
+                    stem = os.path.splitext(fn)[0]
+                    image_stem_to_info[stem] = {
+                        'split': split,
+                        'rel_path': f'{DATASET}/{folder}/{fn}',
+                        'full_path': os.path.join(folder_path, fn),
+                    }
+                    total_disk_images += 1
 
     print(f'Found {total_disk_images} images on disk')
 
     # Read annotation files
-    all_annotations = defaultdict(list)
-    image_stem_to_split = {}
-    total_anns = 0
+    frames = []
+    for ann_file in ANNOTATION_FILES:
+        with tracing.span('parse', ann_file):
+            frames.append(pd.read_csv(staged(os.path.join(dataset_dir, ann_file)), header=None,
+                                      names=['image_id', 'x', 'y']))
+    table = AnnotationTable(pd.concat(frames, ignore_index=True), 'image_id', 'point', ['x', 'y'],
+                            category='mammal', original_category='elephant')
 
-    for ann_file, split in ANNOTATION_FILES.items():
-        df = pd.read_csv(os.path.join(dataset_dir, ann_file), header=None,
-                         names=['image_id', 'x', 'y'])
-        for _, row in df.iterrows():
-            stem = row['image_id']
-            all_annotations[stem].append({'x': row['x'], 'y': row['y']})
-            image_stem_to_split[stem] = split
-            total_anns += 1
-
-    print(f'Read {total_anns} annotations for {len(all_annotations)} images')
+    print(f'Read {len(table)} annotations for {len(table.keys())} images')
 
     # Check coverage
-    annotated_stems = set(all_annotations.keys())
+    annotated_stems = set(table.keys())
     disk_stems = set(image_stem_to_info.keys())
     missing_on_disk = annotated_stems - disk_stems
     missing_in_annotations = disk_stems - annotated_stems
@@ -76,20 +75,15 @@ def convert():
         print(f'NOTE: {len(missing_in_annotations)} images on disk have no annotations')
 
     images = []
-    annotations = []
-    image_id = 0
-    ann_id = 0
+    image_id, ann_id = id_blocks.first_ids(DATASET)
 
-    for stem in tqdm(sorted(all_annotations.keys()), desc='Processing images'):
-        if stem not in image_stem_to_info:
-            continue
+    stems = [stem for stem in table.keys() if stem in image_stem_to_info]
+    sizes = get_image_sizes([image_stem_to_info[stem]['full_path'] for stem in stems],
+                            desc='Probing images')
 
+    image_ids = {}
+    for stem, (w, h) in tqdm(zip(stems, sizes), total=len(stems), desc='Processing images'):
         info = image_stem_to_info[stem]
-        full_path = info['full_path']
-
-        im = Image.open(full_path)
-        w, h = im.size
-        im.close()
 
         image_id += 1
         img_entry = {
@@ -100,27 +94,19 @@ def convert():
             'original_split': info['split'],
         }
         images.append(img_entry)
+        image_ids[stem] = image_id
 
-        for ann_data in all_annotations[stem]:
-            cat_id = get_category_id('mammal')
-            ann_id += 1
-            ann_entry = {
-                'id': ann_id,
-                'image_id': image_id,
-                'category_id': cat_id,
-                'point': [float(ann_data['x']), float(ann_data['y'])],
-                'original_category': 'elephant',
-            }
-            annotations.append(ann_entry)
+    annotations, ann_id = table.to_coco(image_ids, ann_id)
 
     coco = {
         'images': images,
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images, {len(annotations)} annotations to {output_path}')
@@ -11,6 +11,11 @@ import os
 from tqdm import tqdm
 from collections import defaultdict
 
+import id_blocks
+import tracing
+from dir_index import dataset_index
+from source_dimensions import check_source_dimensions
+from staging import staged
 from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'delplanque-mammals'
@@ -36,14 +41,16 @@ ORIGINAL_CAT_TO_CATEGORY = {
 def convert():
     images = []
     annotations = []
-    image_id = 0
-    ann_id = 0
+    image_id, ann_id = id_blocks.first_ids(DATASET)
+
+    with tracing.span('scan'):
+        index = dataset_index(DATASET)
 
     for split, ann_rel_path in ANNOTATION_FILES.items():
         ann_file = os.path.join(dataset_dir, ann_rel_path)
         image_folder = os.path.join(dataset_dir, split)
 
-        with open(ann_file, 'r') as f:
+        with tracing.span('parse', os.path.basename(ann_file)), open(staged(ann_file), 'r') as f:
             data = json.load(f)
 
         orig_cat_map = {c['id']: c['name'] for c in data['categories']}
@@ -55,7 +62,7 @@ def convert():
         for im in tqdm(data['images'], desc=f'Processing {split}'):
             fn = im['file_name']
             full_path = os.path.join(image_folder, fn)
-            if not os.path.isfile(full_path):
+            if not index.isfile(full_path):
                 continue
 
             image_id += 1
@@ -86,14 +93,17 @@ def convert():
                     'original_category': orig_cat_name.lower(),
                 })
 
+    check_source_dimensions(DATASET, images)
+
     coco = {
         'images': images,
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images, {len(annotations)} annotations to {output_path}')
@@ -9,10 +9,14 @@ Species: Zebra, Elephant, Giraffe (all -> mammal)
 import json
 import os
 import pandas as pd
-from PIL import Image
 from tqdm import tqdm
 
-from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
+import id_blocks
+import tracing
+from csv_annotations import AnnotationTable
+from image_metadata import get_image_sizes
+from staging import staged
+from conversion_config import CATEGORIES, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'eikelboom-savanna'
 SPLITS = ['train', 'val', 'test']
@@ -28,16 +32,18 @@ SPECIES_TO_CATEGORY = {
 
 
 def convert():
-    df = pd.read_csv(annotation_file)
+    with tracing.span('parse'):
+        df = pd.read_csv(staged(annotation_file))
     print(f'Read {len(df)} annotation rows')
 
     # Build image name -> split mapping
     image_name_to_split = {}
     for split in SPLITS:
         split_dir = os.path.join(dataset_dir, split)
-        for fn in os.listdir(split_dir):
-            if fn.lower().endswith(('.jpg', '.jpeg', '.png')):
-                image_name_to_split[fn] = split
+        with tracing.span('scan', split_dir):
+            for fn in os.listdir(split_dir):
+                if fn.lower().endswith(('.jpg', '.jpeg', '.png')):
+                    image_name_to_split[fn] = split
 
     print(f'Found {len(image_name_to_split)} images on disk')
 
@@ -54,24 +60,21 @@ def convert():
         print(f'NOTE: {len(missing_in_annotations)} images on disk have no annotations')
 
     images = []
-    annotations = []
-    image_id = 0
-    ann_id = 0
+    image_id, ann_id = id_blocks.first_ids(DATASET)
 
-    # Group annotations by filename
-    grouped = df.groupby('FILE')
+    table = AnnotationTable(df, 'FILE', 'xyxy', ['x1', 'y1', 'x2', 'y2'],
+                            category=SPECIES_TO_CATEGORY.__getitem__, original_category_column='SPECIES',
+                            source=annotation_file)
+    image_names = [image_name for image_name in table.keys() if image_name in image_name_to_split]
 
-    for image_name, group in tqdm(grouped, desc='Processing images'):
-        if image_name not in image_name_to_split:
-            continue
+    full_paths = [os.path.join(dataset_dir, image_name_to_split[image_name], image_name)
+                  for image_name in image_names]
+    sizes = get_image_sizes(full_paths, desc='Probing images')
 
+    image_ids = {}
+    for image_name, (w, h) in tqdm(zip(image_names, sizes), total=len(image_names), desc='Processing images'):
         split = image_name_to_split[image_name]
         rel_path = f'{DATASET}/{split}/{image_name}'
-        full_path = os.path.join(dataset_dir, split, image_name)
-
-        im = Image.open(full_path)
-        w, h = im.size
-        im.close()
 
         image_id += 1
         img_entry = {
@@ -82,33 +85,19 @@ def convert():
             'original_split': split,
         }
         images.append(img_entry)
+        image_ids[image_name] = image_id
 
-        for _, row in group.iterrows():
-            species = row['SPECIES'].lower()
-            category_name = SPECIES_TO_CATEGORY[species]
-            cat_id = get_category_id(category_name)
-
-            x1, y1, x2, y2 = row['x1'], row['y1'], row['x2'], row['y2']
-            bbox = [float(x1), float(y1), float(x2 - x1), float(y2 - y1)]
-
-            ann_id += 1
-            ann_entry = {
-                'id': ann_id,
-                'image_id': image_id,
-                'category_id': cat_id,
-                'bbox': bbox,
-                'original_category': species,
-            }
-            annotations.append(ann_entry)
+    annotations, ann_id = table.to_coco(image_ids, ann_id)
 
     coco = {
         'images': images,
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images, {len(annotations)} annotations to {output_path}')
@@ -9,11 +9,18 @@ Species: olive ridley turtle (-> reptile)
 
 import json
 import os
+import numpy as np
 import pandas as pd
 from PIL import Image
 from tqdm import tqdm
 
-from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
+import id_blocks
+import tracing
+from csv_annotations import AnnotationTable
+from dir_index import dataset_index
+from source_dimensions import check_source_dimensions
+from staging import staged
+from conversion_config import CATEGORIES, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'gray-turtles'
 dataset_dir = os.path.join(DATA_ROOT, DATASET)
@@ -21,96 +28,80 @@ annotation_file = os.path.join(dataset_dir, 'turtle_image_metadata.csv')
 
 
 def convert():
-    df = pd.read_csv(annotation_file, low_memory=False)
+    with tracing.span('parse'):
+        df = pd.read_csv(staged(annotation_file), low_memory=False)
     print(f'Read {len(df)} total rows')
 
     # Filter to "Certain Turtle" only, per preview code
     df_turtles = df[df['label'] == 'Certain Turtle'].copy()
     print(f'Filtered to {len(df_turtles)} "Certain Turtle" annotations')
 
-    # Build relative path for each row
-    df_turtles['rel_image'] = df_turtles.apply(
-        lambda r: os.path.join(r['file_location'], r['filename']), axis=1
-    )
+    # Build relative path for each row, joined as os.path.join would
+    locations = df_turtles['file_location'].astype(str)
+    separators = np.where(locations.str.endswith(('/', os.sep)) | (locations == ''), '', os.sep)
+    df_turtles['rel_image'] = locations + separators + df_turtles['filename'].astype(str)
 
     # Find all images on disk
-    disk_images = set()
-    for root, dirs, files in os.walk(dataset_dir):
-        for fn in files:
-            if fn.lower().endswith(('.jpg', '.jpeg', '.png')):
-                rel = os.path.relpath(os.path.join(root, fn), dataset_dir).replace('\\', '/')
-                disk_images.add(rel)
-
-    print(f'Found {len(disk_images)} images on disk')
-
-    # Get unique annotated images
-    annotated_images = set(df_turtles['rel_image'].str.replace('\\', '/', regex=False))
-
-    missing_on_disk = annotated_images - disk_images
-    if missing_on_disk:
-        print(f'WARNING: {len(missing_on_disk)} annotated images not found on disk')
-        # Try normalizing paths
-        disk_images_lower = {p.lower(): p for p in disk_images}
-        found = 0
-        for m in list(missing_on_disk):
-            if m.lower() in disk_images_lower:
-                found += 1
-        if found:
-            print(f'  ({found} can be found with case-insensitive matching)')
-
-    # Group annotations by image
-    grouped = df_turtles.groupby('rel_image')
+    with tracing.span('scan'):
+        index = dataset_index(DATASET)
+    print(f'Found {len(index.relpaths((".jpg", ".jpeg", ".png")))} images on disk')
+
+    # Resolve each annotated image to its file on disk.  The CSV was written on Windows,
+    # and its paths don't always match the case of the files, so mismatched paths are
+    # repaired rather than dropped.
+    annotated_images = df_turtles['rel_image'].str.replace('\\', '/', regex=False)
+    resolved = {}
+    for rel_image in annotated_images.unique():
+        full_path = index.resolve(rel_image)
+        if full_path is not None:
+            resolved[rel_image] = os.path.relpath(full_path, dataset_dir).replace('\\', '/')
+
+    n_missing = annotated_images.nunique() - len(resolved)
+    if n_missing:
+        print(f'WARNING: {n_missing} annotated images not found on disk')
+    n_repaired = sum(1 for rel_image, disk_path in resolved.items() if rel_image != disk_path)
+    if n_repaired:
+        print(f'Matched {n_repaired} annotated images to files whose names differ in case')
+
+    # Group annotations by image (annotations of images not on disk have no key and are dropped)
+    df_turtles['rel_image'] = annotated_images.map(resolved)
+    table = AnnotationTable(df_turtles, 'rel_image', 'point', ['left', 'top'],
+                            category='reptile', original_category='olive ridley turtle')
+    # Use ImageHeight/ImageWidth from CSV (faster than opening each image), from each image's first row
+    first_rows = df_turtles.drop_duplicates('rel_image').set_index('rel_image')
+    widths = first_rows['ImageWidth'].to_dict()
+    heights = first_rows['ImageHeight'].to_dict()
 
     images = []
-    annotations = []
-    image_id = 0
-    ann_id = 0
-
-    for rel_image, group in tqdm(grouped, desc='Processing images'):
-        rel_image_normalized = rel_image.replace('\\', '/')
-        full_path = os.path.join(dataset_dir, rel_image_normalized)
-
-        if not os.path.isfile(full_path):
-            continue
-
-        # Use ImageHeight/ImageWidth from CSV (faster than opening each image)
-        row0 = group.iloc[0]
-        w = int(row0['ImageWidth'])
-        h = int(row0['ImageHeight'])
+    image_id, ann_id = id_blocks.first_ids(DATASET)
 
+    image_ids = {}
+    for rel_image in tqdm(table.keys(), desc='Processing images'):
         image_id += 1
-        rel_path = f'{DATASET}/{rel_image_normalized}'
+        rel_path = f'{DATASET}/{rel_image}'
         img_entry = {
             'id': image_id,
             'file_name': rel_path,
-            'width': w,
-            'height': h,
+            'width': int(widths[rel_image]),
+            'height': int(heights[rel_image]),
         }
         images.append(img_entry)
+        image_ids[rel_image] = image_id
+
+    # top/left are point coordinates
+    annotations, ann_id = table.to_coco(image_ids, ann_id)
 
-        for _, row in group.iterrows():
-            cat_id = get_category_id('reptile')
-            # top/left are point coordinates
-            point = [float(row['left']), float(row['top'])]
-
-            ann_id += 1
-            ann_entry = {
-                'id': ann_id,
-                'image_id': image_id,
-                'category_id': cat_id,
-                'point': point,
-                'original_category': 'olive ridley turtle',
-            }
-            annotations.append(ann_entry)
+    check_source_dimensions(DATASET, images)
 
     coco = {
         'images': images,
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images, {len(annotations)} annotations to {output_path}')
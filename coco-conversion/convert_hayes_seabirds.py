@@ -11,11 +11,14 @@ import json
 import os
 import glob
 import pandas as pd
-from PIL import Image
 from tqdm import tqdm
-from collections import defaultdict
 
-from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
+import id_blocks
+import tracing
+from csv_annotations import AnnotationTable
+from image_metadata import get_image_sizes
+from staging import staged
+from conversion_config import CATEGORIES, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'hayes-seabirds'
 dataset_dir = os.path.join(DATA_ROOT, DATASET)
@@ -34,14 +37,12 @@ SPECIES_TO_CATEGORY = {
 
 
 def convert():
-    csv_files = glob.glob(os.path.join(dataset_dir, '**', '*.csv'), recursive=True)
+    with tracing.span('scan', 'find csv files'):
+        csv_files = glob.glob(os.path.join(dataset_dir, '**', '*.csv'), recursive=True)
     csv_files = [f for f in csv_files if 'annotations' in f.lower()]
     print(f'Found {len(csv_files)} annotation CSV files')
 
-    # (dataset_name, image_name) -> list of annotations
-    image_annotations = defaultdict(list)
-    image_split_map = {}
-
+    frames = []
     for csv_file in csv_files:
         # Determine dataset name
         dataset_name = None
@@ -62,49 +63,51 @@ def convert():
         else:
             split = None
 
-        df = pd.read_csv(csv_file, header=None, names=['filename', 'x1', 'y1', 'x2', 'y2', 'label'])
-
-        for _, row in df.iterrows():
-            key = (dataset_name, row['filename'])
-            image_annotations[key].append({
-                'label': row['label'].lower(),
-                'x1': row['x1'],
-                'y1': row['y1'],
-                'x2': row['x2'],
-                'y2': row['y2'],
-            })
-            if split:
-                image_split_map[key] = split
-
-    total_anns = sum(len(v) for v in image_annotations.values())
-    print(f'Read {total_anns} annotations for {len(image_annotations)} images')
+        with tracing.span('parse', os.path.basename(csv_file)):
+            df = pd.read_csv(staged(csv_file), header=None, names=['filename', 'x1', 'y1', 'x2', 'y2', 'label'])
+        df['dataset_name'] = dataset_name
+        df['split'] = split
+        df['csv_file'] = csv_file
+        frames.append(df)
+
+    columns = ['filename', 'x1', 'y1', 'x2', 'y2', 'label', 'dataset_name', 'split', 'csv_file']
+    # Each file's rows keep their index in it, for error messages
+    df = pd.concat(frames) if frames else pd.DataFrame(columns=columns)
+    # (dataset_name, image_name) -> annotation rows, in file order
+    table = AnnotationTable(df, ['dataset_name', 'filename'], 'xyxy', ['x1', 'y1', 'x2', 'y2'],
+                            category=lambda label: SPECIES_TO_CATEGORY.get(label, 'bird'),
+                            original_category_column='label', source_column='csv_file')
+    # An image's split is that of the last CSV with a split to list it
+    image_split_map = df.groupby(['dataset_name', 'filename'])['split'].last().dropna().to_dict()
+
+    print(f'Read {len(table)} annotations for {len(table.keys())} images')
 
     # Count images on disk
     disk_count = 0
-    for folder in DATASET_NAME_TO_IMAGE_FOLDER.values():
-        if os.path.isdir(folder):
-            disk_count += len([f for f in os.listdir(folder) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.tif'))])
+    with tracing.span('scan'):
+        for folder in DATASET_NAME_TO_IMAGE_FOLDER.values():
+            if os.path.isdir(folder):
+                disk_count += len([f for f in os.listdir(folder) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.tif'))])
     print(f'Found {disk_count} images on disk')
 
     images = []
-    annotations = []
-    image_id = 0
-    ann_id = 0
-
-    for (dataset_name, image_name) in tqdm(sorted(image_annotations.keys()), desc='Processing images'):
-        image_folder = DATASET_NAME_TO_IMAGE_FOLDER[dataset_name]
-        full_path = os.path.join(image_folder, image_name)
-        if not os.path.isfile(full_path):
-            continue
-
+    image_id, ann_id = id_blocks.first_ids(DATASET)
+
+    keys = []
+    full_paths = []
+    for (dataset_name, image_name) in table.keys():
+        full_path = os.path.join(DATASET_NAME_TO_IMAGE_FOLDER[dataset_name], image_name)
+        if os.path.isfile(full_path):
+            keys.append((dataset_name, image_name))
+            full_paths.append(full_path)
+    sizes = get_image_sizes(full_paths, desc='Probing images')
+
+    image_ids = {}
+    for key, full_path, (w, h) in tqdm(zip(keys, full_paths, sizes), total=len(keys), desc='Processing images'):
         # Build relative path from data root
         rel_from_dataset = os.path.relpath(full_path, dataset_dir).replace('\\', '/')
         rel_path = f'{DATASET}/{rel_from_dataset}'
 
-        im = Image.open(full_path)
-        w, h = im.size
-        im.close()
-
         image_id += 1
         img_entry = {
             'id': image_id,
@@ -112,37 +115,22 @@ def convert():
             'width': w,
             'height': h,
         }
-        key = (dataset_name, image_name)
         if key in image_split_map:
             img_entry['original_split'] = image_split_map[key]
         images.append(img_entry)
+        image_ids[key] = image_id
 
-        for ann_data in image_annotations[key]:
-            label = ann_data['label']
-            category_name = SPECIES_TO_CATEGORY.get(label, 'bird')
-            cat_id = get_category_id(category_name)
-
-            x1, y1, x2, y2 = ann_data['x1'], ann_data['y1'], ann_data['x2'], ann_data['y2']
-            bbox = [float(x1), float(y1), float(x2 - x1), float(y2 - y1)]
-
-            ann_id += 1
-            ann_entry = {
-                'id': ann_id,
-                'image_id': image_id,
-                'category_id': cat_id,
-                'bbox': bbox,
-                'original_category': label,
-            }
-            annotations.append(ann_entry)
+    annotations, ann_id = table.to_coco(image_ids, ann_id)
 
     coco = {
         'images': images,
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images, {len(annotations)} annotations to {output_path}')
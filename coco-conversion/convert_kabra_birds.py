@@ -10,11 +10,15 @@ Boxes are in absolute pixel coordinates (x, y, w, h).
 import json
 import os
 import glob
-import pandas as pd
-from PIL import Image
+import numpy as np
 from tqdm import tqdm
 
-from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
+import id_blocks
+import tracing
+from csv_annotations import AnnotationTable
+from csv_batch import read_csv_files
+from image_metadata import get_image_sizes
+from conversion_config import CATEGORIES, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'kabra-birds'
 dataset_dir = os.path.join(DATA_ROOT, DATASET)
@@ -22,33 +26,40 @@ annotations_dir = os.path.join(dataset_dir, 'Good annotations')
 
 
 def convert():
-    csv_files = sorted(glob.glob(os.path.join(annotations_dir, '*.csv')))
+    with tracing.span('scan', 'find csv files'):
+        csv_files = sorted(glob.glob(os.path.join(annotations_dir, '*.csv')))
     print(f'Found {len(csv_files)} CSV files')
 
     images = []
-    annotations = []
-    image_id = 0
-    ann_id = 0
+    image_id, ann_id = id_blocks.first_ids(DATASET)
 
     # Count images on disk
-    image_files = glob.glob(os.path.join(annotations_dir, '*.jpg'))
+    with tracing.span('scan'):
+        image_files = glob.glob(os.path.join(annotations_dir, '*.jpg'))
     print(f'Found {len(image_files)} images on disk')
 
-    for csv_file in tqdm(csv_files, desc='Processing images'):
+    # Read the annotations of every image on disk in one batch, keyed by the index of the
+    # image in image_paths, then probe the annotated images in one batch
+    image_paths = []
+    csv_paths = []
+    for csv_file in csv_files:
         image_file = csv_file.replace('.csv', '.jpg')
-        if not os.path.isfile(image_file):
-            continue
+        if os.path.isfile(image_file):
+            image_paths.append(image_file)
+            csv_paths.append(csv_file)
 
-        df = pd.read_csv(csv_file)
-        if len(df) == 0:
-            continue
+    df = read_csv_files(csv_paths, columns=['desc', 'x', 'y', 'width', 'height'])
+    df['csv_file'] = np.asarray(csv_paths, dtype=object)[df['file_index'].to_numpy(dtype=np.int64)]
+    table = AnnotationTable(df, 'file_index', 'xywh', ['x', 'y', 'width', 'height'],
+                            category='bird', original_category_column='desc', source_column='csv_file')
+    annotated = table.keys()
 
-        im = Image.open(image_file)
-        w, h = im.size
-        im.close()
+    sizes = get_image_sizes([image_paths[i] for i in annotated], desc='Probing images')
 
+    image_ids = {}
+    for i, (w, h) in tqdm(zip(annotated, sizes), total=len(annotated), desc='Processing images'):
         image_id += 1
-        image_basename = os.path.basename(image_file)
+        image_basename = os.path.basename(image_paths[i])
         rel_path = f'{DATASET}/Good annotations/{image_basename}'
 
         img_entry = {
@@ -58,30 +69,19 @@ def convert():
             'height': h,
         }
         images.append(img_entry)
+        image_ids[i] = image_id
 
-        for _, row in df.iterrows():
-            cat_id = get_category_id('bird')
-            bbox = [float(row['x']), float(row['y']),
-                    float(row['width']), float(row['height'])]
-
-            ann_id += 1
-            ann_entry = {
-                'id': ann_id,
-                'image_id': image_id,
-                'category_id': cat_id,
-                'bbox': bbox,
-                'original_category': row['desc'].lower(),
-            }
-            annotations.append(ann_entry)
+    annotations, ann_id = table.to_coco(image_ids, ann_id)
 
     coco = {
         'images': images,
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images, {len(annotations)} annotations to {output_path}')
@@ -14,6 +14,11 @@ import os
 from tqdm import tqdm
 from collections import defaultdict
 
+import id_blocks
+import tracing
+from dir_index import dataset_index
+from source_dimensions import check_source_dimensions
+from staging import staged
 from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'koger-drones'
@@ -61,22 +66,24 @@ ANNOTATION_SETS = [
 def convert():
     images = []
     annotations = []
-    image_id = 0
-    ann_id = 0
+    image_id, ann_id = id_blocks.first_ids(DATASET)
 
     # Track which abs paths we've already processed (gelada images may overlap between splits)
     processed_abs_paths = {}
 
+    with tracing.span('scan'):
+        index = dataset_index(DATASET)
+
     for ann_set in ANNOTATION_SETS:
         ann_file = ann_set['ann_file']
         image_root = ann_set['image_root']
         split = ann_set['split']
 
-        if not os.path.isfile(ann_file):
+        if not index.isfile(ann_file):
             print(f'Skipping missing annotation file: {ann_file}')
             continue
 
-        with open(ann_file, 'r') as f:
+        with tracing.span('parse', os.path.basename(ann_file)), open(staged(ann_file), 'r') as f:
             data = json.load(f)
 
         orig_cat_map = {c['id']: c['name'] for c in data['categories']}
@@ -89,7 +96,7 @@ def convert():
             fn = im['file_name']
             full_path = os.path.join(image_root, fn)
 
-            if not os.path.isfile(full_path):
+            if not index.isfile(full_path):
                 continue
 
             abs_path = os.path.abspath(full_path)
@@ -145,14 +152,17 @@ def convert():
                     'original_category': orig_cat_name,
                 })
 
+    check_source_dimensions(DATASET, images)
+
     coco = {
         'images': images,
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images, {len(annotations)} annotations to {output_path}')
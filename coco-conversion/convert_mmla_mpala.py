@@ -9,5 +9,12 @@ CATEGORY_MAPPING = {
     'dog': 'mammal',
 }
 
+
+def convert(chunk=None, output_path=None):
+    # Split lists and metadata sit alongside the label files, as in preview-mmla-mpala.py
+    return convert_yolo_dataset('mmla-mpala', CATEGORY_MAPPING, chunk=chunk, output_path=output_path,
+                                exclude_files=('classes.txt', 'test.txt', 'metadata.txt'))
+
+
 if __name__ == '__main__':
-    convert_yolo_dataset('mmla-mpala', CATEGORY_MAPPING)
+    convert()
@@ -6,5 +6,10 @@ CATEGORY_MAPPING = {
     'zebra': 'mammal',
 }
 
+
+def convert(chunk=None, output_path=None):
+    return convert_yolo_dataset('mmla-opc', CATEGORY_MAPPING, chunk=chunk, output_path=output_path)
+
+
 if __name__ == '__main__':
-    convert_yolo_dataset('mmla-opc', CATEGORY_MAPPING)
+    convert()
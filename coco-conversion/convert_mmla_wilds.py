@@ -9,5 +9,12 @@ CATEGORY_MAPPING = {
     'dog': 'mammal',
 }
 
+
+def convert(chunk=None, output_path=None):
+    # The split list sits alongside the label files, as in preview-mmla-wilds.py
+    return convert_yolo_dataset('mmla-wilds', CATEGORY_MAPPING, chunk=chunk, output_path=output_path,
+                                exclude_files=('classes.txt', 'test.txt'))
+
+
 if __name__ == '__main__':
-    convert_yolo_dataset('mmla-wilds', CATEGORY_MAPPING)
+    convert()
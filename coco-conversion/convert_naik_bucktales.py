@@ -12,6 +12,11 @@ import os
 from PIL import Image
 from tqdm import tqdm
 
+import id_blocks
+import tracing
+from dir_index import DirectoryIndex
+from source_dimensions import check_source_dimensions
+from staging import staged
 from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'naik-bucktales'
@@ -36,15 +41,17 @@ ORIGINAL_CAT_TO_CATEGORY = {
 def convert():
     images = []
     annotations = []
-    image_id = 0
-    ann_id = 0
+    image_id, ann_id = id_blocks.first_ids(DATASET)
     total_disk_images = 0
 
+    with tracing.span('scan'):
+        index = DirectoryIndex(COCO_BASE)
+
     for split, (json_file, image_folder) in SPLITS.items():
         json_path = os.path.join(COCO_BASE, json_file)
         image_dir = os.path.join(COCO_BASE, image_folder)
 
-        with open(json_path, 'r') as f:
+        with tracing.span('parse', json_file), open(staged(json_path), 'r') as f:
             data = json.load(f)
 
         # Build category map from original data
@@ -55,13 +62,13 @@ def convert():
         for ann in data['annotations']:
             img_id_to_anns.setdefault(ann['image_id'], []).append(ann)
 
-        disk_files = set(os.listdir(image_dir)) if os.path.isdir(image_dir) else set()
+        disk_files = index.listdir(image_dir)
         total_disk_images += len([f for f in disk_files if f.lower().endswith(('.jpg', '.jpeg', '.png'))])
 
         for im in tqdm(data['images'], desc=f'Processing {split}'):
             fn = im['file_name']
             full_path = os.path.join(image_dir, fn)
-            if not os.path.isfile(full_path):
+            if not index.isfile(full_path):
                 continue
 
             image_id += 1
@@ -96,14 +103,17 @@ def convert():
                 }
                 annotations.append(ann_entry)
 
+    check_source_dimensions(DATASET, images)
+
     coco = {
         'images': images,
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images, {len(annotations)} annotations to {output_path}')
@@ -9,11 +9,15 @@ Category prefix determines mapping: zebra->mammal, person->other, vehicle->other
 
 import json
 import os
-import glob
-from PIL import Image
 from tqdm import tqdm
 from collections import defaultdict
 
+import id_blocks
+import tracing
+from dir_index import dataset_index
+from source_dimensions import check_source_dimensions
+from image_metadata import get_image_size
+from staging import staged
 from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'price-zebras'
@@ -28,35 +32,38 @@ CATEGORY_PREFIX_TO_CATEGORY = {
 
 
 def convert():
-    json_files = glob.glob(os.path.join(video_folder, '**', '*.json'), recursive=True)
+    with tracing.span('scan'):
+        index = dataset_index(DATASET)
+    json_files = [os.path.join(dataset_dir, *rel.split('/'))
+                  for rel in index.relpaths(('.json',), under=video_folder)]
     print(f'Found {len(json_files)} JSON annotation files')
 
     images = []
     annotations = []
-    image_id = 0
-    ann_id = 0
+    image_id, ann_id = id_blocks.first_ids(DATASET)
     n_bad_points = 0
     n_missing_image = 0
     processed_abs_paths = set()
+    images_with_source_dimensions = []
 
     for json_file in tqdm(json_files, desc='Processing price-zebras'):
-        with open(json_file, 'r') as f:
+        with tracing.span('parse'), open(staged(json_file), 'r') as f:
             d = json.load(f)
 
         # Resolve image path relative to the JSON file location
-        image_path = d['imagePath']
+        image_path = d['imagePath'].replace('\\', '/')
         json_dir = os.path.dirname(json_file)
-        image_abs = os.path.normpath(os.path.join(json_dir, image_path))
+        # The file it refers to, with the case on disk, which imagePath doesn't always match
+        image_abs = index.resolve(os.path.normpath(os.path.join(json_dir, image_path)))
 
-        if not os.path.isfile(image_abs):
+        if image_abs is None:
             n_missing_image += 1
             continue
 
         # Skip if we've already processed this image (from a different JSON)
-        abs_key = os.path.abspath(image_abs).lower()
-        if abs_key in processed_abs_paths:
+        if image_abs in processed_abs_paths:
             continue
-        processed_abs_paths.add(abs_key)
+        processed_abs_paths.add(image_abs)
 
         shapes = d.get('shapes', [])
         if len(shapes) == 0:
@@ -65,10 +72,10 @@ def convert():
         # Get dimensions from JSON metadata (faster than opening image)
         w = d.get('imageWidth')
         h = d.get('imageHeight')
-        if w is None or h is None:
-            im = Image.open(image_abs)
-            w, h = im.size
-            im.close()
+        has_source_dimensions = w is not None and h is not None
+        if not has_source_dimensions:
+            with tracing.span('probe'):
+                w, h = get_image_size(image_abs)
 
         image_id += 1
         rel_from_dataset = os.path.relpath(image_abs, dataset_dir).replace('\\', '/')
@@ -92,6 +99,8 @@ def convert():
         if split:
             img_entry['original_split'] = split
         images.append(img_entry)
+        if has_source_dimensions:
+            images_with_source_dimensions.append(img_entry)
 
         for shape in shapes:
             if shape['shape_type'] != 'rectangle':
@@ -127,14 +136,17 @@ def convert():
                 'original_category': category_prefix,
             })
 
+    check_source_dimensions(DATASET, images_with_source_dimensions)
+
     coco = {
         'images': images,
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images, {len(annotations)} annotations to {output_path}')
@@ -9,9 +9,12 @@ Species: penguin (-> bird)
 import json
 import os
 import glob
-from PIL import Image
 from tqdm import tqdm
 
+import id_blocks
+import tracing
+from image_metadata import get_image_sizes
+from staging import staged
 from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'qian-penguins'
@@ -29,9 +32,10 @@ def convert():
     image_to_subfolder = {}
     for subfolder in SUBFOLDERS:
         folder_path = os.path.join(dataset_dir, subfolder)
-        for fn in os.listdir(folder_path):
-            if fn.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_to_subfolder[fn] = subfolder
+        with tracing.span('scan', folder_path):
+            for fn in os.listdir(folder_path):
+                if fn.lower().endswith(('.png', '.jpg', '.jpeg')):
+                    image_to_subfolder[fn] = subfolder
 
     print(f'Found {len(image_to_subfolder)} images on disk')
 
@@ -40,7 +44,7 @@ def convert():
     filename_to_annotations = {}
 
     for json_file in json_files:
-        with open(json_file, 'r') as f:
+        with tracing.span('parse', os.path.basename(json_file)), open(staged(json_file), 'r') as f:
             records = json.load(f)
 
         for rec in records:
@@ -77,20 +81,16 @@ def convert():
 
     images = []
     annotations = []
-    image_id = 0
-    ann_id = 0
+    image_id, ann_id = id_blocks.first_ids(DATASET)
 
-    for image_filename in tqdm(sorted(filename_to_annotations.keys()), desc='Processing images'):
-        if image_filename not in image_to_subfolder:
-            continue
+    image_filenames = [fn for fn in sorted(filename_to_annotations.keys()) if fn in image_to_subfolder]
+    sizes = get_image_sizes([os.path.join(dataset_dir, image_to_subfolder[fn], fn) for fn in image_filenames],
+                            desc='Probing images')
 
+    for image_filename, (w, h) in tqdm(zip(image_filenames, sizes), total=len(image_filenames),
+                                       desc='Processing images'):
         subfolder = image_to_subfolder[image_filename]
         rel_path = f'{DATASET}/{subfolder}/{image_filename}'
-        full_path = os.path.join(dataset_dir, subfolder, image_filename)
-
-        im = Image.open(full_path)
-        w, h = im.size
-        im.close()
 
         image_id += 1
         img_entry = {
@@ -121,9 +121,10 @@ def convert():
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images, {len(annotations)} annotations to {output_path}')
@@ -12,6 +12,11 @@ import os
 from tqdm import tqdm
 from collections import defaultdict
 
+import id_blocks
+import tracing
+from dir_index import DirectoryIndex
+from source_dimensions import check_source_dimensions
+from staging import staged
 from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'reinhard-savmap'
@@ -21,7 +26,7 @@ ann_file = os.path.join(coco_dir, 'annotations.json')
 
 
 def convert():
-    with open(ann_file, 'r') as f:
+    with tracing.span('parse'), open(staged(ann_file), 'r') as f:
         data = json.load(f)
 
     print(f'Source: {len(data["images"])} images, {len(data["annotations"])} annotations')
@@ -33,17 +38,19 @@ def convert():
 
     images = []
     annotations = []
-    image_id = 0
-    ann_id = 0
+    image_id, ann_id = id_blocks.first_ids(DATASET)
     n_empty = 0
 
+    with tracing.span('scan'):
+        index = DirectoryIndex(coco_dir)
+
     for im in tqdm(data['images'], desc='Processing images'):
         image_id += 1
 
         # file_name is like "images/image_000001.jpg"
         orig_file_name = im['file_name']
         full_path = os.path.join(coco_dir, orig_file_name)
-        if not os.path.isfile(full_path):
+        if not index.isfile(full_path):
             continue
 
         # Build path relative to data root
@@ -83,14 +90,17 @@ def convert():
                     'original_category': 'animal',
                 })
 
+    check_source_dimensions(DATASET, images)
+
     coco = {
         'images': images,
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images ({n_empty} empty), {len(annotations)} annotations to {output_path}')
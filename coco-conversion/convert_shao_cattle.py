@@ -11,9 +11,13 @@ Boxes are in absolute pixel coordinates (x, y, w, h).
 import json
 import os
 import glob
-from PIL import Image
 from tqdm import tqdm
 
+import id_blocks
+import tracing
+from dir_index import dataset_index
+from image_metadata import get_image_sizes
+from staging import staged
 from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'shao-cattle'
@@ -37,7 +41,7 @@ def convert():
                 image_folder = folder
                 break
 
-        with open(annotation_file, 'r') as f:
+        with tracing.span('parse', os.path.basename(annotation_file)), open(staged(annotation_file), 'r') as f:
             lines = f.readlines()
         lines = [s.strip() for s in lines]
 
@@ -71,33 +75,31 @@ def convert():
 
     # Count images on disk (recursive, since Dataset1 has subdirectories)
     disk_images = set()
+    with tracing.span('scan'):
+        index = dataset_index(DATASET)
     for folder in DATASET_TO_IMAGE_FOLDER.values():
         folder_path = os.path.join(dataset_dir, folder)
-        if os.path.isdir(folder_path):
-            for root, dirs, files in os.walk(folder_path):
-                for fn in files:
-                    if fn.lower().endswith(('.jpg', '.jpeg', '.png')):
-                        rel = os.path.relpath(os.path.join(root, fn), dataset_dir).replace('\\', '/')
-                        disk_images.add(rel)
+        if index.isdir(folder_path):
+            with tracing.span('scan', folder):
+                for root, dirs, files in index.walk(folder_path):
+                    for fn in files:
+                        if fn.lower().endswith(('.jpg', '.jpeg', '.png')):
+                            rel = os.path.relpath(os.path.join(root, fn), dataset_dir).replace('\\', '/')
+                            disk_images.add(rel)
     print(f'Found {len(disk_images)} images on disk')
 
     images = []
     annotations = []
-    image_id = 0
-    ann_id = 0
+    image_id, ann_id = id_blocks.first_ids(DATASET)
 
-    for rel_path in tqdm(sorted(relative_path_to_annotations.keys()), desc='Processing images'):
-        full_path = os.path.join(dataset_dir, rel_path)
-        if not os.path.isfile(full_path):
-            continue
+    rel_paths = [rel_path for rel_path in sorted(relative_path_to_annotations.keys())
+                 if len(relative_path_to_annotations[rel_path]) > 0
+                 and index.isfile(os.path.join(dataset_dir, rel_path))]
+    sizes = get_image_sizes([os.path.join(dataset_dir, rel_path) for rel_path in rel_paths],
+                            desc='Probing images')
 
+    for rel_path, (w, h) in tqdm(zip(rel_paths, sizes), total=len(rel_paths), desc='Processing images'):
         boxes = relative_path_to_annotations[rel_path]
-        if len(boxes) == 0:
-            continue
-
-        im = Image.open(full_path)
-        w, h = im.size
-        im.close()
 
         image_id += 1
         img_entry = {
@@ -128,9 +130,10 @@ def convert():
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images, {len(annotations)} annotations to {output_path}')
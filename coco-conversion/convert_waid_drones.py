@@ -8,10 +8,14 @@ All are mammals.
 
 import json
 import os
-import glob
-from PIL import Image
+import numpy as np
 from tqdm import tqdm
 
+import id_blocks
+import tracing
+from dir_index import dataset_index
+from label_cache import read_labels
+from yolo_labels import to_coco_boxes
 from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'waid-drones'
@@ -37,40 +41,54 @@ def convert():
     class_id_to_name = {i: name for i, name in enumerate(class_names)}
     print(f'Classes: {class_id_to_name}')
 
-    # Find all label files
-    txt_files = glob.glob(os.path.join(labels_dir, '**', '*.txt'), recursive=True)
+    # Find all label files and count images on disk
+    with tracing.span('scan'):
+        index = dataset_index(DATASET)
+    txt_files = [os.path.join(dataset_dir, *rel.split('/')) for rel in index.relpaths(('.txt',), under=labels_dir)]
     print(f'Found {len(txt_files)} label files')
-
-    # Count images on disk
-    jpg_files = glob.glob(os.path.join(images_dir, '**', '*.jpg'), recursive=True)
-    print(f'Found {len(jpg_files)} images on disk')
+    print(f'Found {len(index.relpaths((".jpg",), under=images_dir))} images on disk')
 
     images = []
     annotations = []
-    image_id = 0
-    ann_id = 0
+    image_id, ann_id = id_blocks.first_ids(DATASET)
     n_missing = 0
 
-    for txt_file in tqdm(txt_files, desc='Processing waid-drones'):
+    # Get all the labels (in one array) and the labelled images' dimensions, reading only
+    # label files that have changed since the last run
+    labelled = []
+    for txt_file in txt_files:
         # Map label path to image path
         rel_from_labels = os.path.relpath(txt_file, labels_dir)
         image_rel = os.path.splitext(rel_from_labels)[0] + '.jpg'
         image_file = os.path.join(images_dir, image_rel)
 
-        if not os.path.isfile(image_file):
+        if not index.isfile(image_file):
             n_missing += 1
             continue
 
-        with open(txt_file, 'r') as f:
-            lines = [line.strip() for line in f.readlines() if line.strip()]
-
-        if len(lines) == 0:
-            continue
-
-        im = Image.open(image_file)
-        w, h = im.size
-        im.close()
-
+        labelled.append((txt_file, image_file))
+
+    # Images whose label files are empty are left out, and not probed
+    class_ids, boxes, offsets, n_lines, sizes = read_labels(DATASET, labelled, probe_empty=False, prune=True)
+    kept = np.flatnonzero(n_lines > 0)
+
+    # Convert every box to COCO format (absolute pixels) at once; files left out have no boxes
+    file_sizes = np.zeros((len(labelled), 2), dtype=np.int64)
+    file_sizes[kept] = np.asarray([sizes[i] for i in kept], dtype=np.int64).reshape(-1, 2)
+    labels_per_file = np.diff(offsets)
+    coco_boxes = to_coco_boxes(boxes,
+                               np.repeat(file_sizes[:, 0], labels_per_file),
+                               np.repeat(file_sizes[:, 1], labels_per_file)).tolist()
+    class_ids, offsets = class_ids.tolist(), offsets.tolist()
+    class_categories = {}
+    for orig_class_id in set(class_ids):
+        orig_class_name = class_id_to_name.get(orig_class_id, f'unknown_{orig_class_id}')
+        category_name = CATEGORY_MAPPING.get(orig_class_name, 'other')
+        class_categories[orig_class_id] = (get_category_id(category_name), orig_class_name)
+
+    for i_file in tqdm(kept.tolist(), desc='Processing waid-drones'):
+        image_file = labelled[i_file][1]
+        w, h = sizes[i_file]
         image_id += 1
         # Build path relative to data root
         image_rel_from_dataset = os.path.relpath(image_file, dataset_dir).replace('\\', '/')
@@ -84,34 +102,15 @@ def convert():
         }
         images.append(img_entry)
 
-        for line in lines:
-            tokens = line.split()
-            if len(tokens) != 5:
-                continue
-
-            orig_class_id = int(tokens[0])
-            orig_class_name = class_id_to_name.get(orig_class_id, f'unknown_{orig_class_id}')
-            category_name = CATEGORY_MAPPING.get(orig_class_name, 'other')
-            cat_id = get_category_id(category_name)
-
-            x_center_norm = float(tokens[1])
-            y_center_norm = float(tokens[2])
-            width_norm = float(tokens[3])
-            height_norm = float(tokens[4])
-
-            box_w = width_norm * w
-            box_h = height_norm * h
-            x = (x_center_norm - width_norm / 2.0) * w
-            y = (y_center_norm - height_norm / 2.0) * h
-
-            bbox = [x, y, box_w, box_h]
-
+        # Lines without 5 fields have already been left out
+        for i_label in range(offsets[i_file], offsets[i_file + 1]):
+            cat_id, orig_class_name = class_categories[class_ids[i_label]]
             ann_id += 1
             annotations.append({
                 'id': ann_id,
                 'image_id': image_id,
                 'category_id': cat_id,
-                'bbox': bbox,
+                'bbox': coco_boxes[i_label],
                 'original_category': orig_class_name,
             })
 
@@ -120,9 +119,10 @@ def convert():
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images, {len(annotations)} annotations to {output_path}')
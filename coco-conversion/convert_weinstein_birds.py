@@ -10,26 +10,29 @@ Species: bird (-> bird)
 
 import json
 import os
-import glob
 import pandas as pd
-from PIL import Image
 from tqdm import tqdm
-from collections import defaultdict
 
-from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
+import id_blocks
+import tracing
+from csv_annotations import AnnotationTable
+from dir_index import dataset_index
+from image_metadata import get_image_sizes
+from staging import staged
+from conversion_config import CATEGORIES, DATA_ROOT, OUTPUT_DIR
 
 DATASET = 'weinstein-birds'
 dataset_dir = os.path.join(DATA_ROOT, DATASET)
 
 
 def convert():
-    csv_files = glob.glob(os.path.join(dataset_dir, '**', '*.csv'), recursive=True)
+    with tracing.span('scan'):
+        index = dataset_index(DATASET)
+    csv_files = [os.path.join(dataset_dir, *rel.split('/')) for rel in index.relpaths(('.csv',))]
     print(f'Found {len(csv_files)} CSV files')
 
     # Read all annotations, tracking split info from filename
-    image_annotations = defaultdict(list)
-    image_split = {}
-
+    frames = []
     for csv_file in csv_files:
         sub_dataset = os.path.basename(os.path.dirname(csv_file))
         csv_name = os.path.basename(csv_file).lower()
@@ -44,54 +47,42 @@ def convert():
         else:
             split = None
 
-        df = pd.read_csv(csv_file)
-
-        for _, row in df.iterrows():
-            rel_path = f'{sub_dataset}/{row["image_path"]}'
-            label = row['label'].lower()
+        with tracing.span('parse', os.path.basename(csv_file)):
+            df = pd.read_csv(staged(csv_file))
+        df = df[['xmin', 'ymin', 'xmax', 'ymax', 'label']].assign(
+            rel_path=sub_dataset + '/' + df['image_path'].astype(str), split=split, csv_file=csv_file)
+        frames.append(df)
 
-            image_annotations[rel_path].append({
-                'label': label,
-                'xmin': row['xmin'],
-                'ymin': row['ymin'],
-                'xmax': row['xmax'],
-                'ymax': row['ymax'],
-            })
-            if split:
-                image_split[rel_path] = split
+    columns = ['xmin', 'ymin', 'xmax', 'ymax', 'label', 'rel_path', 'split', 'csv_file']
+    # Each file's rows keep their index in it, for error messages
+    df = pd.concat(frames) if frames else pd.DataFrame(columns=columns)
+    table = AnnotationTable(df, 'rel_path', 'xyxy', ['xmin', 'ymin', 'xmax', 'ymax'],
+                            category='bird', original_category_column='label', source_column='csv_file')
+    # An image's split is that of the last CSV with a split to list it
+    image_split = df.groupby('rel_path')['split'].last().dropna().to_dict()
 
-    total_anns = sum(len(v) for v in image_annotations.values())
-    print(f'Read {total_anns} annotations for {len(image_annotations)} images')
+    print(f'Read {len(table)} annotations for {len(table.keys())} images')
 
     # Count images on disk
-    disk_images = set()
-    for root, dirs, files in os.walk(dataset_dir):
-        for fn in files:
-            if fn.lower().endswith(('.jpg', '.jpeg', '.png', '.tif', '.tiff')):
-                rel = os.path.relpath(os.path.join(root, fn), dataset_dir).replace('\\', '/')
-                disk_images.add(rel)
+    disk_images = set(index.relpaths(('.jpg', '.jpeg', '.png', '.tif', '.tiff')))
 
     print(f'Found {len(disk_images)} images on disk')
 
-    annotated_set = set(image_annotations.keys())
+    annotated_set = set(table.keys())
     missing_on_disk = annotated_set - disk_images
     if missing_on_disk:
         print(f'WARNING: {len(missing_on_disk)} annotated images not found on disk')
 
     images = []
-    annotations = []
-    image_id = 0
-    ann_id = 0
-
-    for rel_path in tqdm(sorted(image_annotations.keys()), desc='Processing images'):
-        full_path = os.path.join(dataset_dir, rel_path)
-        if not os.path.isfile(full_path):
-            continue
+    image_id, ann_id = id_blocks.first_ids(DATASET)
 
-        im = Image.open(full_path)
-        w, h = im.size
-        im.close()
+    rel_paths = [rel_path for rel_path in table.keys()
+                 if index.isfile(os.path.join(dataset_dir, rel_path))]
+    sizes = get_image_sizes([os.path.join(dataset_dir, rel_path) for rel_path in rel_paths],
+                            desc='Probing images')
 
+    image_ids = {}
+    for rel_path, (w, h) in tqdm(zip(rel_paths, sizes), total=len(rel_paths), desc='Processing images'):
         image_id += 1
         img_entry = {
             'id': image_id,
@@ -102,32 +93,19 @@ def convert():
         if rel_path in image_split:
             img_entry['original_split'] = image_split[rel_path]
         images.append(img_entry)
+        image_ids[rel_path] = image_id
 
-        for ann_data in image_annotations[rel_path]:
-            label = ann_data['label']
-            cat_id = get_category_id('bird')
-
-            x1, y1, x2, y2 = ann_data['xmin'], ann_data['ymin'], ann_data['xmax'], ann_data['ymax']
-            bbox = [float(x1), float(y1), float(x2 - x1), float(y2 - y1)]
-
-            ann_id += 1
-            ann_entry = {
-                'id': ann_id,
-                'image_id': image_id,
-                'category_id': cat_id,
-                'bbox': bbox,
-                'original_category': label,
-            }
-            annotations.append(ann_entry)
+    annotations, ann_id = table.to_coco(image_ids, ann_id)
 
     coco = {
         'images': images,
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(DATASET, coco)
 
     output_path = os.path.join(OUTPUT_DIR, f'{DATASET}.json')
-    with open(output_path, 'w') as f:
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images, {len(annotations)} annotations to {output_path}')
@@ -8,14 +8,22 @@ Empty .txt files are treated as explicitly empty images.
 
 import json
 import os
-import glob
-from PIL import Image
+import numpy as np
 from tqdm import tqdm
 
+import id_blocks
+import tracing
+from dir_index import dataset_index
+from label_cache import read_labels
+from yolo_labels import to_coco_boxes
 from conversion_config import CATEGORIES, get_category_id, DATA_ROOT, OUTPUT_DIR
 
+# Image extensions, in the order a label file's image is looked for
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
 
-def convert_yolo_dataset(dataset_name, category_mapping, classes_file=None):
+
+def convert_yolo_dataset(dataset_name, category_mapping, classes_file=None, chunk=None, output_path=None,
+                         exclude_files=('classes.txt',)):
     """
     Convert a YOLO-format dataset to COCO.
 
@@ -23,6 +31,11 @@ def convert_yolo_dataset(dataset_name, category_mapping, classes_file=None):
         dataset_name: shortcode / folder name under DATA_ROOT
         category_mapping: dict mapping original class name -> harmonized category name
         classes_file: path to classes.txt (default: dataset_dir/classes.txt)
+        chunk: (index, count) to convert only the index-th of count contiguous slices of the
+            (sorted) annotation files, for splitting a large dataset across machines; the
+            slices' outputs concatenate to the output of an unchunked run
+        output_path: where to write the COCO file (default: OUTPUT_DIR/<dataset_name>.json)
+        exclude_files: fnmatch patterns for .txt files that aren't label files
     """
     dataset_dir = os.path.join(DATA_ROOT, dataset_name)
 
@@ -35,52 +48,67 @@ def convert_yolo_dataset(dataset_name, category_mapping, classes_file=None):
     class_id_to_name = {i: name for i, name in enumerate(class_names)}
     print(f'Classes: {class_id_to_name}')
 
-    # Find all annotation txt files (exclude classes.txt and README)
-    txt_files = glob.glob(os.path.join(dataset_dir, '**', '*.txt'), recursive=True)
-    txt_files = [f for f in txt_files if not os.path.basename(f) in ('classes.txt',)]
+    with tracing.span('scan'):
+        # One pass over the tree, which answers the image lookups below too
+        index = dataset_index(dataset_name)
+
+        # Find all annotation txt files (exclude classes.txt and the like)
+        txt_files = sorted(os.path.join(dataset_dir, *rel.split('/')) for rel in index.relpaths(('.txt',), exclude_files))
 
-    # Find all image files
-    jpg_files = set()
-    for ext in ('*.jpg', '*.jpeg', '*.png'):
-        for f in glob.glob(os.path.join(dataset_dir, '**', ext), recursive=True):
-            jpg_files.add(os.path.abspath(f))
+        # Count image files
+        n_disk_images = len(index.relpaths(IMAGE_EXTENSIONS))
 
-    print(f'Found {len(txt_files)} annotation files, {len(jpg_files)} images on disk')
+    print(f'Found {len(txt_files)} annotation files, {n_disk_images} images on disk')
+
+    if chunk is not None:
+        i_chunk, n_chunks = chunk
+        start = len(txt_files) * i_chunk // n_chunks
+        end = len(txt_files) * (i_chunk + 1) // n_chunks
+        txt_files = txt_files[start:end]
+        print(f'Converting chunk {i_chunk + 1} of {n_chunks} ({len(txt_files)} annotation files)')
 
     images = []
     annotations = []
-    image_id = 0
-    ann_id = 0
+    image_id, ann_id = id_blocks.first_ids(dataset_name)
     n_empty = 0
     n_missing_image = 0
 
-    for txt_file in tqdm(txt_files, desc=f'Processing {dataset_name}'):
+    # Find each label file's image, then get all the labels (in one array) and the images'
+    # dimensions, reading only label files that have changed since the last run
+    labelled = []
+    for txt_file in txt_files:
         # Find corresponding image
-        base = os.path.splitext(txt_file)[0]
-        image_file = None
-        for ext in ('.jpg', '.jpeg', '.png'):
-            candidate = base + ext
-            if os.path.isfile(candidate):
-                image_file = candidate
-                break
+        image_file = index.find_file(os.path.splitext(txt_file)[0], IMAGE_EXTENSIONS)
 
         if image_file is None:
             n_missing_image += 1
             continue
 
-        # Read annotation lines
-        with open(txt_file, 'r') as f:
-            lines = [line.strip() for line in f.readlines() if line.strip()]
-
-        # Get image dimensions
-        im = Image.open(image_file)
-        w, h = im.size
-        im.close()
-
-        image_id += 1
+        labelled.append((txt_file, image_file))
+
+    class_ids, boxes, offsets, n_lines, sizes = read_labels(dataset_name, labelled, prune=chunk is None)
+
+    # Convert every box to COCO format (absolute pixels) at once, then look up the
+    # categories of the distinct classes
+    sizes_array = np.asarray(sizes, dtype=np.int64).reshape(-1, 2)
+    labels_per_file = np.diff(offsets)
+    coco_boxes = to_coco_boxes(boxes,
+                               np.repeat(sizes_array[:, 0], labels_per_file),
+                               np.repeat(sizes_array[:, 1], labels_per_file)).tolist()
+    class_ids, offsets = class_ids.tolist(), offsets.tolist()
+    class_categories = {}
+    for orig_class_id in set(class_ids):
+        orig_class_name = class_id_to_name.get(orig_class_id, f'unknown_{orig_class_id}')
+        category_name = category_mapping.get(orig_class_name, 'other')
+        class_categories[orig_class_id] = (get_category_id(category_name), orig_class_name)
+
+    for i_file, ((_, image_file), (w, h)) in enumerate(tqdm(zip(labelled, sizes), total=len(labelled),
+                                                            desc=f'Processing {dataset_name}')):
         rel_from_dataset = os.path.relpath(image_file, dataset_dir).replace('\\', '/')
         rel_path = f'{dataset_name}/{rel_from_dataset}'
 
+        image_id += 1
+
         img_entry = {
             'id': image_id,
             'file_name': rel_path,
@@ -89,7 +117,7 @@ def convert_yolo_dataset(dataset_name, category_mapping, classes_file=None):
         }
         images.append(img_entry)
 
-        if len(lines) == 0:
+        if n_lines[i_file] == 0:
             # Explicitly empty image
             n_empty += 1
             cat_id = get_category_id('empty')
@@ -102,35 +130,15 @@ def convert_yolo_dataset(dataset_name, category_mapping, classes_file=None):
             })
             continue
 
-        for line in lines:
-            tokens = line.split()
-            if len(tokens) != 5:
-                continue
-
-            orig_class_id = int(tokens[0])
-            orig_class_name = class_id_to_name.get(orig_class_id, f'unknown_{orig_class_id}')
-            category_name = category_mapping.get(orig_class_name, 'other')
-            cat_id = get_category_id(category_name)
-
-            x_center_norm = float(tokens[1])
-            y_center_norm = float(tokens[2])
-            width_norm = float(tokens[3])
-            height_norm = float(tokens[4])
-
-            # Convert from YOLO center format to COCO top-left format (absolute pixels)
-            box_w = width_norm * w
-            box_h = height_norm * h
-            x = (x_center_norm - width_norm / 2.0) * w
-            y = (y_center_norm - height_norm / 2.0) * h
-
-            bbox = [x, y, box_w, box_h]
-
+        # Lines without 5 fields have already been left out
+        for i_label in range(offsets[i_file], offsets[i_file + 1]):
+            cat_id, orig_class_name = class_categories[class_ids[i_label]]
             ann_id += 1
             annotations.append({
                 'id': ann_id,
                 'image_id': image_id,
                 'category_id': cat_id,
-                'bbox': bbox,
+                'bbox': coco_boxes[i_label],
                 'original_category': orig_class_name,
             })
 
@@ -139,9 +147,11 @@ def convert_yolo_dataset(dataset_name, category_mapping, classes_file=None):
         'annotations': annotations,
         'categories': CATEGORIES,
     }
+    id_blocks.finish(dataset_name, coco)
 
-    output_path = os.path.join(OUTPUT_DIR, f'{dataset_name}.json')
-    with open(output_path, 'w') as f:
+    if output_path is None:
+        output_path = os.path.join(OUTPUT_DIR, f'{dataset_name}.json')
+    with tracing.span('serialize'), open(output_path, 'w') as f:
         json.dump(coco, f, indent=1)
 
     print(f'Wrote {len(images)} images ({n_empty} empty), {len(annotations)} annotations to {output_path}')
@@ -0,0 +1,136 @@
+"""
+Columnar conversion of CSV annotations (one row per box or point) to COCO annotations.
+
+AnnotationTable takes a DataFrame and which of its columns hold the image key, the
+geometry and the original category, and computes every row's COCO bbox or point, category
+id and original category with column operations; per-row dicts are only built by
+to_coco(), for the images that make it into the output.  Geometries:
+    'xyxy'   columns x1, y1, x2, y2 (corners)            -> bbox [x1, y1, x2 - x1, y2 - y1]
+    'xywh'   columns x, y, width, height                  -> bbox [x, y, width, height]
+    'point'  columns x, y                                 -> point [x, y]
+
+Values are converted exactly as the row-by-row code did (float() of the column values,
+differences taken in the columns' own dtype), so outputs are unchanged.
+"""
+
+import numpy as np
+import pandas as pd
+
+from conversion_config import get_category_id
+
+GEOMETRIES = {'xyxy': 4, 'xywh': 4, 'point': 2}
+
+
+class AnnotationTable:
+
+    def __init__(self, df, image_key, geometry, columns, category, original_category=None,
+                 original_category_column=None, source=None, source_column=None):
+        """
+        Args:
+            df: DataFrame with one row per annotation, indexed by each row's position in its
+                file (as pd.read_csv and csv_batch.read_csv_files give it), for error messages
+            image_key: column (or list of columns) identifying each row's image
+            geometry: 'xyxy', 'xywh' or 'point'
+            columns: names of the geometry's columns, in the order listed above
+            category: harmonized category name for every row, or a function from an
+                original category to its harmonized category name (raising KeyError for
+                one it doesn't know)
+            original_category: the original category of every row
+            original_category_column: or the column whose lowercased values are the
+                original categories
+            source: file the rows were read from, for error messages
+            source_column: or the column holding each row's file
+
+        Raises ValueError for a row whose original category is missing or not text, or
+        that category can't map, naming the file and row.
+        """
+        if geometry not in GEOMETRIES:
+            raise ValueError(f'Unknown geometry {geometry!r}, expected one of {tuple(GEOMETRIES)}')
+        if len(columns) != GEOMETRIES[geometry]:
+            raise ValueError(f'{geometry} needs {GEOMETRIES[geometry]} columns, got {columns}')
+        if (original_category is None) == (original_category_column is None):
+            raise ValueError('Give exactly one of original_category and original_category_column')
+        self.geometry = geometry
+        self._field = 'point' if geometry == 'point' else 'bbox'
+        self._df = df
+        self._source = source
+        self._source_column = source_column
+
+        values = [df[column] for column in columns]
+        if geometry == 'xyxy':
+            x1, y1, x2, y2 = values
+            values = [x1, y1, x2 - x1, y2 - y1]
+        self._coords = np.column_stack([np.asarray(v, dtype=np.float64) for v in values]) \
+            if len(df) else np.empty((0, len(values)))
+
+        # Categories are looked up once per distinct original category
+        if original_category is not None:
+            codes = np.zeros(len(df), dtype=np.int64)
+            originals = [original_category]
+        else:
+            # Distinct values are lowercased once each; missing values get code -1
+            codes, values = pd.factorize(df[original_category_column])
+            if (codes == -1).any():
+                raise ValueError(f'Missing {original_category_column} in '
+                                 f'{self._where(int(np.flatnonzero(codes == -1)[0]))}')
+            lowered = {}
+            for code, value in enumerate(values):
+                if not isinstance(value, str):
+                    raise ValueError(f'{original_category_column} {value!r} is not text, in '
+                                     f'{self._where(int(np.flatnonzero(codes == code)[0]))}')
+                lowered.setdefault(value.lower(), len(lowered))
+            codes = np.asarray([lowered[value.lower()] for value in values], dtype=np.int64)[codes]
+            originals = list(lowered)
+        category_ids = []
+        for code, original in enumerate(originals):
+            try:
+                category_ids.append(get_category_id(category(original) if callable(category) else category))
+            except KeyError:
+                position = int(np.flatnonzero(codes == code)[0])
+                raise ValueError(f'No category for {original!r} in {self._where(position)}') from None
+        self._category_ids = np.asarray(category_ids, dtype=np.int64)[codes]
+        self._originals = np.asarray(originals, dtype=object)[codes]
+
+        # key -> row positions, in file order
+        self._rows = df.groupby(image_key, sort=True).indices if len(df) else {}
+
+    def _where(self, position):
+        """The file and row of the row at position, for error messages."""
+        source = self._source
+        if self._source_column is not None:
+            source = self._df[self._source_column].iloc[position]
+        where = f'row {self._df.index[position]}'
+        return where if source is None else f'{source}, {where}'
+
+    def __len__(self):
+        return len(self._coords)
+
+    def keys(self):
+        """Image keys, sorted."""
+        return list(self._rows.keys())
+
+    def n_rows(self, key):
+        return len(self._rows[key])
+
+    def to_coco(self, image_ids, ann_id):
+        """
+        COCO annotations for the images in image_ids ({key: image id}), in that order and
+        in file order within each image, numbered from ann_id + 1.
+
+        Returns (annotations, the last annotation id used).
+        """
+        coords = self._coords.tolist()
+        category_ids = self._category_ids.tolist()
+        originals = self._originals.tolist()
+        annotations = []
+        for key, image_id in image_ids.items():
+            for row in self._rows[key].tolist():
+                ann_id += 1
+                annotations.append({
+                    'id': ann_id,
+                    'image_id': image_id,
+                    'category_id': category_ids[row],
+                    self._field: coords[row],
+                    'original_category': originals[row],
+                })
+        return annotations, ann_id
@@ -0,0 +1,87 @@
+"""
+Batched reader for datasets with a small CSV file per image.
+
+Calling pd.read_csv() once per file costs far more than parsing the few rows in each, so
+read_csv_files() reads the files' contents on a pool of READ_THREADS threads (on a network
+share, reading is dominated by per-file round trips), joins the files that share a header
+into one text with each row prefixed by the index of its file, and parses that with a
+single pd.read_csv() call.  The result is one DataFrame with a file_index column, rows in
+file order and indexed by their position in their file, ready to be grouped by file (e.g.
+by csv_annotations.AnnotationTable).
+
+Column types are inferred over all the files at once, so a column that holds integers in
+some files and decimals in others is float64 throughout; values are unchanged.  Files
+containing a quote character (whose fields may span lines) are parsed on their own.
+Blank lines are skipped; a file with no rows is reported with a warning.  Only empty fields
+are missing values: text like NA or null, which pd.read_csv would turn into NaN by default,
+is kept as it is, since here it can be a real label.
+"""
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import tracing
+
+# Threads reading files
+READ_THREADS = 16
+
+FILE_INDEX = 'file_index'
+
+# Only empty fields are missing values (see above)
+_READ_OPTIONS = {'keep_default_na': False, 'na_values': ['']}
+
+
+def _read_text(path):
+    # utf-8-sig, as pd.read_csv skips a byte order mark too
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return f.read()
+
+
+def read_csv_files(paths, columns=None, max_workers=READ_THREADS):
+    """
+    Read many small CSV files (each with a header row) into one DataFrame.
+
+    Args:
+        paths: CSV files
+        columns: if given, only these columns (plus file_index) are kept
+        max_workers: number of threads reading files
+
+    Returns a DataFrame with a file_index column holding the index in paths of the file
+    each row came from, indexed by each row's position in its file.
+    """
+    with tracing.span('parse', f'{len(paths)} csv files'):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            texts = list(executor.map(_read_text, paths))
+
+        # header -> lines of the files with that header, each prefixed with its file's index
+        batches = {}
+        frames = []
+        for i, text in enumerate(texts):
+            lines = [line for line in text.splitlines() if line.strip()]
+            if len(lines) < 2:
+                print(f'WARNING: {paths[i]} has no rows')
+                continue
+            if '"' in text:
+                df = pd.read_csv(io.StringIO(text), **_READ_OPTIONS)
+                if len(df) == 0:
+                    print(f'WARNING: {paths[i]} has no rows')
+                    continue
+                df.insert(0, FILE_INDEX, i)
+                frames.append(df)
+                continue
+            batch = batches.setdefault(lines[0], [f'{FILE_INDEX},{lines[0]}'])
+            batch.extend(f'{i},{line}' for line in lines[1:])
+        for lines in batches.values():
+            frames.append(pd.read_csv(io.StringIO('\n'.join(lines)), **_READ_OPTIONS))
+
+    if not frames:
+        return pd.DataFrame(columns=[FILE_INDEX] + list(columns or []))
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    if columns is not None:
+        df = df[[FILE_INDEX] + list(columns)]
+    # Batches hold files in order, but several batches interleave
+    df = df.sort_values(FILE_INDEX, kind='stable', ignore_index=True)
+    df.index = df.groupby(FILE_INDEX).cumcount().to_numpy()
+    return df
@@ -0,0 +1,283 @@
+"""
+In-memory index of a dataset's source tree, built in one os.scandir pass.  Directories
+are listed on a pool of WALK_THREADS threads, each directory's subdirectories being
+queued as soon as it has been listed, since on a NAS enumerating a deep, wide tree is
+dominated by per-directory round trips.
+
+Converters use it instead of globbing for files and calling os.path.isfile() on every
+image, which on the I: drive costs a round trip per call.  Lookups follow the platform's
+rules, as os.path.isfile() would: case-insensitive on Windows, exact elsewhere.
+relpaths() lists files by extension and exclusion pattern; like glob, it skips names
+starting with '.'.  resolve() finds the file a path refers to regardless of case, for
+annotations written on Windows whose paths don't match the case on disk once the data is
+on Linux; its lowercase lookup table is built once, on first use.
+
+dataset_index() also keeps the listing in a manifest, CACHE_DIR/dir_manifests/<dataset>.json,
+holding each directory's mtime and the names in it.  The next index of the same tree
+stats each known directory and only lists those whose mtime has changed (adding, removing
+or renaming an entry changes its directory's mtime), so for an unchanged tree it costs one
+stat per directory rather than a listing of every file.  Editing a file in place doesn't
+change its directory's mtime, so the manifest only records which files exist; signature()
+stats the file itself.
+
+The index is a snapshot; it doesn't see files created after it was built.
+"""
+
+import fnmatch
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from conversion_config import DATA_ROOT, CACHE_DIR
+
+MANIFEST_DIR = os.path.join(CACHE_DIR, 'dir_manifests')
+
+# Threads used to stat and list directories
+WALK_THREADS = 16
+
+
+class DirectoryIndex:
+
+    def __init__(self, root, manifest_file=None, max_workers=WALK_THREADS, save_manifest=True):
+        """
+        Args:
+            root: directory to index
+            manifest_file: if given, reuse the listings recorded in this file for directories
+                that haven't changed, and record the new ones in it
+            max_workers: number of threads listing directories (and stat'ing files in signatures())
+            save_manifest: if False, only read manifest_file, leaving it as it was
+        """
+        self.root = root
+        self.manifest_file = manifest_file
+        self.max_workers = max_workers
+        # rel_dir ('' for root) -> {'mtime_ns', 'dirs': subdirectory names, 'walked': the
+        # subdirectories listed too, 'files': file names}, names sorted
+        self._listings = {}
+        # Directories actually listed, as opposed to reused from the manifest
+        self.n_listed = 0
+        self._walk(self._load_manifest())
+        if manifest_file is not None and save_manifest:
+            self._save_manifest()
+        # Lookup keys, normalized with os.path.normcase
+        self._dirs = {os.path.normcase(rel_dir): rel_dir for rel_dir in self._listings}
+        self._files = {os.path.normcase(os.path.join(rel_dir, name))
+                       for rel_dir, listing in self._listings.items() for name in listing['files']}
+        # Lowercased relative path -> relative paths of the files it matches, for resolve()
+        self._by_lower = None
+
+    def _load_manifest(self):
+        if self.manifest_file is None or not os.path.isfile(self.manifest_file):
+            return {}
+        try:
+            with open(self.manifest_file, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            print(f'WARNING: ignoring unreadable directory manifest {self.manifest_file}')
+            return {}
+        if manifest.get('root') != os.path.abspath(self.root):
+            return {}
+        return manifest['listings']
+
+    def _save_manifest(self):
+        os.makedirs(os.path.dirname(self.manifest_file), exist_ok=True)
+        # Per process, as chunks of a dataset can be converted in parallel
+        tmp_file = f'{self.manifest_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'root': os.path.abspath(self.root), 'listings': self._listings}, f)
+        os.replace(tmp_file, self.manifest_file)
+
+    def _list(self, rel_dir, mtime_ns):
+        listing = {'mtime_ns': mtime_ns, 'dirs': [], 'walked': [], 'files': []}
+        try:
+            with os.scandir(os.path.join(self.root, rel_dir)) as it:
+                for entry in it:
+                    # Like os.walk, symlinks to directories are listed but not followed
+                    if entry.is_dir():
+                        listing['dirs'].append(entry.name)
+                        if not entry.is_symlink():
+                            listing['walked'].append(entry.name)
+                    elif entry.is_file():
+                        listing['files'].append(entry.name)
+        except PermissionError:
+            print(f'WARNING: could not list {os.path.join(self.root, rel_dir)}')
+        listing['dirs'].sort()
+        listing['walked'].sort()
+        listing['files'].sort()
+        return listing
+
+    def _visit(self, rel_dir, previous):
+        """The listing of rel_dir, reused from previous if unchanged, and whether it had to be listed."""
+        mtime_ns = os.stat(os.path.join(self.root, rel_dir)).st_mtime_ns
+        listing = previous.get(rel_dir)
+        if listing is not None and listing['mtime_ns'] == mtime_ns:
+            # Manifests written before they only held names had {name: [size, mtime_ns]}
+            return dict(listing, files=sorted(listing['files'])), False
+        return self._list(rel_dir, mtime_ns), True
+
+    def _walk(self, previous):
+        if not os.path.isdir(self.root):
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {executor.submit(self._visit, '', previous): ''}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rel_dir = running.pop(future)
+                    listing, listed = future.result()
+                    self._listings[rel_dir] = listing
+                    self.n_listed += listed
+                    for name in listing['walked']:
+                        sub_dir = os.path.join(rel_dir, name)
+                        running[executor.submit(self._visit, sub_dir, previous)] = sub_dir
+        # Directories finish in no particular order
+        self._listings = dict(sorted(self._listings.items()))
+
+    def _relpath(self, path):
+        """path (absolute, or relative to root) relative to root, or None if outside root."""
+        rel = os.path.normpath(os.path.relpath(os.path.join(self.root, path), self.root))
+        if rel == os.curdir:
+            return ''
+        if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            return None
+        return rel
+
+    def _relative(self, path):
+        """path (absolute, or relative to root) as a normalized key, or None if outside root."""
+        rel = self._relpath(path)
+        return None if rel is None else os.path.normcase(rel)
+
+    def isfile(self, path):
+        """Whether path (absolute, or relative to root) is a file, as of when the index was built."""
+        rel = self._relative(path)
+        if rel is None:
+            return os.path.isfile(path)
+        return rel in self._files
+
+    def signature(self, path):
+        """
+        (size, mtime_ns) of the file at path (absolute, or relative to root), from a stat of
+        the file now, or None if it isn't there.  Not from the listing, which can predate
+        an edit in place.
+        """
+        rel = self._relative(path)
+        if rel is not None and rel not in self._files:
+            return None
+        try:
+            st = os.stat(os.path.join(self.root, path))
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def signatures(self, paths):
+        """signature() of each of paths, stat'ed on max_workers threads."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self.signature, paths))
+
+    def dir_mtimes(self):
+        """{directory relative to root ('' for root): its mtime_ns when the index was built}."""
+        return {rel_dir: listing['mtime_ns'] for rel_dir, listing in self._listings.items()}
+
+    def isdir(self, path):
+        rel = self._relative(path)
+        if rel is None:
+            return os.path.isdir(path)
+        return rel in self._dirs
+
+    def resolve(self, path):
+        """
+        The file path (absolute, or relative to root) refers to, joined onto root with its
+        case as on disk.  A differently-cased path matches if there's no exact match.
+        Returns None if there is no such file, or if path matches several files that differ
+        only in case.
+        """
+        rel = self._relpath(path)
+        if rel is None:
+            return path if os.path.isfile(path) else None
+        if self._by_lower is None:
+            self._by_lower = {}
+            for rel_dir, listing in self._listings.items():
+                for name in listing['files']:
+                    file_rel = os.path.join(rel_dir, name)
+                    self._by_lower.setdefault(file_rel.lower(), []).append(file_rel)
+        matches = self._by_lower.get(rel.lower(), [])
+        if rel in matches:
+            return os.path.join(self.root, rel)
+        if len(matches) == 1:
+            return os.path.join(self.root, matches[0])
+        return None
+
+    def listdir(self, path=''):
+        """Names of the files in a directory (absolute, or relative to root), sorted; [] if there is no such directory."""
+        rel = self._relative(path)
+        if rel is None:
+            raise ValueError(f'{path} is outside {self.root}')
+        if rel not in self._dirs:
+            return []
+        return list(self._listings[self._dirs[rel]]['files'])
+
+    def relpaths(self, extensions=None, exclude=(), under=''):
+        """
+        Sorted paths, relative to root and with forward slashes, of the files under a
+        directory, recursively.
+
+        Args:
+            extensions: if given, only files ending with one of these (e.g. ('.jpg', '.png')),
+                ignoring case
+            exclude: fnmatch patterns for file names to leave out (e.g. ('classes.txt',))
+            under: directory to list (absolute, or relative to root)
+        """
+        rel = self._relative(under)
+        if rel is None:
+            raise ValueError(f'{under} is outside {self.root}')
+        if extensions is not None:
+            extensions = tuple(ext.lower() for ext in extensions)
+        paths = []
+        for rel_dir, listing in self._listings.items():
+            key = os.path.normcase(rel_dir)
+            if rel and key != rel and not key.startswith(rel + os.sep):
+                continue
+            if any(part.startswith('.') for part in rel_dir.split(os.sep)):
+                continue
+            prefix = rel_dir.replace(os.sep, '/') + '/' if rel_dir else ''
+            for name in listing['files']:
+                if name.startswith('.'):
+                    continue
+                if extensions is not None and not name.lower().endswith(extensions):
+                    continue
+                if any(fnmatch.fnmatch(name, pattern) for pattern in exclude):
+                    continue
+                paths.append(prefix + name)
+        return sorted(paths)
+
+    def find_file(self, base, extensions):
+        """base + the first of extensions that makes an existing file, or None."""
+        for ext in extensions:
+            if self.isfile(base + ext):
+                return base + ext
+        return None
+
+    def walk(self, top=''):
+        """
+        Like os.walk(), from the index: (dirpath, dirnames, filenames) for top (absolute,
+        or relative to root) and every directory below it.
+        """
+        rel = self._relative(top)
+        if rel is None:
+            raise ValueError(f'{top} is outside {self.root}')
+        for rel_dir, listing in self._listings.items():
+            key = os.path.normcase(rel_dir)
+            if not rel or key == rel or key.startswith(rel + os.sep):
+                dirpath = os.path.join(self.root, rel_dir) if rel_dir else self.root
+                yield dirpath, list(listing['dirs']), list(listing['files'])
+
+
+def dataset_index(dataset_name, save_manifest=True):
+    """
+    Index of DATA_ROOT/<dataset_name>, kept up to date incrementally in its manifest (read
+    but not updated if save_manifest is False, e.g. for a dry run).
+    """
+    index = DirectoryIndex(os.path.join(DATA_ROOT, dataset_name),
+                           os.path.join(MANIFEST_DIR, f'{dataset_name}.json'), save_manifest=save_manifest)
+    print(f'Indexed {dataset_name}: listed {index.n_listed} of {len(index._listings)} directories '
+          f'(the rest were unchanged since the last run)')
+    return index
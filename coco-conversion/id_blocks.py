@@ -0,0 +1,90 @@
+"""
+Fixed ranges of image and annotation IDs for each dataset.
+
+By default every converter numbers its images and annotations from 1, and
+merge_datasets.py renumbers everything as it combines the files.  With GLOBAL_IDS = True
+in conversion_config.py, each converter instead numbers from the start of its dataset's
+block, so IDs are already unique across datasets when they're written.  The merge then
+concatenates the files as they are, and an image keeps its ID from one rebuild to the
+next as long as its dataset doesn't change.
+
+Blocks are laid out in ID_BLOCKS order.  Add new datasets at the end, and don't change
+the capacity of an existing entry: either one moves every later block.
+"""
+
+from conversion_config import GLOBAL_IDS
+
+# (dataset, image capacity, annotation capacity).  The total stays well under 2**31, so
+# IDs still fit in a 32-bit integer.
+ID_BLOCKS = [
+    ('eikelboom-savanna', 1_000_000, 10_000_000),
+    ('qian-penguins', 1_000_000, 10_000_000),
+    ('gray-turtles', 1_000_000, 10_000_000),
+    ('aerial-elephants', 1_000_000, 10_000_000),
+    ('weinstein-birds', 1_000_000, 10_000_000),
+    ('hayes-seabirds', 1_000_000, 10_000_000),
+    ('shao-cattle', 1_000_000, 10_000_000),
+    ('naik-bucktales', 1_000_000, 10_000_000),
+    ('koger-drones', 1_000_000, 10_000_000),
+    ('kabra-birds', 1_000_000, 10_000_000),
+    ('mmla-opc', 1_000_000, 10_000_000),
+    ('mmla-wilds', 1_000_000, 10_000_000),
+    ('mmla-mpala', 1_000_000, 10_000_000),
+    ('waid-drones', 1_000_000, 10_000_000),
+    ('delplanque-mammals', 1_000_000, 10_000_000),
+    ('reinhard-savmap', 1_000_000, 10_000_000),
+    ('price-zebras', 1_000_000, 10_000_000),
+]
+
+
+def _layout():
+    blocks = {}
+    image_base = 0
+    ann_base = 0
+    for dataset, image_capacity, ann_capacity in ID_BLOCKS:
+        blocks[dataset] = {
+            'image_ids': [image_base + 1, image_base + image_capacity],
+            'annotation_ids': [ann_base + 1, ann_base + ann_capacity],
+        }
+        image_base += image_capacity
+        ann_base += ann_capacity
+    return blocks
+
+
+# dataset -> {'image_ids': [first, last], 'annotation_ids': [first, last]}
+BLOCKS = _layout()
+
+
+def first_ids(dataset):
+    """
+    Starting values for a converter's image and annotation ID counters, which it
+    increments before assigning each ID: (0, 0) unless GLOBAL_IDS is set.
+    """
+    if not GLOBAL_IDS:
+        return 0, 0
+    block = BLOCKS[dataset]
+    return block['image_ids'][0] - 1, block['annotation_ids'][0] - 1
+
+
+def finish(dataset, coco):
+    """
+    With GLOBAL_IDS, check that a converter's IDs fit in its dataset's block and record
+    the block in coco['info'], which the merge checks before skipping the renumbering.
+    """
+    if not GLOBAL_IDS:
+        return coco
+    block = BLOCKS[dataset]
+    for key, items in (('image_ids', coco['images']), ('annotation_ids', coco['annotations'])):
+        first, last = block[key]
+        if items and not all(first <= item['id'] <= last for item in items):
+            raise ValueError(f'{dataset} has more {key.split("_")[0]}s than its ID block holds '
+                             f'({last - first + 1}); increase its capacity in id_blocks.ID_BLOCKS '
+                             f'(which moves the blocks after it)')
+    coco['info'] = {'id_block': dataset, **block}
+    return coco
+
+
+def has_global_ids(dataset, coco):
+    """True if coco was written with the current ID block for dataset."""
+    info = coco.get('info', {})
+    return dataset in BLOCKS and info == {'id_block': dataset, **BLOCKS[dataset]}
@@ -0,0 +1,274 @@
+"""
+Persistent cache of image metadata, so that re-running a converter doesn't open images
+that haven't changed since they were last probed.
+
+Each image's width, height, format, mode and byte size (and, if asked for, SHA-256 of its
+contents) are stored in an SQLite database, DB_DIR/image_metadata.sqlite, keyed by the
+image's path relative to DATA_ROOT.  An entry is only used if the image's size and mtime
+still match the ones it was recorded with, so a stat is all an unchanged image costs.
+
+Converters call get_image_sizes() with every image they need, which looks them all up
+and probes the rest on a pool of conversion_config.PROBE_THREADS threads (probing is
+dominated by I/O latency, especially on network shares and spinning disks, so threads
+overlap well), or
+get_image_size() for a single image.  Both use one store per process.  New entries are
+buffered in memory and written in one short transaction (so that converters running in
+parallel don't hold the database locked for long) every COMMIT_INTERVAL new images, when
+the process exits, and when flush() is called (run_all.py does this after each converter,
+since worker processes exit without running atexit handlers).
+"""
+
+import atexit
+import hashlib
+import os
+import pathlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+import tracing
+from conversion_config import DATA_ROOT, DB_DIR, PROBE_THREADS
+from image_size import get_image_info
+from io_order import physical_order
+from staging import staged_copy
+
+DB_FILE = os.path.join(DB_DIR, 'image_metadata.sqlite')
+
+COMMIT_INTERVAL = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    format TEXT,
+    mode TEXT,
+    sha256 TEXT
+)
+"""
+
+_FIELDS = ('width', 'height', 'format', 'mode', 'size', 'sha256')
+
+
+def relative_key(path):
+    """The key for an image: its path relative to DATA_ROOT with forward slashes (or its absolute path if outside)."""
+    abs_path = os.path.abspath(path)
+    try:
+        rel_path = os.path.relpath(abs_path, DATA_ROOT)
+    except ValueError:
+        # On a different drive than DATA_ROOT
+        return abs_path.replace('\\', '/')
+    if rel_path.startswith('..'):
+        return abs_path.replace('\\', '/')
+    return rel_path.replace('\\', '/')
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ImageMetadataStore:
+
+    def __init__(self, db_file=DB_FILE, read_only=False):
+        """
+        Args:
+            db_file: SQLite database, created if it doesn't exist (unless read_only)
+            read_only: open an existing database without creating or writing anything, e.g.
+                for a dry run; raises sqlite3.OperationalError if there isn't one
+        """
+        # key -> row waiting to be written
+        self._pending = {}
+        if read_only:
+            self._conn = sqlite3.connect(f'{pathlib.Path(os.path.abspath(db_file)).as_uri()}?mode=ro', uri=True)
+            return
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        # Converters running in parallel share the database; wait for each other's commits
+        self._conn = sqlite3.connect(db_file, timeout=60)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def lookup(self, path, st=None):
+        """
+        The stored metadata for the image at path as a dict, or None if there is none or
+        the image has changed since it was recorded.
+
+        Args:
+            path: image file
+            st: os.stat() result for path, if the caller already has one
+        """
+        if st is None:
+            st = os.stat(path)
+        key = relative_key(path)
+        if key in self._pending:
+            row = self._pending[key][1:]
+        else:
+            row = self._conn.execute(
+                'SELECT size, mtime_ns, width, height, format, mode, sha256 FROM images WHERE path = ?',
+                (key,)).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return None
+        return dict(zip(_FIELDS, row[2:6] + (row[0], row[6])))
+
+    def signatures(self, rel_dir):
+        """{key: (size, mtime_ns)} for every stored image under rel_dir (relative to DATA_ROOT)."""
+        rows = self._conn.execute('SELECT path, size, mtime_ns FROM images WHERE substr(path, 1, ?) = ?',
+                                  (len(rel_dir) + 1, rel_dir + '/'))
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def record(self, path, st, info):
+        """Store metadata (a dict with _FIELDS) for the image at path, as of st."""
+        key = relative_key(path)
+        self._pending[key] = (key, st.st_size, st.st_mtime_ns, info['width'], info['height'],
+                              info.get('format'), info.get('mode'), info.get('sha256'))
+        if len(self._pending) >= COMMIT_INTERVAL:
+            self.commit()
+
+    def get(self, path, with_hash=False):
+        """
+        Metadata for the image at path: from the store if the image is unchanged, otherwise
+        read from the image's header and stored.
+
+        Args:
+            path: image file
+            with_hash: also return the SHA-256 of the file's contents (computed and stored
+                if it hasn't been before)
+        """
+        st = os.stat(path)
+        info = self.lookup(path, st)
+        if info is not None and (info['sha256'] is not None or not with_hash):
+            return info
+        if info is None:
+            info = get_image_info(path)
+            info['size'] = st.st_size
+            info['sha256'] = None
+        if with_hash:
+            info['sha256'] = _sha256(path)
+        self.record(path, st, info)
+        return info
+
+    def commit(self):
+        if self._pending:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO images (path, size, mtime_ns, width, height, format, mode, sha256) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', self._pending.values())
+            self._pending = {}
+
+    def close(self):
+        self.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+_store = None
+
+
+def default_store():
+    """This process's shared store, opened on first use."""
+    global _store
+    if _store is None:
+        _store = ImageMetadataStore()
+        atexit.register(flush)
+    return _store
+
+
+def flush():
+    """Commit anything recorded in this process's shared store."""
+    if _store is not None:
+        _store.commit()
+
+
+def get_image_size(path):
+    """(width, height) of the image at path, opening it only if it isn't in the store."""
+    info = default_store().get(path)
+    return info['width'], info['height']
+
+
+def _stat(path):
+    try:
+        return os.stat(path)
+    except OSError as e:
+        return e
+
+
+def _probe(item):
+    path, st = item
+    try:
+        # From the local staging cache, if the image happens to be there
+        return get_image_info(staged_copy(path, st))
+    except Exception as e:
+        return e
+
+
+def probe_batch(paths, max_workers=PROBE_THREADS, desc=None):
+    """
+    Metadata for each of paths, in order.  Images that are in the store and unchanged are
+    looked up; the rest are probed on a pool of max_workers threads, in the order set by
+    IO_ORDER, and stored.
+
+    Returns a list with, for each path, the metadata dict (as from ImageMetadataStore.get)
+    or the exception raised while reading that file.
+
+    Args:
+        paths: image files
+        max_workers: number of threads
+        desc: if given, show a progress bar with this label
+    """
+    store = default_store()
+    results = [None] * len(paths)
+    with tracing.span('probe', n_images=len(paths)), \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Stats are as latency-bound as the probes, so they go through the pool too; the
+        # store is only used from this thread
+        to_probe = []
+        for i, st in enumerate(executor.map(_stat, paths)):
+            if isinstance(st, OSError):
+                results[i] = st
+                continue
+            info = store.lookup(paths[i], st)
+            if info is not None:
+                results[i] = info
+            else:
+                to_probe.append((i, st))
+        # Read in physical order if so configured; results still go back by index
+        order = physical_order([paths[i] for i, _ in to_probe], [st for _, st in to_probe])
+        to_probe = [to_probe[j] for j in order]
+
+        probed = executor.map(_probe, [(paths[i], st) for i, st in to_probe])
+        if desc is not None:
+            probed = tqdm(probed, total=len(to_probe), desc=desc)
+        # Results are stored as they arrive, so the store's periodic commits cover an
+        # interrupted batch
+        for (i, st), info in zip(to_probe, probed):
+            if not isinstance(info, Exception):
+                info['size'] = st.st_size
+                info['sha256'] = None
+                store.record(paths[i], st, info)
+            results[i] = info
+    return results
+
+
+def get_image_sizes(paths, max_workers=PROBE_THREADS, desc=None):
+    """
+    (width, height) for each of paths, in order, probing on a thread pool as in
+    probe_batch().  Raises OSError listing every file that couldn't be read.
+    """
+    results = probe_batch(paths, max_workers, desc)
+    errors = [(path, result) for path, result in zip(paths, results) if isinstance(result, Exception)]
+    if errors:
+        for path, e in errors[:20]:
+            print(f'  {path}: {e!r}')
+        raise OSError(f'Could not read the dimensions of {len(errors)} images (first {min(len(errors), 20)} above)')
+    return [(info['width'], info['height']) for info in results]
@@ -0,0 +1,131 @@
+"""
+Read image dimensions from file headers, without decoding (or building a PIL image for)
+the file.
+
+JPEG, PNG and TIFF headers are parsed directly: this reads the PNG IHDR chunk, the first
+TIFF IFD, or JPEG segment headers up to the first SOF marker (skipping over EXIF and
+other segments by their lengths), which is usually a few KB.  Anything else, or a header
+that can't be parsed, falls back to PIL.
+
+Like PIL's Image.size, the dimensions are as stored in the file, i.e. EXIF orientation
+is not applied.
+"""
+
+import struct
+
+from PIL import Image
+
+# SOF markers, which carry the frame size; 0xC4 (DHT), 0xC8 (JPG) and 0xCC (DAC) share the range
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# PIL modes for the number of JPEG components / PNG color types (at 8 bits per sample)
+_JPEG_MODES = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+_PNG_MODES = {0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+
+# TIFF field types for the ImageWidth / ImageLength tags
+_TIFF_SHORT = 3
+_TIFF_LONG = 4
+
+
+def _jpeg_info(f):
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        # Markers can be preceded by any number of 0xFF fill bytes
+        while marker[1] == 0xFF:
+            marker = marker[1:] + f.read(1)
+            if len(marker) < 2:
+                return None
+        code = marker[1]
+        if code == 0xD9:
+            # End of image
+            return None
+        if code == 0x01 or 0xD0 <= code <= 0xD7:
+            # Standalone markers without a length
+            continue
+        header = f.read(2)
+        if len(header) < 2:
+            return None
+        length = struct.unpack('>H', header)[0]
+        if code in _JPEG_SOF_MARKERS:
+            frame = f.read(6)
+            if len(frame) < 6:
+                return None
+            precision, h, w, n_components = struct.unpack('>BHHB', frame)
+            mode = _JPEG_MODES.get(n_components) if precision == 8 else None
+            return {'width': w, 'height': h, 'format': 'JPEG', 'mode': mode}
+        if code == 0xDA or length < 2:
+            # Start of scan without a frame header, or a corrupt length
+            return None
+        f.seek(length - 2, 1)
+
+
+def _png_info(header):
+    if len(header) < 26 or header[12:16] != b'IHDR':
+        return None
+    w, h, bit_depth, color_type = struct.unpack('>IIBB', header[16:26])
+    mode = _PNG_MODES.get(color_type) if bit_depth == 8 else None
+    return {'width': w, 'height': h, 'format': 'PNG', 'mode': mode}
+
+
+def _tiff_info(f, header):
+    endian = '<' if header[:2] == b'II' else '>'
+    if struct.unpack(f'{endian}H', header[2:4])[0] != 42:
+        # BigTIFF (43) is left to PIL
+        return None
+    ifd_offset = struct.unpack(f'{endian}I', header[4:8])[0]
+    f.seek(ifd_offset)
+    count_bytes = f.read(2)
+    if len(count_bytes) < 2:
+        return None
+    n_entries = struct.unpack(f'{endian}H', count_bytes)[0]
+    entries = f.read(12 * n_entries)
+    values = {}
+    for i in range(len(entries) // 12):
+        tag, field_type, count = struct.unpack(f'{endian}HHI', entries[12 * i:12 * i + 8])
+        if tag not in (256, 257) or count != 1:
+            continue
+        if field_type == _TIFF_SHORT:
+            values[tag] = struct.unpack(f'{endian}H', entries[12 * i + 8:12 * i + 10])[0]
+        elif field_type == _TIFF_LONG:
+            values[tag] = struct.unpack(f'{endian}I', entries[12 * i + 8:12 * i + 12])[0]
+    if 256 not in values or 257 not in values:
+        return None
+    # The mode depends on several more tags; not worth working out here
+    return {'width': values[256], 'height': values[257], 'format': 'TIFF', 'mode': None}
+
+
+def _header_info(f):
+    header = f.read(26)
+    if header[:2] == b'\xff\xd8':
+        return _jpeg_info(f)
+    if header[:8] == b'\x89PNG\r\n\x1a\n':
+        return _png_info(header)
+    if header[:2] in (b'II', b'MM') and len(header) >= 8:
+        return _tiff_info(f, header)
+    return None
+
+
+def get_image_info(path):
+    """
+    Dimensions and type of the image at path, as a dict with 'width', 'height', 'format'
+    (PIL's format name) and 'mode' (PIL's mode, or None where the header doesn't make it
+    obvious).
+    """
+    with open(path, 'rb') as f:
+        try:
+            info = _header_info(f)
+        except struct.error:
+            info = None
+    if info is not None and info['width'] > 0 and info['height'] > 0:
+        return info
+    with Image.open(path) as im:
+        return {'width': im.width, 'height': im.height, 'format': im.format, 'mode': im.mode}
+
+
+def get_image_size(path):
+    """(width, height) of the image at path."""
+    info = get_image_info(path)
+    return info['width'], info['height']
@@ -0,0 +1,148 @@
+"""
+Per-label-file cache for the YOLO-format converters (the mmla datasets and waid-drones).
+
+For each label file, the parsed labels (as from yolo_labels.read_yolo_labels) and the
+dimensions of its image are stored in an SQLite database, DB_DIR/label_cache.sqlite,
+along with the size and mtime of both files.  read_labels() takes them from the cache for
+every label file whose signature and image's signature still match, and only parses and
+probes the rest, so adding a few hundred frames to a dataset of tens of thousands costs a
+few hundred file reads; the output is then assembled from the cached and the new results.
+
+Signatures come from a stat of both files on every run (on a pool of STAT_THREADS threads,
+as stats on the NAS are latency-bound), not from a directory listing, which can predate an
+edit in place; an unchanged frame costs two stats.  Entries are written as soon as the new
+files have been read, so an interrupted conversion doesn't lose them.
+
+Deleting the database just means every label file is read (and every image looked up in
+the image metadata store) again.
+"""
+
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import tracing
+from conversion_config import DB_DIR
+from image_metadata import get_image_sizes, relative_key
+from yolo_labels import read_yolo_labels
+
+DB_FILE = os.path.join(DB_DIR, 'label_cache.sqlite')
+
+# Threads used to stat label files and images
+STAT_THREADS = 16
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS label_files (
+    path TEXT PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    image_size INTEGER NOT NULL,
+    image_mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    n_lines INTEGER NOT NULL,
+    class_ids BLOB NOT NULL,
+    boxes BLOB NOT NULL
+)
+"""
+
+
+def _connect(db_file):
+    os.makedirs(os.path.dirname(db_file), exist_ok=True)
+    # Chunks of a dataset converted in parallel share the database; wait for each other's commits
+    conn = sqlite3.connect(db_file, timeout=60)
+    conn.execute(_SCHEMA)
+    conn.execute('CREATE INDEX IF NOT EXISTS label_files_dataset ON label_files (dataset)')
+    conn.commit()
+    return conn
+
+
+def _signature(files):
+    """(size, mtime_ns) of a label file followed by those of its image."""
+    signature = ()
+    for path in files:
+        st = os.stat(path)
+        signature += (st.st_size, st.st_mtime_ns)
+    return signature
+
+
+def read_labels(dataset_name, labelled, probe_empty=True, prune=False, db_file=DB_FILE):
+    """
+    Labels and image dimensions for a dataset's label files, from the cache where possible.
+
+    Returns (class_ids, boxes, offsets, n_lines, sizes): the first four as from
+    read_yolo_labels(), and (width, height) of each file's image, or None for images whose
+    label files are empty when probe_empty is False.
+
+    Args:
+        dataset_name: shortcode, to group cache entries by
+        labelled: list of (label file, image file)
+        probe_empty: get the dimensions of images whose label files are empty too
+        prune: drop cache entries for this dataset's label files that aren't in labelled
+            (only when labelled is the whole dataset, not a chunk of it)
+    """
+    keys = [relative_key(label_file) for label_file, _ in labelled]
+    with tracing.span('scan', 'stat label files'), ThreadPoolExecutor(max_workers=STAT_THREADS) as executor:
+        signatures = list(executor.map(_signature, labelled))
+
+    conn = _connect(db_file)
+    with tracing.span('scan', 'label cache'):
+        cached = {}
+        for row in conn.execute('SELECT path, size, mtime_ns, image_size, image_mtime_ns, width, height, n_lines, '
+                                'class_ids, boxes FROM label_files WHERE dataset = ?', (dataset_name,)):
+            cached[row[0]] = row[1:]
+
+    # Per file: (n_lines, class_ids, boxes, size)
+    results = [None] * len(labelled)
+    to_read = []
+    for i, (key, signature) in enumerate(zip(keys, signatures)):
+        row = cached.get(key)
+        if row is not None and row[:4] == signature and (row[4] is not None or (not probe_empty and row[6] == 0)):
+            width, height, n_lines, class_ids, boxes = row[4:]
+            results[i] = (n_lines, np.frombuffer(class_ids, dtype=np.int64),
+                          np.frombuffer(boxes, dtype=np.float64).reshape(-1, 4),
+                          None if width is None else (width, height))
+        else:
+            to_read.append(i)
+    print(f'{len(labelled) - len(to_read)} label files unchanged since the last run, {len(to_read)} to read')
+
+    if to_read:
+        with tracing.span('parse'):
+            class_ids, boxes, offsets, n_lines = read_yolo_labels([labelled[i][0] for i in to_read])
+        to_probe = [j for j in range(len(to_read)) if probe_empty or n_lines[j] > 0]
+        # Images probed before an interruption are in the image metadata store, so a rerun
+        # picks up where this left off
+        probed = get_image_sizes([labelled[to_read[j]][1] for j in to_probe], desc='Probing images')
+        sizes = [None] * len(to_read)
+        for j, size in zip(to_probe, probed):
+            sizes[j] = size
+
+        rows = []
+        for j, i in enumerate(to_read):
+            file_class_ids = class_ids[offsets[j]:offsets[j + 1]]
+            file_boxes = boxes[offsets[j]:offsets[j + 1]]
+            results[i] = (int(n_lines[j]), file_class_ids, file_boxes, sizes[j])
+            width, height = sizes[j] if sizes[j] is not None else (None, None)
+            rows.append((keys[i], dataset_name) + signatures[i]
+                        + (width, height, int(n_lines[j]), file_class_ids.tobytes(), file_boxes.tobytes()))
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO label_files (path, dataset, size, mtime_ns, image_size, '
+                             'image_mtime_ns, width, height, n_lines, class_ids, boxes) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    if prune:
+        stale = [(key,) for key in cached.keys() - set(keys)]
+        if stale:
+            with conn:
+                conn.executemany('DELETE FROM label_files WHERE path = ?', stale)
+    conn.close()
+
+    n_labels = [len(file_class_ids) for _, file_class_ids, _, _ in results]
+    offsets = np.concatenate([[0], np.cumsum(n_labels)]).astype(np.int64)
+    class_ids = np.concatenate([file_class_ids for _, file_class_ids, _, _ in results] or [np.empty(0, np.int64)])
+    boxes = np.concatenate([file_boxes for _, _, file_boxes, _ in results] or [np.empty((0, 4))])
+    n_lines = np.asarray([n for n, _, _, _ in results], dtype=np.int64)
+    return class_ids, boxes, offsets, n_lines, [size for _, _, _, size in results]
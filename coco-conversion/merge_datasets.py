@@ -9,16 +9,38 @@ import os
 import glob
 from collections import defaultdict
 
+import id_blocks
+import tracing
 from conversion_config import CATEGORIES, OUTPUT_DIR
 
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, 'drone-wildlife-datasets.json')
 
-# All dataset JSON files to merge (everything in output/ except the final merged file)
-DATASET_FILES = sorted(glob.glob(os.path.join(OUTPUT_DIR, '*.json')))
-DATASET_FILES = [f for f in DATASET_FILES if os.path.basename(f) != 'drone-wildlife-datasets.json']
+# JSON files in output/ that are not per-dataset COCO files
+NON_DATASET_FILES = {'drone-wildlife-datasets.json', 'run_report.json', 'run_trace.json'}
+
+
+def get_dataset_files():
+    # All dataset JSON files to merge (everything in output/ except the final merged file).
+    # Evaluated at merge time, so files written by converters in the same run are included.
+    dataset_files = sorted(glob.glob(os.path.join(OUTPUT_DIR, '*.json')))
+    return [f for f in dataset_files if os.path.basename(f) not in NON_DATASET_FILES]
 
 
 def merge():
+    dataset_files = get_dataset_files()
+
+    datasets = []
+    for dataset_file in dataset_files:
+        dataset_name = os.path.splitext(os.path.basename(dataset_file))[0]
+        with tracing.span('merge', f'load {dataset_name}'), open(dataset_file, 'r') as f:
+            datasets.append((dataset_name, json.load(f)))
+
+    # If every file was written with its ID block (conversion_config.GLOBAL_IDS), the IDs are
+    # already unique and the files can be concatenated as they are
+    global_ids = bool(datasets) and all(id_blocks.has_global_ids(name, data) for name, data in datasets)
+    if global_ids:
+        print('All datasets have global IDs, concatenating without renumbering')
+
     merged_images = []
     merged_annotations = []
     next_image_id = 0
@@ -26,30 +48,29 @@ def merge():
 
     dataset_stats = []
 
-    for dataset_file in DATASET_FILES:
-        dataset_name = os.path.splitext(os.path.basename(dataset_file))[0]
-
-        with open(dataset_file, 'r') as f:
-            data = json.load(f)
-
-        # Build mapping from old image IDs to new image IDs
-        old_to_new_image_id = {}
-
-        for im in data['images']:
-            next_image_id += 1
-            old_id = im['id']
-            old_to_new_image_id[old_id] = next_image_id
-
-            new_im = dict(im)
-            new_im['id'] = next_image_id
-            merged_images.append(new_im)
-
-        for ann in data['annotations']:
-            next_ann_id += 1
-            new_ann = dict(ann)
-            new_ann['id'] = next_ann_id
-            new_ann['image_id'] = old_to_new_image_id[ann['image_id']]
-            merged_annotations.append(new_ann)
+    for dataset_name, data in datasets:
+        if global_ids:
+            merged_images.extend(data['images'])
+            merged_annotations.extend(data['annotations'])
+        else:
+            with tracing.span('merge', f'renumber {dataset_name}'):
+                # Build mapping from old image IDs to new image IDs.  Every file is held
+                # in memory at this point, so renumber in place rather than copying.
+                old_to_new_image_id = {}
+
+                for im in data['images']:
+                    next_image_id += 1
+                    old_id = im['id']
+                    old_to_new_image_id[old_id] = next_image_id
+
+                    im['id'] = next_image_id
+                    merged_images.append(im)
+
+                for ann in data['annotations']:
+                    next_ann_id += 1
+                    ann['id'] = next_ann_id
+                    ann['image_id'] = old_to_new_image_id[ann['image_id']]
+                    merged_annotations.append(ann)
 
         n_images = len(data['images'])
         n_anns = len(data['annotations'])
@@ -71,10 +92,10 @@ def merge():
         'categories': CATEGORIES,
     }
 
-    with open(OUTPUT_FILE, 'w') as f:
+    with tracing.span('serialize'), open(OUTPUT_FILE, 'w') as f:
         json.dump(coco, f, indent=1)
 
-    print(f'\nMerged {len(DATASET_FILES)} datasets')
+    print(f'\nMerged {len(dataset_files)} datasets')
     print(f'Total: {len(merged_images)} images, {len(merged_annotations)} annotations')
     print(f'Output: {OUTPUT_FILE}')
 
@@ -101,5 +122,44 @@ def merge():
     return coco
 
 
+def concatenate(dataset_name, input_files, output_file):
+    """
+    Concatenate COCO files that cover disjoint parts of one dataset (e.g. chunks converted
+    on different machines) into one file, renumbering IDs in input order.
+    """
+    images = []
+    annotations = []
+    first_image_id, first_ann_id = id_blocks.first_ids(dataset_name)
+    for input_file in input_files:
+        with open(input_file, 'r') as f:
+            data = json.load(f)
+
+        old_to_new_image_id = {}
+        for im in data['images']:
+            old_to_new_image_id[im['id']] = first_image_id + len(images) + 1
+            im['id'] = first_image_id + len(images) + 1
+            images.append(im)
+
+        for ann in data['annotations']:
+            ann['id'] = first_ann_id + len(annotations) + 1
+            ann['image_id'] = old_to_new_image_id[ann['image_id']]
+            annotations.append(ann)
+
+    coco = {
+        'images': images,
+        'annotations': annotations,
+        'categories': CATEGORIES,
+    }
+    id_blocks.finish(dataset_name, coco)
+
+    with tracing.span('serialize'), open(output_file, 'w') as f:
+        json.dump(coco, f, indent=1)
+
+    print(f'Combined {len(input_files)} files into {output_file}: '
+          f'{len(images)} images, {len(annotations)} annotations')
+
+    return coco
+
+
 if __name__ == '__main__':
     merge()
@@ -0,0 +1,187 @@
+"""
+Per-stage performance measurements for run_all.py.
+
+Each converter and the merge step are wrapped in measure(), which records wall time,
+CPU time, peak RSS, files opened, bytes read/written and images/annotations per second.
+run_all.py writes the results to OUTPUT_DIR/run_report.json (next to the merged output)
+and prints a summary table, including the change in wall time since the previous report.
+
+Files opened are counted with an audit hook on the 'open' event.  Bytes read/written come
+from /proc/self/io on Linux and from psutil (if installed) elsewhere; peak RSS comes from
+the resource module, or psutil on Windows.  Anything that can't be measured on the current
+platform is reported as null.
+"""
+
+import datetime
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from conversion_config import OUTPUT_DIR
+
+REPORT_FILE = os.path.join(OUTPUT_DIR, 'run_report.json')
+
+_n_files_opened = 0
+_open_counter_installed = False
+
+
+def _count_open(event, args):
+    global _n_files_opened
+    if event == 'open':
+        _n_files_opened += 1
+
+
+def _install_open_counter():
+    # Audit hooks can't be removed, so install at most one per process
+    global _open_counter_installed
+    if not _open_counter_installed:
+        sys.addaudithook(_count_open)
+        _open_counter_installed = True
+
+
+def _io_bytes():
+    """(bytes read, bytes written) by this process so far, or (None, None) if unavailable."""
+    if os.path.isfile('/proc/self/io'):
+        counters = {}
+        with open('/proc/self/io', 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                counters[key] = int(value)
+        # rchar/wchar count every read/write call, including ones served from the page cache
+        return counters['rchar'], counters['wchar']
+    if psutil is not None:
+        try:
+            io = psutil.Process().io_counters()
+        except (AttributeError, psutil.Error):
+            # io_counters() isn't available on macOS
+            return None, None
+        return io.read_bytes, io.write_bytes
+    return None, None
+
+
+def _peak_rss_mb():
+    """High-water mark of this process's resident set size, in MB."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kB elsewhere
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    if psutil is not None:
+        mem = psutil.Process().memory_info()
+        return getattr(mem, 'peak_wset', mem.rss) / (1024 * 1024)
+    return None
+
+
+def _delta(end, start):
+    if end is None or start is None:
+        return None
+    return end - start
+
+
+@contextmanager
+def measure(stage, dataset=None):
+    """
+    Measure the code in a with-block.
+
+    Yields a dict that is filled in with the measurements when the block exits.  Set
+    'n_images' and 'n_annotations' in it inside the block to get throughput figures.
+
+    Peak RSS is the high-water mark of the whole process, so it is only per-stage when
+    the stage runs in a process of its own (as converters do in parallel mode).
+    """
+    _install_open_counter()
+    stats = {'stage': stage, 'dataset': dataset}
+
+    read_start, written_start = _io_bytes()
+    opened_start = _n_files_opened
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        wall_s = time.perf_counter() - wall_start
+        cpu_s = time.process_time() - cpu_start
+        opened = _n_files_opened - opened_start
+        read_end, written_end = _io_bytes()
+
+        stats['wall_s'] = wall_s
+        stats['cpu_s'] = cpu_s
+        stats['peak_rss_mb'] = _peak_rss_mb()
+        stats['files_opened'] = opened
+        stats['bytes_read'] = _delta(read_end, read_start)
+        stats['bytes_written'] = _delta(written_end, written_start)
+        for key in ('images', 'annotations'):
+            n = stats.get(f'n_{key}')
+            stats[f'{key}_per_s'] = n / wall_s if n is not None and wall_s > 0 else None
+
+
+def load_report(path=REPORT_FILE):
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_report(stages, total_wall_s, workers, path=REPORT_FILE):
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'workers': workers,
+        'total_wall_s': total_wall_s,
+        'stages': stages,
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+    return report
+
+
+def _fmt(value, fmt):
+    return '-' if value is None else format(value, fmt)
+
+
+def _mb(n_bytes):
+    return None if n_bytes is None else n_bytes / (1024 * 1024)
+
+
+def print_summary(stages, previous_report=None):
+    """Print one row per stage; 'vs prev' is the change in wall time since previous_report."""
+    previous_wall = {}
+    if previous_report:
+        for s in previous_report['stages']:
+            previous_wall[(s['stage'], s['dataset'])] = s['wall_s']
+
+    header = (f'{"stage":<28}{"wall s":>9}{"vs prev":>9}{"cpu s":>9}{"rss MB":>9}'
+              f'{"opened":>9}{"read MB":>10}{"write MB":>10}{"img/s":>9}{"ann/s":>10}')
+    print(header)
+    print('-' * len(header))
+    for s in stages:
+        label = s['dataset'] or s['stage']
+        if s.get('cached'):
+            label += ' (cached)'
+        prev = previous_wall.get((s['stage'], s['dataset']))
+        change = None if prev is None else s['wall_s'] - prev
+        print(f'{label:<28}'
+              f'{s["wall_s"]:>9.1f}'
+              f'{_fmt(change, "+.1f"):>9}'
+              f'{s["cpu_s"]:>9.1f}'
+              f'{_fmt(s["peak_rss_mb"], ".0f"):>9}'
+              f'{s["files_opened"]:>9}'
+              f'{_fmt(_mb(s["bytes_read"]), ".1f"):>10}'
+              f'{_fmt(_mb(s["bytes_written"]), ".1f"):>10}'
+              f'{_fmt(s.get("images_per_s"), ".1f"):>9}'
+              f'{_fmt(s.get("annotations_per_s"), ".1f"):>10}')
@@ -0,0 +1,147 @@
+"""
+Dry-run cost estimate for run_all.py --plan.
+
+For each dataset, indexes DATA_ROOT/<dataset> with its directory index (see dir_index.py)
+and stats its files, without opening any image, and reports the number and total size of
+image and annotation files, how many images the converter will open to read their
+dimensions (versus taking them from the source annotations or the image metadata store),
+and a projected conversion time.
+
+Nothing is written: the directory manifest is read but not updated, and the image
+metadata store is opened read-only (or not at all, if there isn't one yet).
+
+Projections use the throughput (images per second) each converter achieved the last time
+it actually ran, as recorded in the build cache.  That throughput was measured on
+whatever storage the data was on at the time; the time taken by this scan is shown as
+well, as a rough indication of how fast the current storage is.
+"""
+
+import os
+import time
+
+import build_cache
+from build_cache import IMAGE_EXTENSIONS
+from dir_index import dataset_index
+from image_metadata import DB_FILE, ImageMetadataStore
+from source_dimensions import SOURCE_DIMENSION_DATASETS, n_images_to_probe
+
+
+def _scan(dataset_name, stored):
+    """
+    Counts and total sizes of the image and non-image files under a dataset's folder, and
+    the number of images whose entries in stored ({key: (size, mtime_ns)}) are current.
+    """
+    counts = {'n_images': 0, 'image_bytes': 0, 'n_other': 0, 'other_bytes': 0, 'n_stored': 0}
+    index = dataset_index(dataset_name, save_manifest=False)
+    files = index.relpaths()
+    for rel, signature in zip(files, index.signatures(files)):
+        if signature is None:
+            continue
+        if rel.lower().endswith(IMAGE_EXTENSIONS):
+            counts['n_images'] += 1
+            counts['image_bytes'] += signature[0]
+            if stored.get(f'{dataset_name}/{rel}') == signature:
+                counts['n_stored'] += 1
+        else:
+            counts['n_other'] += 1
+            counts['other_bytes'] += signature[0]
+    return counts
+
+
+def estimate(dataset_name, cache_entry=None, store=None):
+    """
+    Plan one dataset's conversion.
+
+    Args:
+        dataset_name: shortcode / folder name under DATA_ROOT
+        cache_entry: the dataset's build cache entry, for its last recorded throughput
+        store: ImageMetadataStore to check for images that won't need opening
+    """
+    stored = store.signatures(dataset_name) if store is not None else {}
+    t0 = time.perf_counter()
+    row = {'dataset': dataset_name, **_scan(dataset_name, stored)}
+    row['scan_s'] = time.perf_counter() - t0
+
+    # Counts files on disk, which can include images without annotations that the
+    # converter skips, so this is an upper bound
+    if dataset_name in SOURCE_DIMENSION_DATASETS:
+        # Dimensions come from the annotations, apart from those the dimension policy checks
+        # (some of which may already be in the store; this doesn't try to tell)
+        row['n_probe'] = n_images_to_probe(dataset_name, row['n_images'])
+        row['n_metadata'] = row['n_images'] - row['n_probe']
+    else:
+        row['n_probe'], row['n_metadata'] = row['n_images'] - row['n_stored'], row['n_stored']
+
+    row['images_per_s'] = None
+    row['projected_s'] = None
+    if cache_entry and cache_entry.get('wall_s') and cache_entry.get('n_images'):
+        row['images_per_s'] = cache_entry['n_images'] / cache_entry['wall_s']
+        row['projected_s'] = row['n_images'] / row['images_per_s']
+    return row
+
+
+def _fmt(value, fmt):
+    return '-' if value is None else format(value, fmt)
+
+
+def _duration(seconds):
+    if seconds is None:
+        return '-'
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}h{minutes:02d}m' if hours else f'{minutes}m{seconds:02d}s'
+
+
+def plan(datasets, workers=1):
+    """Print the plan for converting datasets with the given number of workers; returns its rows."""
+    cache = build_cache.load_cache()
+    rows = []
+    # Read-only, so a plan leaves CACHE_DIR as it was; no database means nothing is stored yet
+    store = ImageMetadataStore(read_only=True) if os.path.isfile(DB_FILE) else None
+    try:
+        for name in datasets:
+            print(f'Scanning {name}...')
+            rows.append(estimate(name, cache.get(name), store))
+    finally:
+        if store is not None:
+            store.close()
+
+    header = (f'{"dataset":<22}{"images":>9}{"img GB":>9}{"ann files":>11}{"ann MB":>9}'
+              f'{"to open":>9}{"known":>10}{"scan s":>8}{"img/s":>9}{"projected":>11}')
+    print()
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(f'{row["dataset"]:<22}'
+              f'{row["n_images"]:>9}'
+              f'{row["image_bytes"] / 1e9:>9.2f}'
+              f'{row["n_other"]:>11}'
+              f'{row["other_bytes"] / 1e6:>9.1f}'
+              f'{row["n_probe"]:>9}'
+              f'{row["n_metadata"]:>10}'
+              f'{row["scan_s"]:>8.1f}'
+              f'{_fmt(row["images_per_s"], ".1f"):>9}'
+              f'{_duration(row["projected_s"]):>11}')
+    print('-' * len(header))
+
+    total_images = sum(row['n_images'] for row in rows)
+    total_bytes = sum(row['image_bytes'] + row['other_bytes'] for row in rows)
+    print(f'{len(rows)} datasets, {total_images} images, {total_bytes / 1e9:.2f} GB; '
+          f'{sum(row["n_probe"] for row in rows)} images to open')
+
+    projected = [row['projected_s'] for row in rows if row['projected_s'] is not None]
+    unknown = [row['dataset'] for row in rows if row['projected_s'] is None]
+    if projected:
+        total_s = sum(projected)
+        print(f'Projected conversion time: {_duration(total_s)} sequentially', end='')
+        if workers > 1:
+            # No better than the slowest converter, or an even split of the total
+            print(f', about {_duration(max(max(projected), total_s / workers))} with {workers} workers', end='')
+        print()
+        dominant = sorted((row for row in rows if row['projected_s'] is not None),
+                          key=lambda row: -row['projected_s'])[:3]
+        print(f'Largest: {", ".join(row["dataset"] + " (" + _duration(row["projected_s"]) + ")" for row in dominant)}')
+    if unknown:
+        print(f'No recorded throughput (not converted yet) for: {", ".join(unknown)}')
+
+    return rows
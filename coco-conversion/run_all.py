@@ -3,69 +3,489 @@ Run all dataset conversions and merge into a single COCO file.
 
 Usage: cd into the coco-conversion/ directory and run:
     python run_all.py
+    python run_all.py --workers 8    # run up to 8 converters in parallel
+    python run_all.py --no-cache     # reconvert every dataset, even if its inputs are unchanged
+    python run_all.py --only koger-drones,waid-drones    # convert just these, then merge
+    python run_all.py --exclude mmla-mpala               # convert everything else, then merge
+    python run_all.py --merge-only                       # just re-merge the existing outputs
+    python run_all.py --trace        # also write a Chrome/Perfetto trace to output/run_trace.json
+    python run_all.py --resume       # continue an interrupted rebuild, skipping completed datasets
+    python run_all.py --watch        # keep running, reconverting datasets whose sources change
+    python run_all.py --plan         # estimate the cost of a rebuild without converting anything
+
+Distributed mode, with the queue on storage every machine mounts (see work_queue.py):
+    python run_all.py --distributed --chunks 8     # coordinator: queue jobs, work on them, merge
+    python run_all.py --worker                     # on each other machine (or process)
 """
 
+import argparse
+import importlib
+import os
+import socket
+import sys
 import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from convert_eikelboom_savanna import convert as convert_eikelboom_savanna
-from convert_qian_penguins import convert as convert_qian_penguins
-from convert_gray_turtles import convert as convert_gray_turtles
-from convert_aerial_elephants import convert as convert_aerial_elephants
-from convert_weinstein_birds import convert as convert_weinstein_birds
-from convert_hayes_seabirds import convert as convert_hayes_seabirds
-from convert_shao_cattle import convert as convert_shao_cattle
-from convert_naik_bucktales import convert as convert_naik_bucktales
-from convert_koger_drones import convert as convert_koger_drones
-from convert_kabra_birds import convert as convert_kabra_birds
-from convert_waid_drones import convert as convert_waid_drones
-from convert_delplanque_mammals import convert as convert_delplanque_mammals
-from convert_reinhard_savmap import convert as convert_reinhard_savmap
-from convert_price_zebras import convert as convert_price_zebras
-from convert_yolo_dataset import convert_yolo_dataset
-from convert_mmla_opc import CATEGORY_MAPPING as MMLA_OPC_CATS
-from convert_mmla_wilds import CATEGORY_MAPPING as MMLA_WILDS_CATS
-from convert_mmla_mpala import CATEGORY_MAPPING as MMLA_MPALA_CATS
-from merge_datasets import merge
+import build_cache
+import checkpoints
+import conversion_config
+import perf_report
+import tracing
+import watcher
+import work_queue
+from conversion_config import OUTPUT_DIR
+from merge_datasets import merge, concatenate, get_dataset_files, OUTPUT_FILE
 
+# Dataset name -> module containing its convert() function.  Modules are only imported
+# when their dataset is selected, so a single-dataset run doesn't pay for importing
+# pandas, PIL etc. and computing every converter's module-level paths.
 CONVERTERS = [
-    ('eikelboom-savanna', convert_eikelboom_savanna),
-    ('qian-penguins', convert_qian_penguins),
-    ('gray-turtles', convert_gray_turtles),
-    ('aerial-elephants', convert_aerial_elephants),
-    ('weinstein-birds', convert_weinstein_birds),
-    ('hayes-seabirds', convert_hayes_seabirds),
-    ('shao-cattle', convert_shao_cattle),
-    ('naik-bucktales', convert_naik_bucktales),
-    ('koger-drones', convert_koger_drones),
-    ('kabra-birds', convert_kabra_birds),
-    ('mmla-opc', lambda: convert_yolo_dataset('mmla-opc', MMLA_OPC_CATS)),
-    ('mmla-wilds', lambda: convert_yolo_dataset('mmla-wilds', MMLA_WILDS_CATS)),
-    ('mmla-mpala', lambda: convert_yolo_dataset('mmla-mpala', MMLA_MPALA_CATS)),
-    ('waid-drones', convert_waid_drones),
-    ('delplanque-mammals', convert_delplanque_mammals),
-    ('reinhard-savmap', convert_reinhard_savmap),
-    ('price-zebras', convert_price_zebras),
+    ('eikelboom-savanna', 'convert_eikelboom_savanna'),
+    ('qian-penguins', 'convert_qian_penguins'),
+    ('gray-turtles', 'convert_gray_turtles'),
+    ('aerial-elephants', 'convert_aerial_elephants'),
+    ('weinstein-birds', 'convert_weinstein_birds'),
+    ('hayes-seabirds', 'convert_hayes_seabirds'),
+    ('shao-cattle', 'convert_shao_cattle'),
+    ('naik-bucktales', 'convert_naik_bucktales'),
+    ('koger-drones', 'convert_koger_drones'),
+    ('kabra-birds', 'convert_kabra_birds'),
+    ('mmla-opc', 'convert_mmla_opc'),
+    ('mmla-wilds', 'convert_mmla_wilds'),
+    ('mmla-mpala', 'convert_mmla_mpala'),
+    ('waid-drones', 'convert_waid_drones'),
+    ('delplanque-mammals', 'convert_delplanque_mammals'),
+    ('reinhard-savmap', 'convert_reinhard_savmap'),
+    ('price-zebras', 'convert_price_zebras'),
 ]
 
+CONVERTER_MODULES = dict(CONVERTERS)
+
+# Datasets whose convert() accepts chunk=(index, count), so distributed runs can split them
+CHUNKABLE = {'mmla-opc', 'mmla-wilds', 'mmla-mpala'}
+
+
+def load_converter(name):
+    """Import the converter module for a dataset and return its convert() function."""
+    return importlib.import_module(CONVERTER_MODULES[name]).convert
+
+
+def select_datasets(only=None, exclude=None):
+    """
+    Dataset names to convert, in registry order.
+
+    Args:
+        only: if given, convert just these datasets
+        exclude: datasets to leave out
+    """
+    for name in list(only or []) + list(exclude or []):
+        if name not in CONVERTER_MODULES:
+            raise ValueError(f'Unknown dataset {name}, expected one of: {", ".join(CONVERTER_MODULES)}')
+    return [name for name, _ in CONVERTERS
+            if (not only or name in only) and name not in (exclude or [])]
+
+
+def run_converter(name, cache_entry=None, hash_inputs=False, trace=False):
+    """
+    Run one converter and summarize its output.
+
+    This is the unit of work for the process pool, so it takes the dataset name rather
+    than the function and returns a small summary rather than the (large) COCO dict;
+    the full result is in the converter's output file.
+
+    If cache_entry (this dataset's entry from the build cache) still matches the
+    converter's inputs, the converter is skipped and its existing output is reused.
+
+    With trace=True in a worker process, the converter's trace events are returned with
+    the summary (in-process, they go straight to the caller's trace).
+    """
+    # Imported here, as it pulls in tqdm and the image probing code; --plan, --merge-only
+    # and cached runs start faster without them
+    import image_metadata
+
+    output_file = os.path.join(OUTPUT_DIR, f'{name}.json')
+
+    own_trace = trace and not tracing.is_enabled()
+    if own_trace:
+        tracing.enable(name)
+
+    with perf_report.measure('convert', name) as stats, tracing.span('convert', name):
+        fingerprint = build_cache.fingerprint_converter(name, CONVERTER_MODULES[name], hash_inputs)
+        cached = build_cache.is_up_to_date(cache_entry, fingerprint, output_file)
+        if cached:
+            print(f'{name}: inputs unchanged, reusing {output_file}')
+            n_images, n_annotations = cache_entry['n_images'], cache_entry['n_annotations']
+        else:
+            try:
+                coco = load_converter(name)()
+            finally:
+                image_metadata.flush()
+            n_images, n_annotations = len(coco['images']), len(coco['annotations'])
+            stats['n_images'] = n_images
+            stats['n_annotations'] = n_annotations
+        stats['cached'] = cached
+
+    result = {
+        'output_file': output_file,
+        'n_images': n_images,
+        'n_annotations': n_annotations,
+        'fingerprint': fingerprint,
+        'cached': cached,
+        'stats': stats,
+    }
+    if own_trace:
+        result['trace_events'] = tracing.disable()
+    return result
+
+
+def run_job(job):
+    """Run one work-queue job: a whole dataset, or one chunk of a chunkable dataset."""
+    if job['chunk'] is None:
+        return run_converter(job['dataset'], job['cache_entry'], job['hash_inputs'])
+
+    import image_metadata
+
+    with perf_report.measure('convert', job['job_id']) as stats:
+        try:
+            coco = load_converter(job['dataset'])(chunk=tuple(job['chunk']), output_path=job['output_file'])
+        finally:
+            image_metadata.flush()
+        stats['n_images'] = len(coco['images'])
+        stats['n_annotations'] = len(coco['annotations'])
+    return {
+        'output_file': job['output_file'],
+        'n_images': stats['n_images'],
+        'n_annotations': stats['n_annotations'],
+        'stats': stats,
+    }
+
+
+def run_distributed(datasets, queue_dir, n_chunks, cache_entry, hash_inputs):
+    """
+    Convert datasets through the work queue in queue_dir, working on jobs alongside any
+    --worker processes until all are finished, then combine the chunks of chunked datasets.
+
+    Returns ({dataset: result}, {dataset: error}) like the local modes.
+    """
+    queue = work_queue.WorkQueue(queue_dir)
+    # Chunk jobs' output files go in the new run's directory
+    queue.new_run()
+    jobs = []
+    chunked = {}
+
+    for name in datasets:
+        entry = cache_entry(name)
+        if n_chunks > 1 and name in CHUNKABLE:
+            # No single chunk job sees the whole dataset, so the cache is checked here; an
+            # up-to-date dataset goes in as one job, which the worker will find in the cache
+            fingerprint = build_cache.fingerprint_converter(name, CONVERTER_MODULES[name], hash_inputs)
+            output_file = os.path.join(OUTPUT_DIR, f'{name}.json')
+            if not build_cache.is_up_to_date(entry, fingerprint, output_file):
+                job_ids = [f'{name}.chunk-{i}-of-{n_chunks}' for i in range(n_chunks)]
+                for i_chunk, job_id in enumerate(job_ids):
+                    jobs.append({'job_id': job_id, 'dataset': name, 'chunk': [i_chunk, n_chunks],
+                                 'output_file': queue.output_path(job_id)})
+                chunked[name] = (fingerprint, job_ids)
+                continue
+        jobs.append({'job_id': name, 'dataset': name, 'chunk': None,
+                     'cache_entry': entry, 'hash_inputs': hash_inputs})
+
+    queue.submit(jobs)
+    print(f'Submitted {len(jobs)} jobs to {queue_dir}')
+    queue.work(run_job)
+    done, failed = queue.wait()
+
+    results = {}
+    errors = {}
+    for job in jobs:
+        if job['chunk'] is not None:
+            continue
+        if job['job_id'] in done:
+            results[job['dataset']] = done[job['job_id']]
+        else:
+            errors[job['dataset']] = failed[job['job_id']]
+
+    for name, (fingerprint, job_ids) in chunked.items():
+        chunk_errors = [failed[job_id] for job_id in job_ids if job_id in failed]
+        if chunk_errors:
+            errors[name] = '\n'.join(chunk_errors)
+            continue
+        output_file = os.path.join(OUTPUT_DIR, f'{name}.json')
+        with perf_report.measure('combine', name) as stats:
+            coco = concatenate(name, [done[job_id]['output_file'] for job_id in job_ids], output_file)
+            stats['n_images'] = len(coco['images'])
+            stats['n_annotations'] = len(coco['annotations'])
+        results[name] = {
+            'output_file': output_file,
+            'n_images': stats['n_images'],
+            'n_annotations': stats['n_annotations'],
+            'fingerprint': fingerprint,
+            'cached': False,
+            'stats': stats,
+            'chunk_stats': [done[job_id]['stats'] for job_id in job_ids],
+        }
+
+    return results, errors
 
-def run_all():
+
+def run_all(datasets=None, workers=1, use_cache=True, hash_inputs=False, trace_file=None, resume=False,
+            queue_dir=None, n_chunks=1):
+    """
+    Run the converters, then merge every per-dataset file in OUTPUT_DIR.
+
+    Args:
+        datasets: names of the datasets to convert (default: all); an empty list just merges
+        workers: number of converters to run at the same time; 1 runs them sequentially
+            in this process.
+        use_cache: skip converters (and the merge) whose inputs haven't changed since their
+            last successful run
+        hash_inputs: fingerprint annotation files by content rather than by size and mtime
+        trace_file: if given, write a Chrome trace-event file covering every converter and the merge
+        resume: skip datasets that completed in an earlier, interrupted run (and whose output
+            files are unchanged since); otherwise completion markers start afresh
+        queue_dir: if given, convert through the shared-filesystem work queue in this directory
+            (see work_queue.py) instead of locally; workers is ignored
+        n_chunks: in distributed mode, split each chunkable dataset into this many jobs
+    """
     t0 = time.time()
-    for name, convert_fn in CONVERTERS:
+    previous_report = perf_report.load_report()
+    results = {}
+    errors = {}
+
+    if datasets is None:
+        datasets = select_datasets()
+
+    if resume:
+        completed = [name for name in datasets if checkpoints.load_marker(name) is not None]
+        if completed:
+            print(f'Resuming: skipping {len(completed)} completed datasets ({", ".join(completed)})')
+        datasets = [name for name in datasets if name not in completed]
+    else:
+        checkpoints.clear(datasets)
+
+    trace = trace_file is not None
+    if trace:
+        tracing.enable('run_all')
+
+    cache = build_cache.load_cache()
+
+    def cache_entry(name):
+        return cache.get(name) if use_cache else None
+
+    def finished(name, result):
+        # Record progress as soon as each converter finishes, so it survives a later crash
+        results[name] = result
+        if not result['cached']:
+            # Conversion time (summed over chunks in distributed mode) is kept for --plan
+            wall_s = result['stats']['wall_s'] + sum(s['wall_s'] for s in result.get('chunk_stats', []))
+            build_cache.record(cache, name, result['fingerprint'], result['output_file'],
+                               n_images=result['n_images'], n_annotations=result['n_annotations'],
+                               wall_s=wall_s)
+            build_cache.save_cache(cache)
+        checkpoints.mark_complete(name, result['output_file'],
+                                  n_images=result['n_images'], n_annotations=result['n_annotations'])
+
+    if queue_dir is not None:
+        distributed_results, distributed_errors = run_distributed(
+            datasets, queue_dir, n_chunks, cache_entry, hash_inputs)
+        for name in datasets:
+            if name in distributed_results:
+                finished(name, distributed_results[name])
+        errors.update(distributed_errors)
+    elif workers > 1 and datasets:
+        print(f'Running {len(datasets)} converters with {workers} workers')
+        # One process per converter (where supported) so each one's peak RSS is its own
+        pool_kwargs = {'max_tasks_per_child': 1} if sys.version_info >= (3, 11) else {}
+        # A forked worker inherits this process's tracing state; clear it so run_converter
+        # collects the worker's own events and returns them with its result
+        with ProcessPoolExecutor(max_workers=workers, initializer=tracing.disable, **pool_kwargs) as executor:
+            futures = {
+                executor.submit(run_converter, name, cache_entry(name), hash_inputs, trace): name
+                for name in datasets
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    finished(name, future.result())
+                except Exception:
+                    errors[name] = traceback.format_exc()
+                    print(f'FAILED: {name}')
+                    continue
+                print(f'Finished: {name} ({results[name]["n_images"]} images, '
+                      f'{results[name]["n_annotations"]} annotations)')
+    else:
+        for name in datasets:
+            print(f'\n{"="*60}')
+            print(f'Converting: {name}')
+            print(f'{"="*60}')
+            try:
+                finished(name, run_converter(name, cache_entry(name), hash_inputs, trace))
+            except Exception:
+                errors[name] = traceback.format_exc()
+                print(f'FAILED: {name}')
+
+    stages = []
+    for name in datasets:
+        if name in results:
+            stages.extend(results[name].get('chunk_stats', []))
+            stages.append(results[name]['stats'])
+
+    if not errors:
         print(f'\n{"="*60}')
-        print(f'Converting: {name}')
+        print(f'Merging all datasets')
         print(f'{"="*60}')
-        convert_fn()
+        merge_fingerprint = build_cache.fingerprint_merge(get_dataset_files())
+        with perf_report.measure('merge') as stats:
+            stats['cached'] = use_cache and build_cache.is_up_to_date(
+                cache.get(build_cache.MERGE_KEY), merge_fingerprint, OUTPUT_FILE)
+            if stats['cached']:
+                print(f'No dataset changed, reusing {OUTPUT_FILE}')
+            else:
+                coco = merge()
+                stats['n_images'] = len(coco['images'])
+                stats['n_annotations'] = len(coco['annotations'])
+        stages.append(stats)
+        if not stats['cached']:
+            build_cache.record(cache, build_cache.MERGE_KEY, merge_fingerprint, OUTPUT_FILE)
+            build_cache.save_cache(cache)
 
+    elapsed = time.time() - t0
+    perf_report.write_report(stages, elapsed, workers)
+    if trace:
+        trace_events = tracing.disable()
+        for result in results.values():
+            trace_events.extend(result.get('trace_events', []))
+        tracing.write(trace_file, trace_events)
     print(f'\n{"="*60}')
-    print(f'Merging all datasets')
+    print(f'Performance summary (details in {perf_report.REPORT_FILE})')
     print(f'{"="*60}')
-    merge()
+    perf_report.print_summary(stages, previous_report)
+
+    if errors:
+        # Don't merge a mix of fresh and stale per-dataset files
+        for name, tb in errors.items():
+            print(f'\n{"="*60}')
+            print(f'Error in {name}:')
+            print(tb)
+        raise RuntimeError(f'{len(errors)} converter(s) failed, not merging: {", ".join(sorted(errors))}')
 
-    elapsed = time.time() - t0
     minutes = int(elapsed // 60)
     seconds = elapsed % 60
     print(f'\nDone in {minutes}m {seconds:.1f}s')
 
+    return results
+
+
+def watch(datasets, poll_seconds=60, **run_kwargs):
+    """
+    Poll the source trees of datasets every poll_seconds, and rerun run_all() on the ones
+    that changed.  A dataset is reconverted once a poll finds no further changes to it, so
+    a batch of edits leads to one rebuild.  Runs until interrupted.
+
+    Every dataset is converted (or found up to date in the build cache) straight away, so
+    changes made while nothing was watching are picked up.  A dataset without a source
+    folder is reported and skipped until one appears.
+    """
+    manifests = {name: watcher.scan(name) for name in datasets}
+    ready = {name for name in datasets if not watcher.is_missing(manifests[name])}
+    changing = set()
+
+    while True:
+        if ready:
+            to_run = [name for name in datasets if name in ready]
+            print(f'\nSources changed: {", ".join(to_run)}')
+            try:
+                run_all(to_run, **run_kwargs)
+            except RuntimeError as e:
+                print(f'\n{e}; waiting for further changes')
+            ready = set()
+            print(f'\nWatching {len(datasets)} datasets for changes (Ctrl-C to stop)')
+
+        time.sleep(poll_seconds)
+
+        try:
+            changed = {name for name in datasets if watcher.has_changed(name, manifests[name])}
+            for name in changed:
+                manifests[name] = watcher.scan(name)
+        except OSError as e:
+            # E.g. the source drive has dropped out; try again next time
+            print(f'WARNING: could not poll sources: {e}')
+            continue
+        settled = changing - changed
+        # A folder that has gone away has nothing to convert
+        ready = {name for name in settled if not watcher.is_missing(manifests[name])}
+        changing = (changing | changed) - settled
+
 
 if __name__ == '__main__':
-    run_all()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of converters to run in parallel (default: 1, sequential)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='ignore the build cache and reconvert every dataset')
+    parser.add_argument('--hash-inputs', action='store_true',
+                        help='fingerprint annotation files by content instead of size and mtime')
+    parser.add_argument('--only', type=lambda s: s.split(','), default=None,
+                        help='comma-separated datasets to convert (default: all)')
+    parser.add_argument('--exclude', type=lambda s: s.split(','), default=None,
+                        help='comma-separated datasets to skip')
+    parser.add_argument('--merge-only', action='store_true',
+                        help='skip conversion and merge the existing per-dataset files')
+    parser.add_argument('--trace', nargs='?', const=os.path.join(OUTPUT_DIR, 'run_trace.json'), default=None,
+                        metavar='TRACE_FILE',
+                        help='write a Chrome/Perfetto trace of the run (default file: output/run_trace.json)')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip datasets completed by an earlier, interrupted run')
+    parser.add_argument('--plan', action='store_true',
+                        help='print file counts, sizes and a projected run time for the selected '
+                             'datasets, without converting anything')
+    parser.add_argument('--watch', nargs='?', type=int, const=60, default=None, metavar='SECONDS',
+                        help='keep running, polling sources every SECONDS (default 60) and '
+                             'reconverting and re-merging when they change')
+    parser.add_argument('--distributed', action='store_true',
+                        help='coordinate a multi-machine run through the work queue')
+    parser.add_argument('--worker', action='store_true',
+                        help='run the jobs of the work queue\'s current run (or, if that has finished, of the '
+                             'next one submitted) until all are finished, then exit')
+    parser.add_argument('--queue-dir', default=work_queue.DEFAULT_QUEUE_DIR,
+                        help='work queue directory on shared storage (default: output/cache/queue)')
+    parser.add_argument('--chunks', type=int, default=1,
+                        help=f'in distributed mode, split {", ".join(sorted(CHUNKABLE))} into this many jobs')
+    args = parser.parse_args()
+    if args.watch is not None and args.merge_only:
+        parser.error('--watch needs datasets to watch, so it cannot be combined with --merge-only')
+
+    if args.worker or args.distributed:
+        # Machines share CACHE_DIR but each keeps its own SQLite caches (see
+        # conversion_config.DB_DIR); set before image_metadata or a converter is imported
+        conversion_config.DB_DIR = os.path.join(conversion_config.LOCAL_CACHE_DIR, socket.gethostname())
+
+    if args.worker:
+        work_queue.WorkQueue(args.queue_dir).work(run_job)
+        sys.exit(0)
+
+    if args.merge_only:
+        selected = []
+    else:
+        try:
+            selected = select_datasets(args.only, args.exclude)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.plan:
+        import planner
+        planner.plan(selected, args.workers)
+        sys.exit(0)
+
+    if args.watch is not None:
+        try:
+            watch(selected, args.watch, workers=args.workers, use_cache=not args.no_cache,
+                  hash_inputs=args.hash_inputs)
+        except KeyboardInterrupt:
+            print('\nStopped watching')
+        sys.exit(0)
+
+    run_all(selected, workers=args.workers, use_cache=not args.no_cache, hash_inputs=args.hash_inputs,
+            trace_file=args.trace, resume=args.resume,
+            queue_dir=args.queue_dir if args.distributed else None, n_chunks=args.chunks)
@@ -0,0 +1,93 @@
+"""
+Checks on image dimensions that converters take from the source annotations (COCO JSON,
+the savmap parquet, gray-turtles' CSV, price-zebras' Labelme JSON) rather than from the
+images themselves.
+
+What happens to them is set per dataset in conversion_config.py:
+    'trust'   use them as they are
+    'probe'   read every image's dimensions from the image instead
+    'verify'  probe a random sample of DIMENSION_SAMPLE_SIZE images (the same sample each
+              run, so the image metadata store makes repeat runs free), correct any that
+              are wrong, and fail the conversion if more than MAX_DIMENSION_MISMATCH_RATE
+              of the sample is wrong
+"""
+
+import os
+import random
+
+from conversion_config import (DATA_ROOT, DEFAULT_DIMENSION_POLICY, DIMENSION_POLICY,
+                               DIMENSION_SAMPLE_SIZE, MAX_DIMENSION_MISMATCH_RATE)
+from image_metadata import get_image_sizes
+
+POLICIES = ('trust', 'probe', 'verify')
+
+# Datasets whose converters take image dimensions from the source annotations.  price-zebras
+# only does so for images whose JSON has imageWidth/imageHeight, and probes the rest.
+SOURCE_DIMENSION_DATASETS = {
+    'gray-turtles',
+    'naik-bucktales',
+    'koger-drones',
+    'delplanque-mammals',
+    'reinhard-savmap',
+    'price-zebras',
+}
+
+
+def get_policy(dataset_name):
+    policy = DIMENSION_POLICY.get(dataset_name, DEFAULT_DIMENSION_POLICY)
+    if policy not in POLICIES:
+        raise ValueError(f'Unknown dimension policy {policy!r} for {dataset_name}, expected one of {POLICIES}')
+    return policy
+
+
+def n_images_to_probe(dataset_name, n_images):
+    """How many of n_images with source dimensions the dataset's policy will probe."""
+    policy = get_policy(dataset_name)
+    if policy == 'trust':
+        return 0
+    if policy == 'probe':
+        return n_images
+    return min(DIMENSION_SAMPLE_SIZE, n_images)
+
+
+def check_source_dimensions(dataset_name, images):
+    """
+    Apply a dataset's dimension policy to COCO image entries whose width and height came
+    from the source annotations.  Entries found to be wrong are corrected in place.
+
+    Args:
+        dataset_name: shortcode, used to look up the policy and to seed the sample
+        images: list of COCO image dicts, with file_name relative to DATA_ROOT
+    """
+    policy = get_policy(dataset_name)
+    if policy == 'trust' or not images:
+        return
+
+    if policy == 'probe':
+        to_check = images
+    else:
+        # Seeded by the dataset name so the sample is the same from run to run
+        rng = random.Random(dataset_name)
+        to_check = rng.sample(images, min(DIMENSION_SAMPLE_SIZE, len(images)))
+
+    sizes = get_image_sizes([os.path.join(DATA_ROOT, im['file_name']) for im in to_check],
+                            desc=f'Checking {len(to_check)} source dimensions')
+    mismatched = []
+    for im, (w, h) in zip(to_check, sizes):
+        if (im['width'], im['height']) != (w, h):
+            mismatched.append((im['file_name'], im['width'], im['height'], w, h))
+            im['width'], im['height'] = w, h
+
+    if not mismatched:
+        print(f'Source dimensions match for all {len(to_check)} images checked')
+        return
+    print(f'WARNING: {len(mismatched)} of {len(to_check)} images checked have different source dimensions '
+          f'(corrected):')
+    for file_name, source_w, source_h, w, h in mismatched[:10]:
+        print(f'  {file_name}: {source_w}x{source_h} in source, {w}x{h} on disk')
+
+    mismatch_rate = len(mismatched) / len(to_check)
+    if policy == 'verify' and mismatch_rate > MAX_DIMENSION_MISMATCH_RATE:
+        raise ValueError(f'{dataset_name}: {mismatch_rate:.0%} of sampled source dimensions are wrong '
+                         f'(limit {MAX_DIMENSION_MISMATCH_RATE:.0%}); set its dimension policy to '
+                         f'\'probe\' in conversion_config.py')
@@ -0,0 +1,156 @@
+"""
+Local staging cache for files read from a slow source drive.
+
+When conversion_config.STAGING_DIR is set (e.g. to a folder on a local NVMe drive),
+staged(path) copies a file under DATA_ROOT to the same relative path under STAGING_DIR
+the first time it's asked for, and returns the local copy from then on.  Converters
+stage their annotation files (JSON, CSV) this way, and visualize_samples.py the images
+it renders; dimension probing reads from a staged copy when there is one, but doesn't
+stage images itself, since that would mean reading every image in full from the source.
+
+Copies keep the source's mtime, and a copy is only used while its size and mtime match
+the source's, so a stat of the source is all a cache hit costs; a changed source file is
+copied again.  The total size of the copies is kept under STAGING_BUDGET_GB by deleting
+the least recently used ones, tracked in STAGING_DIR/staging.sqlite.
+
+With STAGING_DIR = None, staged() returns paths unchanged.
+"""
+
+import atexit
+import os
+import shutil
+import sqlite3
+import time
+
+from conversion_config import DATA_ROOT, STAGING_DIR, STAGING_BUDGET_GB
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+
+def _relative_path(path):
+    """path relative to DATA_ROOT, or None if it's outside DATA_ROOT."""
+    try:
+        rel = os.path.relpath(os.path.abspath(path), DATA_ROOT)
+    except ValueError:
+        # On a different drive than DATA_ROOT
+        return None
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        return None
+    return rel
+
+
+def _is_current(local_path, st):
+    try:
+        local_st = os.stat(local_path)
+    except FileNotFoundError:
+        return False
+    return local_st.st_size == st.st_size and local_st.st_mtime_ns == st.st_mtime_ns
+
+
+class StagingCache:
+
+    def __init__(self, staging_dir=STAGING_DIR, budget_bytes=STAGING_BUDGET_GB * 1e9):
+        self.staging_dir = staging_dir
+        self.budget_bytes = budget_bytes
+        os.makedirs(staging_dir, exist_ok=True)
+        # Processes running in parallel share the cache; wait for each other's commits
+        self._conn = sqlite3.connect(os.path.join(staging_dir, 'staging.sqlite'), timeout=60)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def local_path(self, path):
+        """Where path is (or would be) staged, or None if it's outside DATA_ROOT."""
+        rel = _relative_path(path)
+        return None if rel is None else os.path.join(self.staging_dir, rel)
+
+    def stage(self, path):
+        """
+        A current local copy of path, copying it if there isn't one.  Returns path itself
+        if it's outside DATA_ROOT or larger than the whole budget.
+        """
+        local_path = self.local_path(path)
+        if local_path is None:
+            return path
+        st = os.stat(path)
+        if st.st_size > self.budget_bytes:
+            return path
+        key = _relative_path(path).replace('\\', '/')
+
+        if not _is_current(local_path, st):
+            self._make_room(st.st_size, key)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            # Copied under a name of its own, so other processes never see a partial copy
+            tmp_path = f'{local_path}.{os.getpid()}.tmp'
+            shutil.copyfile(path, tmp_path)
+            os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+            os.replace(tmp_path, local_path)
+
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO files (path, size, last_used) VALUES (?, ?, ?)',
+                               (key, st.st_size, time.time()))
+        return local_path
+
+    def _make_room(self, n_bytes, key):
+        """Delete least recently used copies (other than key's) until n_bytes more fit in the budget."""
+        with self._conn:
+            used = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM files WHERE path != ?',
+                                      (key,)).fetchone()[0]
+            if used + n_bytes <= self.budget_bytes:
+                return
+            evicted = []
+            for rel, size in self._conn.execute('SELECT path, size FROM files WHERE path != ? ORDER BY last_used',
+                                                (key,)):
+                try:
+                    os.remove(os.path.join(self.staging_dir, rel))
+                except FileNotFoundError:
+                    pass
+                except PermissionError:
+                    # Open in another process (on Windows); leave it for next time
+                    continue
+                evicted.append((rel,))
+                used -= size
+                if used + n_bytes <= self.budget_bytes:
+                    break
+            self._conn.executemany('DELETE FROM files WHERE path = ?', evicted)
+
+    def close(self):
+        self._conn.close()
+
+
+_cache = None
+
+
+def _default_cache():
+    global _cache
+    if _cache is None:
+        _cache = StagingCache()
+        atexit.register(_cache.close)
+    return _cache
+
+
+def staged(path):
+    """A local copy of path if staging is enabled (see above), otherwise path."""
+    if STAGING_DIR is None:
+        return path
+    return _default_cache().stage(path)
+
+
+def staged_copy(path, st):
+    """
+    path's staged copy if there is a current one (st being path's os.stat() result),
+    otherwise path.  Doesn't copy anything or update the cache's bookkeeping, so it's
+    safe to call from any thread.
+    """
+    if STAGING_DIR is None:
+        return path
+    rel = _relative_path(path)
+    if rel is None:
+        return path
+    local_path = os.path.join(STAGING_DIR, rel)
+    return local_path if _is_current(local_path, st) else path
@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import build_cache
+import dir_index
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+class FingerprintConverterTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.data_root = os.path.join(tmp.name, 'data')
+        self.script_dir = os.path.join(tmp.name, 'code')
+        _write(os.path.join(self.data_root, 'birds', 'labels.csv'), 'image,x,y\na.jpg,1,2\n')
+        _write(os.path.join(self.data_root, 'birds', 'images', 'a.jpg'), 'jpeg')
+        _write(os.path.join(self.script_dir, 'convert_birds.py'), 'import os\nimport helpers\n')
+        _write(os.path.join(self.script_dir, 'helpers.py'), 'from conversion_config import OUTPUT_DIR\n')
+        _write(os.path.join(self.script_dir, 'conversion_config.py'), 'OUTPUT_DIR = "out"\n')
+        _write(os.path.join(self.script_dir, 'unrelated.py'), 'X = 1\n')
+
+        for patcher in [mock.patch.object(build_cache, 'DATA_ROOT', self.data_root),
+                        mock.patch.object(build_cache, 'SCRIPT_DIR', self.script_dir),
+                        mock.patch.object(dir_index, 'DATA_ROOT', self.data_root),
+                        mock.patch.object(dir_index, 'MANIFEST_DIR', os.path.join(tmp.name, 'manifests')),
+                        mock.patch('builtins.print')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _fingerprint(self, hash_contents=False):
+        return build_cache.fingerprint_converter('birds', 'convert_birds', hash_contents)
+
+    def _touch(self, path, text):
+        # Change the file and move its mtime on, whatever the file system's resolution
+        st = os.stat(path) if os.path.exists(path) else None
+        _write(path, text)
+        if st is not None:
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+    def test_unchanged_inputs_give_same_fingerprint(self):
+        self.assertEqual(self._fingerprint(), self._fingerprint())
+        self._touch(os.path.join(self.script_dir, 'unrelated.py'), 'X = 2\n')
+        self.assertEqual(self._fingerprint(), self._fingerprint())
+
+    def test_source_file_edited_in_place(self):
+        before = self._fingerprint()
+        self._touch(os.path.join(self.data_root, 'birds', 'labels.csv'), 'image,x,y\na.jpg,1,3\n')
+        self.assertNotEqual(self._fingerprint(), before)
+
+    def test_image_added(self):
+        before = self._fingerprint()
+        images_dir = os.path.join(self.data_root, 'birds', 'images')
+        st = os.stat(images_dir)
+        _write(os.path.join(images_dir, 'b.jpg'), 'jpeg')
+        os.utime(images_dir, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertNotEqual(self._fingerprint(), before)
+
+    def test_content_hash_sees_same_size_and_mtime_edit(self):
+        path = os.path.join(self.data_root, 'birds', 'labels.csv')
+        before = self._fingerprint(hash_contents=True)
+        st = os.stat(path)
+        _write(path, 'image,x,y\na.jpg,9,9\n')
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(self._fingerprint(), self._fingerprint())
+        self.assertNotEqual(self._fingerprint(hash_contents=True), before)
+
+    def test_module_in_import_closure_changed(self):
+        self.assertEqual(build_cache.local_source_files('convert_birds'),
+                         [os.path.join(self.script_dir, name)
+                          for name in ['conversion_config.py', 'convert_birds.py', 'helpers.py']])
+        before = self._fingerprint()
+        self._touch(os.path.join(self.script_dir, 'conversion_config.py'), 'OUTPUT_DIR = "elsewhere"\n')
+        self.assertNotEqual(self._fingerprint(), before)
+
+    def test_categories_changed(self):
+        before = self._fingerprint()
+        categories = build_cache.CATEGORIES + [{'id': 6, 'name': 'fish'}]
+        with mock.patch.object(build_cache, 'CATEGORIES', categories):
+            self.assertNotEqual(self._fingerprint(), before)
+
+    def test_missing_source_directory_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            build_cache.fingerprint_converter('fish', 'convert_birds')
+
+
+class IsUpToDateTest(unittest.TestCase):
+
+    def test_output_changed_or_removed(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        output_file = os.path.join(tmp.name, 'birds.json')
+        _write(output_file, '{}')
+        cache = {}
+        build_cache.record(cache, 'birds', 'abc', output_file)
+        self.assertTrue(build_cache.is_up_to_date(cache['birds'], 'abc', output_file))
+        self.assertFalse(build_cache.is_up_to_date(cache['birds'], 'def', output_file))
+        self.assertFalse(build_cache.is_up_to_date(None, 'abc', output_file))
+
+        st = os.stat(output_file)
+        _write(output_file, '{"images": []}')
+        os.utime(output_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertFalse(build_cache.is_up_to_date(cache['birds'], 'abc', output_file))
+        os.remove(output_file)
+        self.assertFalse(build_cache.is_up_to_date(cache['birds'], 'abc', output_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
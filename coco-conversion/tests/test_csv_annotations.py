@@ -0,0 +1,89 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from conversion_config import get_category_id
+from csv_annotations import AnnotationTable
+
+SPECIES = {'zebra': 'mammal', 'tern': 'bird'}
+
+
+def _boxes(labels):
+    return pd.DataFrame({
+        'image': ['b.jpg', 'a.jpg', 'b.jpg'][:len(labels)],
+        'x1': [1, 2, 3][:len(labels)],
+        'y1': [1, 2, 3][:len(labels)],
+        'x2': [11, 12.5, 13][:len(labels)],
+        'y2': [21, 22, 23][:len(labels)],
+        'label': labels,
+    })
+
+
+class AnnotationTableTest(unittest.TestCase):
+
+    def test_xyxy_boxes_grouped_by_image(self):
+        table = AnnotationTable(_boxes(['Zebra', 'tern', 'ZEBRA']), 'image', 'xyxy', ['x1', 'y1', 'x2', 'y2'],
+                                category=SPECIES.__getitem__, original_category_column='label')
+        self.assertEqual(table.keys(), ['a.jpg', 'b.jpg'])
+        annotations, last_id = table.to_coco({'b.jpg': 7, 'a.jpg': 8}, 100)
+        self.assertEqual(last_id, 103)
+        self.assertEqual([a['id'] for a in annotations], [101, 102, 103])
+        self.assertEqual([a['image_id'] for a in annotations], [7, 7, 8])
+        self.assertEqual([a['bbox'] for a in annotations],
+                         [[1.0, 1.0, 10.0, 20.0], [3.0, 3.0, 10.0, 20.0], [2.0, 2.0, 10.5, 20.0]])
+        self.assertEqual([a['original_category'] for a in annotations], ['zebra', 'zebra', 'tern'])
+        self.assertEqual([a['category_id'] for a in annotations],
+                         [get_category_id('mammal')] * 2 + [get_category_id('bird')])
+
+    def test_only_listed_images_are_converted(self):
+        table = AnnotationTable(_boxes(['zebra', 'tern', 'zebra']), 'image', 'xyxy', ['x1', 'y1', 'x2', 'y2'],
+                                category='mammal', original_category='elephant')
+        annotations, _ = table.to_coco({'a.jpg': 1}, 0)
+        self.assertEqual(len(annotations), 1)
+        self.assertEqual(annotations[0]['original_category'], 'elephant')
+
+    def test_points(self):
+        df = pd.DataFrame({'image': ['a', 'a'], 'x': [1, 2], 'y': [3.5, 4]})
+        table = AnnotationTable(df, 'image', 'point', ['x', 'y'], category='reptile', original_category='turtle')
+        annotations, _ = table.to_coco({'a': 1}, 0)
+        self.assertEqual([a['point'] for a in annotations], [[1.0, 3.5], [2.0, 4.0]])
+        self.assertNotIn('bbox', annotations[0])
+
+    def test_missing_category_raises(self):
+        with self.assertRaisesRegex(ValueError, r'Missing label in boxes\.csv, row 1'):
+            AnnotationTable(_boxes(['zebra', np.nan, 'tern']), 'image', 'xyxy', ['x1', 'y1', 'x2', 'y2'],
+                            category=SPECIES.__getitem__, original_category_column='label', source='boxes.csv')
+
+    def test_non_text_category_raises(self):
+        with self.assertRaisesRegex(ValueError, r'label 3 is not text, in row 2'):
+            AnnotationTable(_boxes(['zebra', 'tern', 3]), 'image', 'xyxy', ['x1', 'y1', 'x2', 'y2'],
+                            category='bird', original_category_column='label')
+
+    def test_unknown_category_raises(self):
+        df = _boxes(['zebra', 'tern', 'Gull'])
+        df['file'] = ['one.csv', 'one.csv', 'two.csv']
+        with self.assertRaisesRegex(ValueError, r"No category for 'gull' in two\.csv, row 2"):
+            AnnotationTable(df, 'image', 'xyxy', ['x1', 'y1', 'x2', 'y2'],
+                            category=SPECIES.__getitem__, original_category_column='label', source_column='file')
+
+    def test_misspelled_category_column_raises(self):
+        with self.assertRaises(KeyError):
+            AnnotationTable(_boxes(['zebra']), 'image', 'xyxy', ['x1', 'y1', 'x2', 'y2'],
+                            category='bird', original_category_column='lable')
+
+    def test_original_category_given_once(self):
+        for kwargs in [{}, {'original_category': 'tern', 'original_category_column': 'label'}]:
+            with self.assertRaises(ValueError):
+                AnnotationTable(_boxes(['zebra']), 'image', 'xyxy', ['x1', 'y1', 'x2', 'y2'],
+                                category='bird', **kwargs)
+
+    def test_empty_table(self):
+        df = pd.DataFrame(columns=['image', 'x', 'y', 'label'])
+        table = AnnotationTable(df, 'image', 'point', ['x', 'y'], category='bird', original_category_column='label')
+        self.assertEqual(len(table), 0)
+        self.assertEqual(table.keys(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
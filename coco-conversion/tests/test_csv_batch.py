@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from csv_batch import read_csv_files
+
+
+class ReadCsvFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def _files(self, *texts):
+        paths = []
+        for i, text in enumerate(texts):
+            path = os.path.join(self.dir, f'{i}.csv')
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                f.write(text)
+            paths.append(path)
+        return paths
+
+    def _read(self, paths, **kwargs):
+        with mock.patch('builtins.print') as printed:
+            df = read_csv_files(paths, **kwargs)
+        return df, [call.args[0] for call in printed.call_args_list]
+
+    def test_files_with_different_headers(self):
+        paths = self._files('desc,x\nEgret,1\nHeron,2\n', 'x,desc\n3,Ibis\n', 'desc,x\nTern,4.5')
+        df, _ = self._read(paths)
+        self.assertEqual(df['file_index'].tolist(), [0, 0, 1, 2])
+        self.assertEqual(df['desc'].tolist(), ['Egret', 'Heron', 'Ibis', 'Tern'])
+        self.assertEqual(df['x'].tolist(), [1.0, 2.0, 3.0, 4.5])
+        self.assertEqual(df.index.tolist(), [0, 1, 0, 0])
+
+    def test_quoted_file_read_on_its_own(self):
+        paths = self._files('desc,x\nEgret,1\n', 'desc,x\n"Great\nEgret",2\n"Heron, grey",3\n')
+        df, _ = self._read(paths)
+        self.assertEqual(df['file_index'].tolist(), [0, 1, 1])
+        self.assertEqual(df['desc'].tolist(), ['Egret', 'Great\nEgret', 'Heron, grey'])
+        self.assertEqual(df.index.tolist(), [0, 0, 1])
+
+    def test_na_text_is_kept(self):
+        paths = self._files('desc,x,y\nNA,1,\nnull,2,3\n')
+        df, _ = self._read(paths)
+        self.assertEqual(df['desc'].tolist(), ['NA', 'null'])
+        self.assertTrue(df['y'].isna().tolist()[0])
+        self.assertEqual(df['y'].tolist()[1], 3.0)
+
+    def test_files_without_rows_are_reported(self):
+        paths = self._files('', 'desc,x\n\n', 'desc,x\nEgret,1\n')
+        df, printed = self._read(paths)
+        self.assertEqual(df['file_index'].tolist(), [2])
+        self.assertEqual(printed, [f'WARNING: {paths[0]} has no rows', f'WARNING: {paths[1]} has no rows'])
+
+    def test_columns(self):
+        paths = self._files('desc,x,y\nEgret,1,2\n')
+        df, _ = self._read(paths, columns=['y'])
+        self.assertEqual(list(df.columns), ['file_index', 'y'])
+        empty, _ = self._read([], columns=['y'])
+        self.assertEqual(list(empty.columns), ['file_index', 'y'])
+        self.assertEqual(len(empty), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
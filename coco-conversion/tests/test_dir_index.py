@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+from dir_index import DirectoryIndex
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+class DirectoryIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self._tmp.name, 'data')
+        self.manifest = os.path.join(self._tmp.name, 'manifest.json')
+        _write(os.path.join(self.root, 'a', 'one.txt'), '1')
+        _write(os.path.join(self.root, 'a', 'b', 'two.jpg'), '22')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_unchanged_tree_is_not_relisted(self):
+        first = DirectoryIndex(self.root, self.manifest)
+        self.assertEqual(first.n_listed, 3)
+        second = DirectoryIndex(self.root, self.manifest)
+        self.assertEqual(second.n_listed, 0)
+        self.assertEqual(second.relpaths(), ['a/b/two.jpg', 'a/one.txt'])
+
+    def test_added_file_is_found(self):
+        DirectoryIndex(self.root, self.manifest)
+        path = os.path.join(self.root, 'a', 'three.txt')
+        _write(path, '333')
+        # Make sure the directory's mtime moves on, whatever the file system's resolution
+        st = os.stat(os.path.dirname(path))
+        os.utime(os.path.dirname(path), ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        index = DirectoryIndex(self.root, self.manifest)
+        self.assertTrue(index.isfile(path))
+        self.assertEqual(index.n_listed, 1)
+
+    def test_edit_in_place_changes_signature(self):
+        path = os.path.join(self.root, 'a', 'one.txt')
+        DirectoryIndex(self.root, self.manifest)
+        dir_st = os.stat(os.path.dirname(path))
+
+        _write(path, 'edited')
+        new_st = os.stat(path)
+        os.utime(path, ns=(new_st.st_atime_ns, new_st.st_mtime_ns + 10 ** 9))
+        # An edit in place leaves the directory's mtime alone, so its listing is reused
+        os.utime(os.path.dirname(path), ns=(dir_st.st_atime_ns, dir_st.st_mtime_ns))
+
+        index = DirectoryIndex(self.root, self.manifest)
+        self.assertEqual(index.n_listed, 0)
+        self.assertEqual(index.signature(path), (len('edited'), new_st.st_mtime_ns + 10 ** 9))
+        self.assertEqual(index.signature('a/one.txt'), index.signature(path))
+
+    def test_signature_of_missing_file(self):
+        index = DirectoryIndex(self.root)
+        self.assertIsNone(index.signature(os.path.join(self.root, 'a', 'missing.txt')))
+        os.remove(os.path.join(self.root, 'a', 'one.txt'))
+        self.assertIsNone(index.signature('a/one.txt'))
+
+    def test_resolve_ignores_case(self):
+        index = DirectoryIndex(self.root)
+        self.assertEqual(index.resolve('A/B/TWO.JPG'), os.path.join(self.root, 'a', 'b', 'two.jpg'))
+        self.assertIsNone(index.resolve('a/b/three.jpg'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import id_blocks
+import merge_datasets
+
+
+def _convert(dataset, n_images, anns_per_image):
+    """A dataset as a converter would write it, numbered with first_ids() and checked by finish()."""
+    images = []
+    annotations = []
+    image_id, ann_id = id_blocks.first_ids(dataset)
+    for i in range(n_images):
+        image_id += 1
+        images.append({'id': image_id, 'file_name': f'{dataset}/{i}.jpg', 'width': 10, 'height': 10})
+        for _ in range(anns_per_image):
+            ann_id += 1
+            annotations.append({'id': ann_id, 'image_id': image_id, 'category_id': 1, 'bbox': [0, 0, 1, 1]})
+    return id_blocks.finish(dataset, {'images': images, 'annotations': annotations})
+
+
+class IdBlocksTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.output_dir = tmp.name
+        for name, value in [('OUTPUT_DIR', self.output_dir),
+                            ('OUTPUT_FILE', os.path.join(self.output_dir, 'drone-wildlife-datasets.json'))]:
+            patcher = mock.patch.object(merge_datasets, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _write(self, dataset, coco):
+        with open(os.path.join(self.output_dir, f'{dataset}.json'), 'w') as f:
+            json.dump(coco, f)
+
+    def _merge(self):
+        with mock.patch('builtins.print'):
+            return merge_datasets.merge()
+
+    def _assert_unique(self, coco, n_images, n_annotations):
+        image_ids = [im['id'] for im in coco['images']]
+        ann_ids = [ann['id'] for ann in coco['annotations']]
+        self.assertEqual(len(image_ids), n_images)
+        self.assertEqual(len(set(image_ids)), n_images)
+        self.assertEqual(len(set(ann_ids)), n_annotations)
+        file_names = {im['id']: im['file_name'] for im in coco['images']}
+        for ann in coco['annotations']:
+            # Annotations still point at an image of their own dataset
+            self.assertIn(ann['image_id'], file_names)
+
+    def test_blocks_do_not_overlap(self):
+        for key in ('image_ids', 'annotation_ids'):
+            ranges = sorted(block[key] for block in id_blocks.BLOCKS.values())
+            for (_, last), (first, _) in zip(ranges, ranges[1:]):
+                self.assertLess(last, first)
+            self.assertLess(ranges[-1][1], 2 ** 31)
+
+    def test_merge_with_global_ids_keeps_them(self):
+        with mock.patch.object(id_blocks, 'GLOBAL_IDS', True):
+            written = {dataset: _convert(dataset, 3, 2) for dataset in ('kabra-birds', 'mmla-opc', 'gray-turtles')}
+        for dataset, coco in written.items():
+            self._write(dataset, coco)
+        merged = self._merge()
+        self._assert_unique(merged, 9, 18)
+        self.assertEqual(sorted(im['id'] for im in merged['images']),
+                         sorted(im['id'] for coco in written.values() for im in coco['images']))
+
+    def test_merge_renumbers_when_a_dataset_lacks_global_ids(self):
+        with mock.patch.object(id_blocks, 'GLOBAL_IDS', True):
+            self._write('kabra-birds', _convert('kabra-birds', 3, 2))
+        self._write('mmla-opc', _convert('mmla-opc', 4, 1))
+        merged = self._merge()
+        self._assert_unique(merged, 7, 10)
+        self.assertEqual(sorted(im['id'] for im in merged['images']), list(range(1, 8)))
+
+    def test_concatenated_chunks_stay_in_block(self):
+        with mock.patch.object(id_blocks, 'GLOBAL_IDS', True):
+            chunks = []
+            for i in range(3):
+                path = os.path.join(self.output_dir, f'chunk-{i}.json')
+                with open(path, 'w') as f:
+                    json.dump(_convert('mmla-mpala', 2, 3), f)
+                chunks.append(path)
+            with mock.patch('builtins.print'):
+                combined = merge_datasets.concatenate('mmla-mpala', chunks, os.path.join(self.output_dir, 'out.json'))
+        self._assert_unique(combined, 6, 18)
+        self.assertTrue(id_blocks.has_global_ids('mmla-mpala', combined))
+
+
+if __name__ == '__main__':
+    unittest.main()
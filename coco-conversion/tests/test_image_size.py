@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+import image_size
+from image_size import get_image_info, get_image_size
+
+
+class GetImageInfoTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def _save(self, name, im, **params):
+        path = os.path.join(self.dir, name)
+        im.save(path, **params)
+        return path
+
+    def _assert_from_header(self, path, mode=None):
+        # Parsed from the header alone: PIL isn't asked
+        with mock.patch.object(image_size.Image, 'open', side_effect=AssertionError('fell back to PIL')):
+            info = get_image_info(path)
+        with Image.open(path) as im:
+            self.assertEqual((info['width'], info['height']), im.size)
+            self.assertEqual(info['format'], im.format)
+            if mode is not None:
+                self.assertEqual(info['mode'], im.mode)
+        self.assertEqual(get_image_size(path), (info['width'], info['height']))
+        return info
+
+    def test_baseline_jpeg(self):
+        self._assert_from_header(self._save('a.jpg', Image.new('RGB', (641, 479))), mode='RGB')
+
+    def test_progressive_jpeg(self):
+        path = self._save('a.jpg', Image.new('RGB', (300, 200)), progressive=True)
+        self._assert_from_header(path, mode='RGB')
+
+    def test_grayscale_jpeg(self):
+        self._assert_from_header(self._save('a.jpg', Image.new('L', (33, 65))), mode='L')
+
+    def test_jpeg_with_exif(self):
+        exif = Image.Exif()
+        # Orientation 6 (rotated 90 degrees), which, like PIL, isn't applied
+        exif[0x0112] = 6
+        exif[0x010F] = 'camera' * 100
+        path = self._save('a.jpg', Image.new('RGB', (400, 100)), exif=exif.tobytes())
+        info = self._assert_from_header(path, mode='RGB')
+        self.assertEqual((info['width'], info['height']), (400, 100))
+
+    def test_png(self):
+        self._assert_from_header(self._save('a.png', Image.new('RGBA', (17, 9))), mode='RGBA')
+
+    def test_16_bit_png(self):
+        info = self._assert_from_header(self._save('a.png', Image.new('I;16', (20, 30))))
+        # PIL's mode for a 16-bit PNG isn't worked out from the header
+        self.assertIsNone(info['mode'])
+
+    def test_little_endian_tiff(self):
+        path = self._save('a.tif', Image.new('RGB', (123, 45)))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(2), b'II')
+        self._assert_from_header(path)
+
+    def test_big_endian_tiff(self):
+        path = self._save('a.tif', Image.new('I;16B', (70, 80)))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(2), b'MM')
+        self._assert_from_header(path)
+
+    def test_other_formats_fall_back_to_pil(self):
+        for name in ['a.bmp', 'a.webp']:
+            path = self._save(name, Image.new('RGB', (50, 60)))
+            with mock.patch.object(image_size.Image, 'open', wraps=Image.open) as pil_open:
+                info = get_image_info(path)
+            pil_open.assert_called_once_with(path)
+            with Image.open(path) as im:
+                self.assertEqual(info, {'width': 50, 'height': 60, 'format': im.format, 'mode': im.mode})
+
+    def test_truncated_header_falls_back_to_pil(self):
+        path = self._save('a.jpg', Image.new('RGB', (10, 10)))
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            # SOI and the start of a segment whose length runs past the end of the file
+            f.write(data[:4])
+        with mock.patch.object(image_size.Image, 'open', wraps=Image.open) as pil_open:
+            with self.assertRaises(OSError):
+                get_image_info(path)
+        pil_open.assert_called_once_with(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
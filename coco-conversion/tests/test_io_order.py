@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import io_order
+from io_order import physical_order
+
+
+class PhysicalOrderTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.paths = []
+        for i, size in enumerate([3000, 0, 10, 70000, 1, 500]):
+            path = os.path.join(tmp.name, f'{i}.jpg')
+            with open(path, 'wb') as f:
+                f.write(os.urandom(size))
+            self.paths.append(path)
+        # Files that can't be stat'ed, in the middle of the batch
+        self.paths[2:2] = [os.path.join(tmp.name, 'missing.jpg'), os.path.join(tmp.name, 'gone.jpg')]
+        self.missing = [2, 3]
+
+    def _order(self, mode, paths=None, **kwargs):
+        paths = self.paths if paths is None else paths
+        with mock.patch.object(io_order, 'IO_ORDER', mode):
+            order = physical_order(paths, **kwargs)
+        self.assertEqual(sorted(order), list(range(len(paths))))
+        return order
+
+    def test_none_keeps_listed_order(self):
+        self.assertEqual(self._order('none'), list(range(len(self.paths))))
+
+    def test_inode_order(self):
+        order = self._order('inode')
+        self.assertEqual(order[-2:], self.missing)
+        inodes = [os.stat(self.paths[i]).st_ino for i in order[:-2]]
+        self.assertEqual(inodes, sorted(inodes))
+
+    def test_extent_order(self):
+        order = self._order('extent')
+        self.assertEqual(order[-2:], self.missing)
+
+    def test_extent_falls_back_to_inodes_without_fiemap(self):
+        with mock.patch.object(io_order.sys, 'platform', 'linux'), \
+                mock.patch.object(io_order, '_extent_start', return_value=None) as extent_start:
+            order = self._order('extent')
+        self.assertEqual(order, self._order('inode'))
+        # One unmappable file is enough to give up on the batch
+        extent_start.assert_called_once()
+
+    def test_extent_order_by_physical_offset(self):
+        offsets = {path: (7 - i) * 4096 for i, path in enumerate(self.paths)}
+        with mock.patch.object(io_order.sys, 'platform', 'linux'), \
+                mock.patch.object(io_order, '_extent_start', side_effect=offsets.__getitem__):
+            order = self._order('extent')
+        self.assertEqual(order, [7, 6, 5, 4, 1, 0] + self.missing)
+
+    def test_given_stats(self):
+        stats = [os.stat(path) if os.path.exists(path) else None for path in self.paths]
+        with mock.patch.object(io_order.os, 'stat', side_effect=AssertionError('stat again')):
+            order = self._order('inode', stats=stats)
+        self.assertEqual(order[-2:], self.missing)
+
+    def test_small_batches(self):
+        for mode in io_order.IO_ORDERS:
+            self.assertEqual(self._order(mode, paths=[]), [])
+            self.assertEqual(self._order(mode, paths=self.paths[:1]), [0])
+
+    def test_unknown_mode(self):
+        with mock.patch.object(io_order, 'IO_ORDER', 'random'):
+            with self.assertRaises(ValueError):
+                physical_order(self.paths)
+
+
+if __name__ == '__main__':
+    unittest.main()
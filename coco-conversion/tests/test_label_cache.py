@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+import image_metadata
+from image_metadata import ImageMetadataStore
+from label_cache import read_labels
+
+
+class ReadLabelsTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.db_file = os.path.join(self.dir, 'cache', 'label_cache.sqlite')
+        store = ImageMetadataStore(os.path.join(self.dir, 'cache', 'image_metadata.sqlite'))
+        self.addCleanup(store.close)
+        patcher = mock.patch.object(image_metadata, '_store', store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.labelled = []
+        for name, text in [('a', '0 0.5 0.5 0.1 0.1\n'), ('b', '')]:
+            label_file = os.path.join(self.dir, f'{name}.txt')
+            image_file = os.path.join(self.dir, f'{name}.png')
+            with open(label_file, 'w') as f:
+                f.write(text)
+            Image.new('RGB', (640, 480)).save(image_file)
+            self.labelled.append((label_file, image_file))
+
+    def _read(self, **kwargs):
+        with mock.patch('builtins.print'):
+            return read_labels('test', self.labelled, db_file=self.db_file, **kwargs)
+
+    def test_cached_labels_match_fresh_ones(self):
+        fresh = self._read()
+        cached = self._read()
+        for a, b in zip(fresh[:4], cached[:4]):
+            self.assertEqual(a.tolist(), b.tolist())
+        self.assertEqual(fresh[4], [(640, 480), (640, 480)])
+        self.assertEqual(cached[4], fresh[4])
+
+    def test_edit_in_place_is_read_again(self):
+        self._read()
+        label_file = self.labelled[0][0]
+        dir_st = os.stat(self.dir)
+        st = os.stat(label_file)
+        with open(label_file, 'w') as f:
+            f.write('0 0.5 0.5 0.1 0.1\n1 0.25 0.25 0.2 0.2\n')
+        os.utime(label_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        os.utime(self.dir, ns=(dir_st.st_atime_ns, dir_st.st_mtime_ns))
+
+        class_ids, boxes, offsets, n_lines, _ = self._read()
+        self.assertEqual(class_ids.tolist(), [0, 1])
+        self.assertEqual(offsets.tolist(), [0, 2, 2])
+        self.assertEqual(boxes[1].tolist(), [0.25, 0.25, 0.2, 0.2])
+
+    def test_replaced_image_is_probed_again(self):
+        self._read()
+        image_file = self.labelled[0][1]
+        st = os.stat(image_file)
+        Image.new('RGB', (320, 240)).save(image_file)
+        os.utime(image_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self._read()[4][0], (320, 240))
+
+    def test_empty_files_not_probed_unless_asked(self):
+        sizes = self._read(probe_empty=False)[4]
+        self.assertEqual(sizes, [(640, 480), None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import unittest
+from unittest import mock
+
+import source_dimensions
+from source_dimensions import check_source_dimensions, n_images_to_probe
+
+
+class CheckSourceDimensionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.probed = []
+        for patcher in [mock.patch.object(source_dimensions, 'DATA_ROOT', 'data'),
+                        mock.patch.object(source_dimensions, 'DIMENSION_POLICY', {}),
+                        mock.patch.object(source_dimensions, 'DIMENSION_SAMPLE_SIZE', 50),
+                        mock.patch.object(source_dimensions, 'MAX_DIMENSION_MISMATCH_RATE', 0.02),
+                        mock.patch.object(source_dimensions, 'get_image_sizes', side_effect=self._get_image_sizes),
+                        mock.patch('builtins.print')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _get_image_sizes(self, paths, desc=None):
+        # Images named wrong_* are 1 pixel wider on disk than in the source
+        self.probed.extend(paths)
+        return [(641, 480) if os.path.basename(path).startswith('wrong_') else (640, 480) for path in paths]
+
+    def _images(self, n, n_wrong=0):
+        return [{'file_name': f'birds/{"wrong" if i < n_wrong else "right"}_{i}.jpg', 'width': 640, 'height': 480}
+                for i in range(n)]
+
+    def _set_policy(self, policy):
+        source_dimensions.DIMENSION_POLICY['birds'] = policy
+
+    def test_trust_probes_nothing(self):
+        self._set_policy('trust')
+        images = self._images(10, n_wrong=10)
+        check_source_dimensions('birds', images)
+        self.assertEqual(self.probed, [])
+        self.assertEqual(images, self._images(10, n_wrong=10))
+        self.assertEqual(n_images_to_probe('birds', 10), 0)
+
+    def test_probe_corrects_every_image_without_failing(self):
+        self._set_policy('probe')
+        images = self._images(200, n_wrong=100)
+        check_source_dimensions('birds', images)
+        self.assertEqual(self.probed, [os.path.join('data', im['file_name']) for im in images])
+        self.assertEqual([im['width'] for im in images], [641] * 100 + [640] * 100)
+        self.assertEqual(n_images_to_probe('birds', 200), 200)
+
+    def test_verify_probes_a_fixed_sample(self):
+        self._set_policy('verify')
+        check_source_dimensions('birds', self._images(500))
+        first_sample = self.probed
+        self.assertEqual(len(first_sample), 50)
+        self.assertEqual(len(set(first_sample)), 50)
+        self.assertEqual(n_images_to_probe('birds', 500), 50)
+        self.assertEqual(n_images_to_probe('birds', 20), 20)
+
+        self.probed = []
+        check_source_dimensions('birds', self._images(500))
+        self.assertEqual(self.probed, first_sample)
+
+    def test_verify_at_mismatch_limit_corrects(self):
+        self._set_policy('verify')
+        # The whole set is the sample: 1 of 50 is 2%, at the limit
+        images = self._images(50, n_wrong=1)
+        check_source_dimensions('birds', images)
+        self.assertEqual(images[0]['width'], 641)
+
+    def test_verify_above_mismatch_limit_fails(self):
+        self._set_policy('verify')
+        with self.assertRaisesRegex(ValueError, 'birds: 4% of sampled source dimensions are wrong'):
+            check_source_dimensions('birds', self._images(50, n_wrong=2))
+
+        with mock.patch.object(source_dimensions, 'MAX_DIMENSION_MISMATCH_RATE', 0.05):
+            check_source_dimensions('birds', self._images(50, n_wrong=2))
+
+    def test_unknown_policy(self):
+        self._set_policy('guess')
+        with self.assertRaises(ValueError):
+            check_source_dimensions('birds', self._images(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
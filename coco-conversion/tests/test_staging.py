@@ -0,0 +1,122 @@
+import itertools
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import staging
+from staging import StagingCache
+
+
+class StagingCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.data_root = os.path.join(tmp.name, 'data')
+        self.staging_dir = os.path.join(tmp.name, 'staging')
+        self.outside_dir = tmp.name
+
+        for patcher in [mock.patch.object(staging, 'DATA_ROOT', self.data_root),
+                        # Strictly increasing use times, however fast the tests run
+                        mock.patch.object(staging.time, 'time', side_effect=itertools.count().__next__)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _cache(self, budget_bytes):
+        cache = StagingCache(self.staging_dir, budget_bytes)
+        self.addCleanup(cache.close)
+        return cache
+
+    def _source(self, name, size, fill=b'x'):
+        path = os.path.join(self.data_root, 'birds', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(fill * size)
+        return path
+
+    def _staged_bytes(self):
+        total = 0
+        for dirpath, _, filenames in os.walk(self.staging_dir):
+            total += sum(os.path.getsize(os.path.join(dirpath, name))
+                         for name in filenames if not name.startswith('staging.sqlite'))
+        return total
+
+    def test_copies_once(self):
+        cache = self._cache(1000)
+        path = self._source('a.json', 10)
+        local_path = cache.stage(path)
+        self.assertEqual(local_path, os.path.join(self.staging_dir, 'birds', 'a.json'))
+        self.assertEqual(os.stat(local_path).st_mtime_ns, os.stat(path).st_mtime_ns)
+        with mock.patch.object(staging.shutil, 'copyfile', side_effect=AssertionError('copied again')):
+            self.assertEqual(cache.stage(path), local_path)
+
+    def test_changed_source_is_restaged(self):
+        cache = self._cache(1000)
+        path = self._source('a.json', 10, b'x')
+        local_path = cache.stage(path)
+
+        # Same size, newer mtime
+        st = os.stat(path)
+        self._source('a.json', 10, b'y')
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertEqual(cache.stage(path), local_path)
+        with open(local_path, 'rb') as f:
+            self.assertEqual(f.read(), b'y' * 10)
+
+        # Different size
+        self._source('a.json', 20, b'z')
+        cache.stage(path)
+        with open(local_path, 'rb') as f:
+            self.assertEqual(f.read(), b'z' * 20)
+        self.assertEqual(self._staged_bytes(), 20)
+
+    def test_least_recently_used_evicted_within_budget(self):
+        cache = self._cache(100)
+        a, b, c, d = [self._source(f'{name}.json', 40) for name in 'abcd']
+        cache.stage(a)
+        cache.stage(b)
+        # a is now used more recently than b
+        cache.stage(a)
+        cache.stage(c)
+        self.assertLessEqual(self._staged_bytes(), 100)
+        self.assertTrue(os.path.exists(cache.local_path(a)))
+        self.assertFalse(os.path.exists(cache.local_path(b)))
+        self.assertTrue(os.path.exists(cache.local_path(c)))
+
+        cache.stage(d)
+        self.assertLessEqual(self._staged_bytes(), 100)
+        self.assertFalse(os.path.exists(cache.local_path(a)))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.staging_dir, 'birds'))), ['c.json', 'd.json'])
+
+    def test_restaging_larger_copy_stays_within_budget(self):
+        cache = self._cache(100)
+        a, b = self._source('a.json', 40), self._source('b.json', 40)
+        cache.stage(a)
+        cache.stage(b)
+        # a grows; its old copy doesn't count against the room it needs
+        self._source('a.json', 60)
+        cache.stage(a)
+        self.assertLessEqual(self._staged_bytes(), 100)
+        self.assertTrue(os.path.exists(cache.local_path(a)))
+
+    def test_budget_shared_across_instances(self):
+        first = self._cache(100)
+        first.stage(self._source('a.json', 60))
+        second = self._cache(100)
+        second.stage(self._source('b.json', 60))
+        self.assertEqual(self._staged_bytes(), 60)
+
+    def test_not_staged(self):
+        cache = self._cache(100)
+        large = self._source('large.json', 101)
+        self.assertEqual(cache.stage(large), large)
+        outside = os.path.join(self.outside_dir, 'outside.json')
+        with open(outside, 'w') as f:
+            f.write('{}')
+        self.assertEqual(cache.stage(outside), outside)
+        self.assertEqual(self._staged_bytes(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import work_queue
+from work_queue import WorkQueue
+
+
+def _run_job(job):
+    # Record every run of the job, so the test can tell if one ran twice
+    with open(os.path.join(job['log_dir'], job['job_id']), 'a') as f:
+        f.write(f'{os.getpid()}\n')
+    time.sleep(0.01)
+    return {'job_id': job['job_id']}
+
+
+def _work(queue_dir):
+    with mock.patch('builtins.print'):
+        WorkQueue(queue_dir).work(_run_job, poll_seconds=0.05)
+
+
+class WorkQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.queue_dir = os.path.join(tmp.name, 'queue')
+        self.log_dir = os.path.join(tmp.name, 'log')
+        os.makedirs(self.log_dir)
+        self.queue = WorkQueue(self.queue_dir)
+
+    def _submit(self, n, prefix='job'):
+        job_ids = [f'{prefix}-{i}' for i in range(n)]
+        self.queue.submit([{'job_id': job_id, 'log_dir': self.log_dir} for job_id in job_ids])
+        return job_ids
+
+    def _claims_dir(self):
+        return os.path.join(self.queue_dir, 'runs', self.queue.run_id, 'claims')
+
+    def _assert_ran_once(self, job_ids):
+        done, failed = self.queue.wait(poll_seconds=0.05)
+        self.assertEqual(sorted(done), sorted(job_ids))
+        self.assertEqual(failed, {})
+        for job_id in job_ids:
+            with open(os.path.join(self.log_dir, job_id)) as f:
+                self.assertEqual(len(f.read().split()), 1, job_id)
+
+    def test_contending_workers_run_each_job_once(self):
+        job_ids = self._submit(30)
+        workers = [multiprocessing.Process(target=_work, args=(self.queue_dir,)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(60)
+            self.assertEqual(worker.exitcode, 0)
+
+        self._assert_ran_once(job_ids)
+        self.assertEqual(os.listdir(self._claims_dir()), [])
+
+    def test_worker_started_before_submit(self):
+        worker = multiprocessing.Process(target=_work, args=(self.queue_dir,))
+        worker.start()
+        time.sleep(0.2)
+        job_ids = self._submit(5)
+        worker.join(60)
+        self.assertEqual(worker.exitcode, 0)
+        self._assert_ran_once(job_ids)
+
+    def test_worker_started_on_stale_queue_waits_for_next_run(self):
+        old_job_ids = self._submit(3, 'old')
+        with mock.patch('builtins.print'):
+            self.queue.work(_run_job, poll_seconds=0.05)
+        old_run = self.queue.run_id
+
+        worker = multiprocessing.Process(target=_work, args=(self.queue_dir,))
+        worker.start()
+        time.sleep(0.3)
+        # It must not have returned on seeing the finished run
+        self.assertTrue(worker.is_alive())
+
+        new_job_ids = self._submit(3, 'new')
+        worker.join(60)
+        self.assertEqual(worker.exitcode, 0)
+        self._assert_ran_once(new_job_ids)
+        for job_id in old_job_ids:
+            with open(os.path.join(self.log_dir, job_id)) as f:
+                self.assertEqual(len(f.read().split()), 1, job_id)
+
+        # The replaced run is kept until the next submission
+        self.assertEqual(sorted(os.listdir(os.path.join(self.queue_dir, 'runs'))),
+                         sorted([old_run, self.queue.run_id]))
+        self._submit(1, 'newer')
+        self.assertNotIn(old_run, os.listdir(os.path.join(self.queue_dir, 'runs')))
+
+    def test_claim_is_exclusive(self):
+        job_id, = self._submit(1)
+        self.assertTrue(self.queue.try_claim(job_id))
+        self.assertFalse(WorkQueue(self.queue_dir).try_claim(job_id))
+
+    def test_stale_claim_is_broken(self):
+        job_id, = self._submit(1)
+        self.assertTrue(self.queue.try_claim(job_id))
+        claim_path = os.path.join(self._claims_dir(), f'{job_id}.json')
+        old = time.time() - work_queue.LEASE_SECONDS - 60
+        os.utime(claim_path, (old, old))
+        with mock.patch('builtins.print'):
+            self.assertTrue(WorkQueue(self.queue_dir).try_claim(job_id))
+
+    def test_finished_job_is_not_claimed(self):
+        job_id, = self._submit(1)
+        with mock.patch('builtins.print'):
+            self.queue.work(_run_job, poll_seconds=0.05)
+        self.assertFalse(WorkQueue(self.queue_dir).try_claim(job_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
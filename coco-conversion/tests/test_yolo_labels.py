@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from yolo_labels import read_yolo_labels
+
+
+def _scalar_read(path):
+    """Labels of one file as the converters read them line by line before read_yolo_labels."""
+    with open(path, 'r') as f:
+        lines = [line.strip() for line in f.readlines() if line.strip()]
+    labels = []
+    for line in lines:
+        tokens = line.split()
+        if len(tokens) != 5:
+            continue
+        labels.append((int(tokens[0]), [float(token) for token in tokens[1:]]))
+    return labels, len(lines)
+
+
+class ReadYoloLabelsTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def _write(self, texts):
+        paths = []
+        for i, text in enumerate(texts):
+            path = os.path.join(self.dir, f'{i}.txt')
+            with open(path, 'w', newline='') as f:
+                f.write(text)
+            paths.append(path)
+        return paths
+
+    def _assert_matches_scalar(self, texts):
+        paths = self._write(texts)
+        class_ids, boxes, offsets, n_lines = read_yolo_labels(paths)
+        self.assertEqual(offsets[-1], len(class_ids))
+        self.assertEqual(boxes.shape, (len(class_ids), 4))
+        for i, path in enumerate(paths):
+            labels, n = _scalar_read(path)
+            self.assertEqual(n_lines[i], n, texts[i])
+            self.assertEqual(class_ids[offsets[i]:offsets[i + 1]].tolist(), [c for c, _ in labels], texts[i])
+            self.assertEqual(boxes[offsets[i]:offsets[i + 1]].tolist(), [b for _, b in labels], texts[i])
+
+    def test_matches_scalar_parser(self):
+        self._assert_matches_scalar([
+            '0 0.5 0.5 0.1 0.1\n1 0.25 0.75 0.2 0.3\n',
+            # Blank and whitespace-only lines
+            '\n0 0.1 0.2 0.3 0.4\n\n   \n\t\n2 0.5 0.6 0.7 0.8\n\n',
+            # 4- and 6-field lines are counted but skipped
+            '0 0.1 0.2 0.3\n1 0.1 0.2 0.3 0.4\n2 0.1 0.2 0.3 0.4 0.9\n',
+            # Empty file, and one with only blank lines
+            '',
+            '\n\n',
+            # No newline at the end, CRLF line endings, tabs and extra spaces
+            '3 0.1 0.2 0.3 0.4',
+            '4 0.1 0.2 0.3 0.4\r\n  5\t0.5  0.6 0.7\t0.8  \r\n',
+            # Values float() reads exactly, which a fast float parser may not
+            '0 0.1234567890123456789 1e-3 .5 0.30000000000000004\n',
+        ])
+
+    def test_only_malformed_lines(self):
+        self._assert_matches_scalar(['0 0.1 0.2\n', '1 2 3 4 5 6 7 8\n'])
+
+    def test_only_empty_files(self):
+        class_ids, boxes, offsets, n_lines = read_yolo_labels(self._write(['', '']))
+        self.assertEqual(len(class_ids), 0)
+        self.assertEqual(boxes.shape, (0, 4))
+        self.assertEqual(offsets.tolist(), [0, 0, 0])
+        self.assertEqual(n_lines.tolist(), [0, 0])
+
+    def test_no_files(self):
+        class_ids, boxes, offsets, n_lines = read_yolo_labels([])
+        self.assertEqual(offsets.tolist(), [0])
+        self.assertEqual(n_lines.dtype, np.int64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Optional Chrome trace-event export for the conversion pipeline.
+
+Converters and the merge mark their phases with span(), e.g.
+
+    with tracing.span('probe'):
+        im = Image.open(path)
+
+Categories used: 'scan' (directory listing), 'parse' (reading annotations), 'probe'
+(image dimensions), 'serialize' (writing JSON) and 'merge'.  When tracing is disabled
+(the default), span() returns a shared no-op context manager, so instrumented loops cost
+next to nothing.
+
+The output is Chrome trace-event JSON, which can be loaded in chrome://tracing or
+https://ui.perfetto.dev.  Each converter shows up as its own process track, so I/O stalls
+and CPU work can be compared per dataset.
+
+Usage:
+    python run_all.py --trace                                  # writes output/run_trace.json
+    python tracing.py convert_koger_drones koger-trace.json    # trace a single converter
+"""
+
+import contextlib
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+_events = None
+_null_span = contextlib.nullcontext()
+
+
+def enable(process_name=None):
+    """Start collecting events in this process (discarding any collected so far)."""
+    global _events
+    _events = []
+    if process_name:
+        _events.append({
+            'name': 'process_name',
+            'ph': 'M',
+            'pid': os.getpid(),
+            'args': {'name': process_name},
+        })
+
+
+def disable():
+    """Stop collecting events and return the ones collected."""
+    global _events
+    events, _events = _events or [], None
+    return events
+
+
+def is_enabled():
+    return _events is not None
+
+
+def _now_us():
+    # perf_counter is system-wide on Linux and Windows, so timestamps from the worker
+    # processes line up on one timeline
+    return time.perf_counter_ns() / 1000
+
+
+@contextlib.contextmanager
+def _span(name, cat, args):
+    start = _now_us()
+    try:
+        yield
+    finally:
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': start,
+            'dur': _now_us() - start,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = args
+        # Events collected after disable() (e.g. from a thread that outlived it) are dropped
+        if _events is not None:
+            _events.append(event)
+
+
+def span(cat, name=None, **args):
+    """
+    Context manager recording a complete ('X') event.
+
+    Args:
+        cat: category, one of 'scan', 'parse', 'probe', 'serialize', 'merge', 'convert'
+        name: event name shown in the viewer (default: cat)
+        args: extra key/value pairs shown when the event is selected
+    """
+    if _events is None:
+        return _null_span
+    return _span(name or cat, cat, args)
+
+
+def write(path, events):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    print(f'Wrote {len(events)} trace events to {path}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: python tracing.py <converter module> <output trace file>')
+        sys.exit(1)
+    module_name, trace_file = sys.argv[1], sys.argv[2]
+
+    # Converters import this file as 'tracing', which is a different module object from __main__
+    import tracing
+    tracing.enable(module_name)
+    with tracing.span('convert', module_name):
+        importlib.import_module(module_name).convert()
+    tracing.write(trace_file, tracing.disable())
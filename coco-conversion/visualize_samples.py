@@ -12,6 +12,9 @@ from collections import defaultdict
 from PIL import Image, ImageDraw
 
 from conversion_config import DATA_ROOT, OUTPUT_DIR
+from image_metadata import ImageMetadataStore
+from io_order import physical_order
+from staging import staged
 
 MERGED_FILE = os.path.join(OUTPUT_DIR, 'drone-wildlife-datasets.json')
 SAMPLE_DIR = os.path.join(OUTPUT_DIR, 'sample_images')
@@ -55,17 +58,33 @@ def main():
 
     os.makedirs(SAMPLE_DIR, exist_ok=True)
 
-    html_entries = []
-    current_dataset = None
+    # Render in physical order (see io_order.py), keeping each sample's output name by
+    # its position so the page lists them in the original order
+    image_paths = [os.path.join(DATA_ROOT, img['file_name']) for _, img in selected]
+    out_names = [None] * len(selected)
+    store = ImageMetadataStore()
 
-    for dataset, img in selected:
+    for i in physical_order(image_paths):
+        dataset, img = selected[i]
         file_name = img['file_name']
-        image_path = os.path.join(DATA_ROOT, file_name)
+        image_path = image_paths[i]
         if not os.path.isfile(image_path):
             print(f'  MISSING: {image_path}')
             continue
 
-        im = Image.open(image_path).convert('RGB')
+        # From the local staging cache if enabled, so a rerun doesn't read it from DATA_ROOT again
+        im = Image.open(staged(image_path))
+
+        # Annotations drawn on an image whose size has changed since conversion would be
+        # misplaced.  The size is taken from the store if it's there, otherwise from the
+        # image just opened, rather than reading its header separately.
+        info = store.lookup(image_path)
+        width, height = (info['width'], info['height']) if info is not None else im.size
+        if (width, height) != (img['width'], img['height']):
+            print(f'  WARNING: {file_name} is {width}x{height}, '
+                  f'but {img["width"]}x{img["height"]} in the COCO file')
+
+        im = im.convert('RGB')
         draw = ImageDraw.Draw(im)
 
         # Scale line widths so they're at least 5px after resizing to 1000px
@@ -89,6 +108,15 @@ def main():
         out_path = os.path.join(SAMPLE_DIR, out_name)
         im.save(out_path)
         print(f'  {out_name}')
+        out_names[i] = out_name
+
+    store.close()
+
+    html_entries = []
+    current_dataset = None
+    for (dataset, img), out_name in zip(selected, out_names):
+        if out_name is None:
+            continue
 
         if dataset != current_dataset:
             html_entries.append(f'<h2>{dataset}</h2>')
@@ -96,7 +124,7 @@ def main():
 
         html_entries.append(
             f'<div>'
-            f'<p><code>{file_name}</code></p>'
+            f'<p><code>{img["file_name"]}</code></p>'
             f'<img src="{out_name}" style="width:1000px;">'
             f'</div>'
         )
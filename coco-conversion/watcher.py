@@ -0,0 +1,57 @@
+"""
+Cheap change detection on the source trees, for run_all.py --watch.
+
+For each dataset, a manifest records the mtime of every directory under
+DATA_ROOT/<dataset> and the size and mtime of every non-image file (annotations,
+classes.txt, ...), taken from the dataset's directory index (see dir_index.py), so
+unchanged directories aren't listed again.  Polling stats just those entries rather than
+walking the whole tree: adding, removing or renaming an image changes its directory's
+mtime, and edited annotation files change their own.  (Editing an image in place, keeping
+its name, isn't noticed.)  When a directory's mtime changes, the dataset is rescanned.
+
+Manifests are only kept in memory.  Changes made while nothing is watching are picked up
+by the build cache, as watching starts with a run of every dataset.
+"""
+
+import os
+
+from build_cache import IMAGE_EXTENSIONS
+from conversion_config import DATA_ROOT
+from dir_index import dataset_index
+
+
+def scan(dataset_name):
+    """
+    A dataset's manifest, from its directory index.  A dataset without a source folder
+    gets an empty manifest, and a warning.
+    """
+    if not os.path.isdir(os.path.join(DATA_ROOT, dataset_name)):
+        print(f'WARNING: no source folder for {dataset_name}, skipping it until one appears')
+        return {'dirs': {}, 'files': {}}
+    index = dataset_index(dataset_name)
+    files = [rel for rel in index.relpaths() if not rel.lower().endswith(IMAGE_EXTENSIONS)]
+    return {'dirs': index.dir_mtimes(), 'files': dict(zip(files, index.signatures(files)))}
+
+
+def is_missing(manifest):
+    """Whether a manifest is of a dataset without a source folder."""
+    # Any other has at least its root directory
+    return not manifest['dirs']
+
+
+def has_changed(dataset_name, manifest):
+    """Whether anything in a dataset's source tree has changed since its manifest was taken."""
+    root = os.path.join(DATA_ROOT, dataset_name)
+    if is_missing(manifest):
+        return os.path.isdir(root)
+    try:
+        for rel_dir, mtime_ns in manifest['dirs'].items():
+            if os.stat(os.path.join(root, rel_dir)).st_mtime_ns != mtime_ns:
+                return True
+        for rel, signature in manifest['files'].items():
+            st = os.stat(os.path.join(root, rel))
+            if (st.st_size, st.st_mtime_ns) != signature:
+                return True
+    except FileNotFoundError:
+        return True
+    return False
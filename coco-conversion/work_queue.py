@@ -0,0 +1,253 @@
+"""
+File-based work queue for running converters on several machines.
+
+All state lives in a directory on storage that every node mounts (by default
+CACHE_DIR/queue, next to the outputs), so no external services are needed:
+
+    queue/
+        current.json                {'run_id': ...} of the run to work on; workers wait for it
+        runs/<run_id>/
+            jobs/<job_id>.json      job descriptions, written by the coordinator
+            manifest.json           list of job ids
+            claims/<job_id>.json    created with O_CREAT | O_EXCL by the worker running the job
+            done/<job_id>.json      result summary
+            failed/<job_id>.json    traceback
+            outputs/                per-job output files (e.g. chunks of a large dataset)
+
+Each submission is a new run, written in full in its own directory and then swapped in by
+replacing current.json (an atomic rename), so a worker never sees a half-written run or
+one being cleared.  Runs before the one replaced are deleted; the replaced one is kept, as
+a worker may still be finishing one of its jobs.  Run ids sort in submission order.
+
+A worker works on the current run until all its jobs are done or failed.  If the current
+run was already finished when the worker started, it is left over from an earlier
+submission, and the worker waits for the next one, as it does when there is no run yet.
+
+A worker holding a claim touches the claim file every HEARTBEAT_SECONDS.  A claim that
+hasn't been touched for LEASE_SECONDS (by the file server's clock, so host clock skew
+doesn't matter) is assumed to belong to a dead worker and can be broken by another one.
+
+Two processes on one machine can stand in for two nodes.
+"""
+
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+from conversion_config import CACHE_DIR
+
+DEFAULT_QUEUE_DIR = os.path.join(CACHE_DIR, 'queue')
+
+LEASE_SECONDS = 300
+HEARTBEAT_SECONDS = 60
+POLL_SECONDS = 5
+
+
+def _write_json(path, data):
+    # Write to a unique temporary name and rename, so readers never see a partial file
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class WorkQueue:
+
+    def __init__(self, queue_dir=DEFAULT_QUEUE_DIR):
+        self.queue_dir = queue_dir
+        self.worker_id = f'{socket.gethostname()}-{os.getpid()}'
+        # The run this queue submitted or is working on
+        self.run_id = None
+
+    def _run_dir(self, run_id=None):
+        if run_id is None:
+            if self.run_id is None:
+                # A worker that hasn't picked a run yet uses the current one
+                self.run_id = self._current_run()
+            run_id = self.run_id
+        return os.path.join(self.queue_dir, 'runs', run_id)
+
+    def _path(self, kind, job_id=None):
+        if job_id is None:
+            return os.path.join(self._run_dir(), kind)
+        return os.path.join(self._run_dir(), kind, f'{job_id}.json')
+
+    def output_path(self, job_id):
+        """Output file for a job of the run being submitted (see new_run())."""
+        return os.path.join(self._run_dir(), 'outputs', f'{job_id}.json')
+
+    def _current_run(self):
+        """The id of the run workers should work on, or None if nothing has been submitted."""
+        try:
+            return _read_json(os.path.join(self.queue_dir, 'current.json'))['run_id']
+        except FileNotFoundError:
+            return None
+
+    # Coordinator side
+
+    def new_run(self):
+        """Start a new run, not yet visible to workers, for output_path() and submit()."""
+        self.run_id = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}'
+        for kind in ('jobs', 'claims', 'done', 'failed', 'outputs'):
+            os.makedirs(self._path(kind))
+        return self.run_id
+
+    def submit(self, jobs):
+        """
+        Make a new set of jobs the queue's current run, in the run started with new_run()
+        (or a new one).
+
+        Args:
+            jobs: list of JSON-serializable dicts, each with a unique 'job_id'
+        """
+        if self.run_id is None or os.path.isfile(os.path.join(self._run_dir(), 'manifest.json')):
+            self.new_run()
+        for job in jobs:
+            _write_json(self._path('jobs', job['job_id']), job)
+        _write_json(os.path.join(self._run_dir(), 'manifest.json'), [job['job_id'] for job in jobs])
+
+        previous = self._current_run()
+        _write_json(os.path.join(self.queue_dir, 'current.json'), {'run_id': self.run_id})
+        for run_id in os.listdir(os.path.join(self.queue_dir, 'runs')):
+            if run_id not in (self.run_id, previous):
+                shutil.rmtree(self._run_dir(run_id), ignore_errors=True)
+
+    def wait(self, poll_seconds=POLL_SECONDS):
+        """Block until every job of the submitted run is done or failed; returns ({job_id: result}, {job_id: error})."""
+        job_ids = self._manifest()
+        while True:
+            done = {j: self._path('done', j) for j in job_ids if os.path.isfile(self._path('done', j))}
+            failed = {j: self._path('failed', j) for j in job_ids if os.path.isfile(self._path('failed', j))}
+            if len(done) + len(failed) == len(job_ids):
+                return ({j: _read_json(p) for j, p in done.items()},
+                        {j: _read_json(p)['error'] for j, p in failed.items()})
+            time.sleep(poll_seconds)
+
+    # Worker side
+
+    def _manifest(self):
+        return _read_json(os.path.join(self._run_dir(), 'manifest.json'))
+
+    def _finished(self, job_id):
+        return os.path.isfile(self._path('done', job_id)) or os.path.isfile(self._path('failed', job_id))
+    def _fs_now(self):
+        # The file server's idea of the current time, for comparing against claim mtimes
+        clock_path = os.path.join(self.queue_dir, f'clock-{self.worker_id}')
+        with open(clock_path, 'w'):
+            pass
+        now = os.stat(clock_path).st_mtime
+        os.remove(clock_path)
+        return now
+
+    def _break_if_stale(self, job_id):
+        claim_path = self._path('claims', job_id)
+        try:
+            age = self._fs_now() - os.stat(claim_path).st_mtime
+        except FileNotFoundError:
+            return
+        if age < LEASE_SECONDS:
+            return
+        # Renaming is atomic, so only one worker gets to break a given claim
+        stale_path = f'{claim_path}.stale-{uuid.uuid4().hex}'
+        try:
+            os.rename(claim_path, stale_path)
+        except FileNotFoundError:
+            return
+        print(f'Breaking stale claim on {job_id} ({age:.0f}s since last heartbeat)')
+        os.remove(stale_path)
+
+    def try_claim(self, job_id):
+        self._break_if_stale(job_id)
+        try:
+            fd = os.open(self._path('claims', job_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'worker': self.worker_id, 'claimed': time.time()}, f)
+        # Another worker may have finished the job between our listing and our claim
+        if self._finished(job_id):
+            os.remove(self._path('claims', job_id))
+            return False
+        return True
+
+    def _heartbeat(self, job_id, stop):
+        while not stop.wait(HEARTBEAT_SECONDS):
+            try:
+                os.utime(self._path('claims', job_id))
+            except OSError:
+                pass
+
+    def work(self, run_job, wait_for_jobs=True, poll_seconds=POLL_SECONDS):
+        """
+        Claim and run jobs until every job in the current run is done or failed.  A run
+        that was already finished when this started (and that this queue didn't submit
+        itself) is from an earlier submission, so the next one is waited for instead.  If a
+        new run replaces the current one meanwhile, the worker moves on to it.
+
+        Args:
+            run_job: function taking a job dict and returning a JSON-serializable result
+            wait_for_jobs: if no jobs have been submitted yet, wait for the coordinator
+        """
+        stale = None
+        current = self._current_run()
+        if current is not None and current != self.run_id:
+            self.run_id = current
+            if all(self._finished(j) for j in self._manifest()):
+                stale = current
+        job_ids = None
+
+        while True:
+            current = self._current_run()
+            if current is None or current == stale:
+                if not wait_for_jobs:
+                    return
+                time.sleep(poll_seconds)
+                continue
+            if job_ids is None or current != self.run_id:
+                self.run_id = current
+                job_ids = self._manifest()
+                print(f'Worker {self.worker_id}: {len(job_ids)} jobs in run {current} of {self.queue_dir}')
+
+            pending = [j for j in job_ids if not self._finished(j)]
+            if not pending:
+                return
+            ran_any = False
+            for job_id in pending:
+                if not self.try_claim(job_id):
+                    continue
+                ran_any = True
+                self._run_claimed(job_id, run_job)
+            if not ran_any:
+                # Everything left is claimed by other workers; check back in case one dies
+                time.sleep(poll_seconds)
+
+    def _run_claimed(self, job_id, run_job):
+        job = _read_json(self._path('jobs', job_id))
+        print(f'Worker {self.worker_id}: running {job_id}')
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, stop), daemon=True)
+        heartbeat.start()
+        try:
+            result = run_job(job)
+            result['worker'] = self.worker_id
+            _write_json(self._path('done', job_id), result)
+        except Exception:
+            print(f'Worker {self.worker_id}: {job_id} FAILED')
+            _write_json(self._path('failed', job_id), {'worker': self.worker_id, 'error': traceback.format_exc()})
+        finally:
+            stop.set()
+            heartbeat.join()
+            try:
+                os.remove(self._path('claims', job_id))
+            except FileNotFoundError:
+                pass